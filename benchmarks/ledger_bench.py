@@ -0,0 +1,94 @@
+"""Compare ledger throughput of the synchronous and write-behind paths.
+
+Runs the same burst of concurrent transfers against a scratch database
+(created next to PGDATABASE and dropped afterwards) once per ledger mode,
+then prints transfers per second and the number of ledger rows written.
+
+    python benchmarks/ledger_bench.py --transfers 20000 --concurrency 10
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+from storage import GLOBAL_ECONOMY
+
+def connect_args(database):
+    return dict(
+        user=os.environ['PGUSER'],
+        password=os.environ['PGPASSWORD'],
+        host=os.environ['PGHOST'],
+        port=os.environ['PGPORT'],
+        database=database,
+    )
+
+async def run_mode(ledger_config, args):
+    db = Database({'ledger': ledger_config})
+    await db.initialize()
+    async with db.pool.acquire() as conn:
+        await conn.execute('TRUNCATE accounts, transactions, trades, active_games CASCADE')
+        await conn.execute(
+            'INSERT INTO accounts (user_id, balance) SELECT g, 1000000 FROM generate_series(1, $1) g',
+            args.accounts
+        )
+
+    queue = asyncio.Queue()
+    for _ in range(args.transfers):
+        queue.put_nowait(random.sample(range(1, args.accounts + 1), 2))
+
+    async def worker():
+        while not queue.empty():
+            from_id, to_id = queue.get_nowait()
+            await db.transfer(GLOBAL_ECONOMY, from_id, to_id, 1, 'bench')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    await db.ledger.flush()
+    drained = time.perf_counter() - start
+
+    async with db.pool.acquire() as conn:
+        rows = await conn.fetchval('SELECT COUNT(*) FROM transactions')
+    await db.close()
+    return elapsed, drained, rows
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transfers', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--accounts', type=int, default=1000)
+    args = parser.parse_args()
+
+    base_db = os.environ['PGDATABASE']
+    bench_db = f"{base_db}_ledger_bench"
+    admin = await asyncpg.connect(**connect_args(base_db))
+    await admin.execute(f'DROP DATABASE IF EXISTS "{bench_db}"')
+    await admin.execute(f'CREATE DATABASE "{bench_db}"')
+    os.environ['PGDATABASE'] = bench_db
+
+    try:
+        with tempfile.TemporaryDirectory() as journal_dir:
+            modes = [
+                ('sync', {'mode': 'sync'}),
+                ('write_behind/memory', {'mode': 'write_behind', 'durability': 'memory'}),
+                ('write_behind/journal', {'mode': 'write_behind', 'durability': 'journal',
+                                          'journal_dir': journal_dir}),
+            ]
+            print(f"{args.transfers} transfers, concurrency {args.concurrency}")
+            for name, ledger_config in modes:
+                elapsed, drained, rows = await run_mode(ledger_config, args)
+                print(f"{name:22} {args.transfers / elapsed:9.0f} transfers/s "
+                      f"({elapsed:.2f}s, ledger drained at {drained:.2f}s, {rows} rows)")
+    finally:
+        os.environ['PGDATABASE'] = base_db
+        await admin.execute(f'DROP DATABASE IF EXISTS "{bench_db}"')
+        await admin.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,349 @@
+"""End-to-end load test that drives the real cog callbacks.
+
+Simulated users run a weighted mix of /trade, /accept, /coinflip, /cfjoin,
+/rob and /stats through fake Interactions, against either a scratch Postgres
+database (created next to PGDATABASE and dropped afterwards) or the
+in-memory backend. Prints a JSON report with overall throughput and, per
+command, p50/p99 latency, storage calls and (Postgres only) SQL round trips.
+
+    python benchmarks/load_bench.py --backend memory --concurrency 500
+    python benchmarks/load_bench.py --backend postgres --commands 20000 --output bench.json
+
+Storage calls count every StorageBackend method a command awaits; round
+trips count the SQL statements those calls actually sent, including
+transaction control, so the difference shows cache hits and batching.
+/accept and /cfjoin consume trades and games opened earlier in the run and
+fall back to /trade and /coinflip while none are pending. Cooldowns are
+disabled so /rob can repeat. With --guilds N > 1 the bot runs in guild mode,
+every user gets an account in each of N guilds, and each command runs in a
+random one of them.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import contextlib
+import contextvars
+import subprocess
+from collections import Counter, defaultdict
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from storage import create_database, GLOBAL_ECONOMY
+from utils.currency import CurrencyConverter
+from utils.names import NameResolver
+from utils.leaderboard import Leaderboard
+from utils.analytics_cache import AnalyticsCache
+from utils.metrics import Histogram
+from cogs.economy import Economy
+from cogs.gambling import Gambling
+from cogs.analytics import Analytics
+
+DEFAULT_MIX = 'trade=20,accept=15,coinflip=15,cfjoin=15,rob=20,stats=15'
+FALLBACKS = {'accept': 'trade', 'cfjoin': 'coinflip'}
+
+# Command being run by the current task, used to attribute storage calls and SQL
+_current_command = contextvars.ContextVar('bench_command', default=None)
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f'user{user_id}'
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self.messages.append(content)
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+class FakeFollowup:
+    def __init__(self, response):
+        self.response = response
+
+    async def send(self, content=None, **kwargs):
+        self.response.messages.append(content)
+
+class FakeInteraction:
+    """Just enough of discord.Interaction for the cog callbacks"""
+
+    def __init__(self, client, user, guild_id: int):
+        self.client = client
+        self.user = user
+        self.guild_id = guild_id
+        self.response = FakeResponse()
+        self.followup = FakeFollowup(self.response)
+
+    @property
+    def content(self) -> str:
+        return '\n'.join(message or '' for message in self.response.messages)
+
+class NoCooldowns:
+    def remaining(self, user_id, command):
+        return 0.0
+
+    def reserve(self, user_id, command, seconds):
+        return 0.0
+
+    def release(self, user_id, command, expires_at):
+        pass
+
+    def trigger(self, user_id, command, seconds):
+        pass
+
+class CountingBackend:
+    """Proxy that counts storage calls per command before forwarding them"""
+
+    def __init__(self, db, counts):
+        self._db = db
+        self._counts = counts
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if name.startswith('_') or not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def counted(*args, **kwargs):
+            command = _current_command.get()
+            if command is not None:
+                self._counts[command] += 1
+            return await attr(*args, **kwargs)
+        return counted
+
+def count_round_trips(db, counts):
+    """Log every SQL statement sent on the Postgres pool against the running command"""
+    def log_query(record):
+        command = _current_command.get()
+        if command is not None:
+            counts[command] += 1
+
+    acquire = db._acquire
+
+    @contextlib.asynccontextmanager
+    async def counted_acquire(method=None):
+        async with acquire(method) as conn:
+            conn.add_query_logger(log_query)  # idempotent per connection
+            yield conn
+
+    db._acquire = counted_acquire
+
+class BenchBot:
+    """Stand-in for DiddyBot with the attributes the cogs use"""
+
+    def __init__(self, config, db, users):
+        self.config = config
+        self.db = db
+        self.converter = CurrencyConverter(config)
+        self.names = NameResolver(self, config)
+        self.leaderboard = Leaderboard(db)
+        self.analytics_cache = AnalyticsCache(config)
+        self.cooldowns = NoCooldowns()
+        self.users = users
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    async def fetch_user(self, user_id):
+        return self.users[user_id]
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(','):
+        command, weight = part.split('=')
+        mix[command.strip()] = float(weight)
+    unknown = set(mix) - {'trade', 'accept', 'coinflip', 'cfjoin', 'rob', 'stats'}
+    if unknown:
+        raise SystemExit(f"Unknown commands in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(config, args):
+    storage_calls, round_trips = Counter(), Counter()
+    db = create_database(config)
+    await db.initialize()
+    if args.backend == 'postgres':
+        count_round_trips(db, round_trips)
+
+    users = {user_id: FakeUser(user_id) for user_id in range(1, args.users + 1)}
+    guild_ids = list(range(1, args.guilds + 1))
+    for guild_id in guild_ids if args.guilds > 1 else [GLOBAL_ECONOMY]:
+        for user_id in users:
+            await db.create_account(guild_id, user_id, args.balance)
+
+    bot = BenchBot(config, CountingBackend(db, storage_calls), users)
+    await bot.leaderboard.resync()
+    economy, gambling, analytics = Economy(bot), Gambling(bot), Analytics(bot)
+    min_bet, max_bet = config['gambling']['min_bet'], config['gambling']['max_bet']
+    pending_trades = []  # (trade_id, receiver, guild_id)
+    open_games = []  # (game_id, guild_id)
+
+    def other_user(user_id):
+        other = random.randint(1, args.users - 1)
+        return other + 1 if other >= user_id else other
+
+    async def run_command(command, user):
+        """Run one command's callback; returns the command that actually ran"""
+        if command in FALLBACKS and not (pending_trades if command == 'accept' else open_games):
+            command = FALLBACKS[command]
+        interaction = FakeInteraction(bot, user, random.choice(guild_ids))
+        token = _current_command.set(command)
+        start = time.perf_counter()
+        try:
+            if command == 'trade':
+                receiver = users[other_user(user.id)]
+                await economy.trade.callback(economy, interaction, receiver, random.randint(1, 100))
+                match = re.search(r'/accept (\d+)', interaction.content)
+                if match:
+                    pending_trades.append((int(match.group(1)), receiver, interaction.guild_id))
+            elif command == 'accept':
+                trade_id, receiver, guild_id = pending_trades.pop(random.randrange(len(pending_trades)))
+                interaction.user, interaction.guild_id = receiver, guild_id
+                await economy.accept.callback(economy, interaction, trade_id)
+            elif command == 'coinflip':
+                await gambling.coinflip.callback(gambling, interaction, random.randint(min_bet, max_bet))
+                match = re.search(r'/cfjoin (\d+)', interaction.content)
+                if match:
+                    open_games.append((int(match.group(1)), interaction.guild_id))
+            elif command == 'cfjoin':
+                game_id, interaction.guild_id = open_games.pop(random.randrange(len(open_games)))
+                await gambling.cfjoin.callback(gambling, interaction, game_id)
+            elif command == 'rob':
+                await economy.rob.callback(economy, interaction, users[other_user(user.id)])
+            elif command == 'stats':
+                await analytics.stats.callback(analytics, interaction)
+        finally:
+            _current_command.reset(token)
+        return command, time.perf_counter() - start
+
+    commands, weights = zip(*parse_mix(args.mix).items())
+    latencies = defaultdict(Histogram)
+    errors = Counter()
+    remaining = args.commands
+
+    async def simulated_user():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            user = users[random.randint(1, args.users)]
+            command = random.choices(commands, weights)[0]
+            try:
+                ran, elapsed = await run_command(command, user)
+            except Exception as e:
+                errors[f'{command}: {type(e).__name__}'] += 1
+            else:
+                latencies[ran].observe(elapsed)
+            # The memory backend never suspends, so without this one user would
+            # run every command before the others started
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(simulated_user() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    supply = await db.reconcile_currency_supply()
+    await db.close()
+
+    total = sum(hist.count for hist in latencies.values())
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'backend': args.backend,
+        'ledger_mode': config['ledger'].get('mode', 'sync'),
+        'concurrency': args.concurrency,
+        'users': args.users,
+        'guilds': args.guilds,
+        'mix': dict(zip(commands, weights)),
+        'commands': total,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(total / elapsed, 1),
+        'errors': dict(errors),
+        'supply_drift': supply['drift'],
+        'per_command': {
+            command: {
+                'count': hist.count,
+                'throughput_per_s': round(hist.count / elapsed, 1),
+                'p50_ms': round(hist.percentile(50) * 1000, 3),
+                'p99_ms': round(hist.percentile(99) * 1000, 3),
+                'mean_ms': round(hist.mean * 1000, 3),
+                'storage_calls': round(storage_calls[command] / hist.count, 2),
+                'round_trips': round(round_trips[command] / hist.count, 2) if args.backend == 'postgres' else None,
+            }
+            for command, hist in sorted(latencies.items())
+        },
+    }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['memory', 'postgres'], default='memory')
+    parser.add_argument('--commands', type=int, default=20000, help='total commands to run')
+    parser.add_argument('--concurrency', type=int, default=500, help='simulated users running at once')
+    parser.add_argument('--users', type=int, default=1000, help='accounts to create')
+    parser.add_argument('--guilds', type=int, default=1, help='guild economies; more than 1 enables guild mode')
+    parser.add_argument('--balance', type=int, default=1000000, help='starting balance in cents')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='comma separated command=weight pairs')
+    parser.add_argument('--ledger-mode', choices=['sync', 'write_behind'], default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error('--users must be at least 2')
+    random.seed(args.seed)
+
+    with open(os.path.join(ROOT, 'config.yaml'), 'r') as f:
+        config = yaml.safe_load(f)
+    config['database']['backend'] = args.backend
+    if args.guilds > 1:
+        config.setdefault('economy', {})['mode'] = 'guild'
+    if args.ledger_mode:
+        config['ledger']['mode'] = args.ledger_mode
+        config['ledger']['durability'] = 'memory'
+
+    if args.backend == 'postgres':
+        import asyncpg
+        base_db = os.environ['PGDATABASE']
+        bench_db = f"{base_db}_load_bench"
+        admin = await asyncpg.connect(
+            user=os.environ['PGUSER'], password=os.environ['PGPASSWORD'],
+            host=os.environ['PGHOST'], port=os.environ['PGPORT'], database=base_db,
+        )
+        await admin.execute(f'DROP DATABASE IF EXISTS "{bench_db}"')
+        await admin.execute(f'CREATE DATABASE "{bench_db}"')
+        os.environ['PGDATABASE'] = bench_db
+        try:
+            report = await run(config, args)
+        finally:
+            os.environ['PGDATABASE'] = base_db
+            await admin.execute(f'DROP DATABASE IF EXISTS "{bench_db}"')
+            await admin.close()
+    else:
+        report = await run(config, args)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,39 +2,164 @@ import os
 import discord
 from discord import app_commands
 from discord.ext import commands
+import math
 import yaml
 import asyncio
-from database import Database
+from storage import create_database
 from utils.currency import CurrencyConverter
+from utils.names import NameResolver
+from utils.leaderboard import Leaderboard
+from utils.analytics_cache import AnalyticsCache
+from utils.expiry import ExpiryScheduler
+from utils.archive import LedgerArchiver
+from utils.reconcile import LedgerReconciler
+from utils.cooldowns import CooldownStore
+from utils.coherence import InvalidationBus
+from utils.metrics import PrometheusExporter, metrics
+from utils.resilience import DatabaseUnavailableError
+from utils.startup import StartupTimer, command_tree_hash, shard_options
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('diddy_bot')
 
-# Load configuration
-with open('config.yaml', 'r') as f:
+# Load configuration; DIDDY_CONFIG lets processes on one host use different files
+with open(os.environ.get('DIDDY_CONFIG', 'config.yaml'), 'r') as f:
     config = yaml.safe_load(f)
 
-class DiddyBot(commands.Bot):
+EXTENSIONS = ('cogs.economy', 'cogs.gambling', 'cogs.analytics', 'cogs.admin')
+
+class DiddyBot(commands.AutoShardedBot):
     def __init__(self):
         intents = discord.Intents.default()
         intents.message_content = True
-        super().__init__(command_prefix=config['bot']['prefix'], intents=intents)
+        # Needed to list role members for /bulk; enable "Server Members Intent" in the Developer Portal
+        intents.members = config['bot'].get('members_intent', False)
+        # One process runs every shard unless sharding (or SHARD_COUNT/SHARD_IDS) gives it a range
+        super().__init__(command_prefix=config['bot']['prefix'], intents=intents, **shard_options(config))
         self.config = config
-        self.db = Database()
+        self.db = create_database(config)  # Postgres unless database.backend says otherwise
         self.converter = CurrencyConverter(config)  # Initialize the currency converter
+        self.names = NameResolver(self, config)  # Cached user id -> name lookups
+        self.leaderboard = Leaderboard(self.db)  # In-memory ranking fed by balance writes
+        self.analytics_cache = AnalyticsCache(config)  # Single-flight TTL cache for /stats, /volume and /richlist
+        self.expiry = ExpiryScheduler(self.db, config)  # Expires stale games and trades
+        self.archiver = LedgerArchiver(self.db, config)  # Rolls ledger partitions forward and archives old ones
+        self.reconciler = LedgerReconciler(self.db, config)  # Checks balances against the ledger
+        self.cooldowns = CooldownStore(self.db, config)  # Persistent per-command cooldowns
+        self.invalidation = InvalidationBus(self.db, self.leaderboard, self.cooldowns, config)  # Cache coherence across processes
+        # Settled games, here or in another process, make the guild's /stats and /volume stale
+        self.db.game_listeners.append(self.analytics_cache.on_game)
+        self.invalidation.game_listeners.append(self.analytics_cache.on_game)
+        self.metrics_exporter = PrometheusExporter(config)
+        self.db_ready = asyncio.Event()  # set once migrations ran and cooldowns are loaded
+        self._warmup_task = None
+        metrics.register_gauge('discord_shard_latency_seconds', lambda: {
+            (('shard', str(shard_id)),): latency
+            for shard_id, latency in self.latencies if math.isfinite(latency)
+        })
 
     async def setup_hook(self):
-        await self.db.initialize()
-        await self.load_extension('cogs.economy')
-        await self.load_extension('cogs.gambling')
-        await self.load_extension('cogs.analytics')
-        await self.load_extension('cogs.admin')  # Load the admin cog
+        self.tree.on_error = self.on_app_command_error
+        timer = StartupTimer()
+        # Loading the cogs only builds the command tree, so it overlaps the
+        # pool creation and migrations; tasks that need the database wait on db_ready
+        await asyncio.gather(
+            timer.timed('database', self._start_database(timer)),
+            timer.timed('extensions', self._load_extensions())
+        )
+        synced = await timer.timed('command_sync', self._sync_commands())
+        self.expiry.start()
+        self.archiver.start()
+        self.reconciler.start()
+        self.analytics_cache.start()
+        self.cooldowns.start()
+        await self.metrics_exporter.start()
+        if self.config.get('startup', {}).get('warm_caches', True):
+            self._warmup_task = asyncio.create_task(self._warm_caches(), name='cache-warmup')
+        logger.info(f"Startup took {timer.summary()}; commands {'synced' if synced else 'unchanged'}")
+
+    async def _start_database(self, timer: StartupTimer):
+        await timer.timed('db_initialize', self.db.initialize())
+        # Listen first: events published while the cooldowns (and leaderboard) load are not lost
+        await timer.timed('invalidation', self.invalidation.start())
+        await timer.timed('cooldowns', self.cooldowns.load())
+        self.db_ready.set()
+
+    async def _load_extensions(self):
+        for extension in EXTENSIONS:
+            await self.load_extension(extension)
+
+    @property
+    def owns_command_sync(self) -> bool:
+        """Only the process running shard 0 syncs commands, so N processes don't race the same upload"""
+        return self.shard_ids is None or 0 in self.shard_ids
+
+    async def _sync_commands(self) -> bool:
+        """Sync the global command tree only if it changed since the last sync; returns True if synced"""
+        if not self.owns_command_sync:
+            return False
+        digest = command_tree_hash(self.tree)
+        key = f'command_tree_hash:{self.application_id}'
+        force = self.config.get('startup', {}).get('force_sync', False)
+        if not force and await self.db.get_state(key) == digest:
+            return False
         await self.tree.sync()
+        await self.db.set_state(key, digest)
+        return True
+
+    async def _warm_caches(self):
+        """Fill the name and analytics caches before the first commands arrive.
+
+        The leaderboard needs no warmup here: the Economy cog loads it as soon
+        as db_ready is set.
+        """
+        timer = StartupTimer()
+        await timer.timed('analytics', self.get_cog('Analytics').warm(timer))
+        logger.info(f"Cache warmup took {timer.summary()}")
+
+    async def close(self):
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+        await self.metrics_exporter.stop()
+        await self.expiry.stop()
+        await self.archiver.stop()
+        await self.reconciler.stop()
+        await self.analytics_cache.stop()
+        await self.cooldowns.stop()
+        await self.invalidation.stop()
+        await super().close()
+        await self.db.close()
+
+    async def on_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        """Reply quickly while the database circuit is open instead of letting the interaction time out,
+        and explain why economy commands fail in DMs in guild mode. Commands with their own
+        error handler (such as the admin commands) have already replied and logged by now."""
+        if getattr(interaction.command, 'on_error', None) is not None:
+            return
+        if isinstance(getattr(error, 'original', error), DatabaseUnavailableError):
+            if not interaction.response.is_done():
+                await interaction.response.send_message(
+                    "The bank is temporarily unavailable, please try again in a few seconds.", ephemeral=True
+                )
+            return
+        if isinstance(getattr(error, 'original', error), app_commands.NoPrivateMessage):
+            # Guild mode: economies belong to servers, so economy commands don't work in DMs
+            if not interaction.response.is_done():
+                await interaction.response.send_message(
+                    "Use this command in a server: each server has its own economy.", ephemeral=True
+                )
+            return
+        command = interaction.command.name if interaction.command else None
+        logger.error(f"Ignoring exception in command {command!r}", exc_info=error)
+
+    async def on_shard_ready(self, shard_id: int):
+        logger.info(f'Shard {shard_id} of {self.shard_count} ready')
 
     async def on_ready(self):
-        logger.info(f'Logged in as {self.user.name}')
+        shards = 'all shards' if self.shard_ids is None else f"shards {', '.join(map(str, self.shard_ids))}"
+        logger.info(f'Logged in as {self.user.name} ({shards})')
         await self.change_presence(activity=discord.Game(name="Managing DiddyCoin"))
 
 async def main():
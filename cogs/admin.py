@@ -1,7 +1,11 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
+import re
+import time
 import logging
+from utils.metrics import metrics
+from utils.economies import economy_id, guild_mode
 
 logger = logging.getLogger('diddy_bot')
 
@@ -13,6 +17,9 @@ def is_admin():
 class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        admin_config = bot.config.get('admin', {})
+        self.bulk_chunk_size = admin_config.get('bulk_chunk_size', 1000)
+        self.progress_interval = admin_config.get('progress_interval', 2)  # seconds between progress edits
 
     @app_commands.command()
     @is_admin()
@@ -26,7 +33,8 @@ class Admin(commands.Cog):
             await interaction.response.send_message("Amount must be positive.")
             return
 
-        user_balance = await self.bot.db.get_balance(user.id)
+        guild_id = economy_id(self.bot.config, interaction)
+        user_balance = await self.bot.db.get_balance(guild_id, user.id)
         if user_balance is None:
             await interaction.response.send_message(f"{user.name} doesn't have an account!")
             return
@@ -36,33 +44,256 @@ class Admin(commands.Cog):
             return
 
         delta = amount if action == 'give' else -amount
-        await self.bot.db.update_balance(user.id, delta)
-        
+        if await self.bot.db.update_balance(guild_id, user.id, delta) is None:
+            await interaction.response.send_message(
+                f"{user.name}'s funds are held in open games or trades, try a smaller amount."
+            )
+            return
+
         action_text = "given to" if action == 'give' else "removed from"
         await interaction.response.send_message(
             f"{amount} {self.bot.config['currency']['cents_name']} {action_text} {user.name}"
         )
 
+    @app_commands.command()
+    @is_admin()
+    async def bulk(self, interaction: discord.Interaction, action: str, amount: int,
+                   role: discord.Role = None, users: str = None, everyone: bool = False, key: str = None):
+        """Admin command to give or remove cents for a role, a list of users, or every account"""
+        if action not in ['give', 'remove']:
+            await interaction.response.send_message("Invalid action. Use 'give' or 'remove'.")
+            return
+
+        if amount <= 0:
+            await interaction.response.send_message("Amount must be positive.")
+            return
+
+        if sum(target is not None and target is not False for target in (role, users, everyone)) != 1:
+            await interaction.response.send_message("Pick exactly one target: a role, a list of users, or everyone.")
+            return
+
+        if role is not None and not self.bot.intents.members:
+            await interaction.response.send_message(
+                "Role targets need the Server Members intent, which is off. Enable it for the bot in the "
+                "Discord Developer Portal and set `bot.members_intent: true` in config.yaml, or target "
+                "`users` or `everyone` instead.",
+                ephemeral=True
+            )
+            return
+
+        guild_id = economy_id(self.bot.config, interaction)
+        await interaction.response.defer()
+        if role is not None:
+            if not interaction.guild.chunked:
+                await interaction.guild.chunk()
+            user_ids = [member.id for member in role.members if not member.bot]
+            target = f"role {role.name}"
+        elif users is not None:
+            user_ids = [int(user_id) for user_id in re.findall(r'\d{15,20}', users)]
+            target = f"{len(user_ids)} listed users"
+        else:
+            user_ids = [row['user_id'] for row in await self.bot.db.get_all_balances(guild_id)]
+            target = "all accounts"
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            await interaction.followup.send(f"No users found for {target}.")
+            return
+
+        # Each run gets its own key, so repeating a grant on purpose applies it
+        # again; rerunning with an earlier key only reaches accounts it missed
+        resuming = key is not None
+        if key is None:
+            key = f"{interaction.id:x}"
+
+        delta = amount if action == 'give' else -amount
+        cents_name = self.bot.config['currency']['cents_name']
+        action_text = "given to" if action == 'give' else "removed from"
+        progress = await interaction.followup.send(f"Processing {target}: 0/{len(user_ids)}...", wait=True)
+        changed = 0
+        last_edit = time.monotonic()
+        for start in range(0, len(user_ids), self.bulk_chunk_size):
+            chunk = user_ids[start:start + self.bulk_chunk_size]
+            try:
+                changed += len(await self.bot.db.bulk_update_balance(guild_id, key, chunk, delta, f'bulk_{action}'))
+            except Exception as e:
+                logger.error(f"Bulk {action} {key} failed at {start}/{len(user_ids)}: {e}")
+                await progress.edit(content=(
+                    f"Failed after {start}/{len(user_ids)} users ({changed} updated). "
+                    f"Run the command again with `key:{key}` to resume without double-applying."
+                ))
+                return
+            done = start + len(chunk)
+            if done < len(user_ids) and time.monotonic() - last_edit >= self.progress_interval:
+                await progress.edit(content=f"Processing {target}: {done}/{len(user_ids)}...")
+                last_edit = time.monotonic()
+
+        skipped = len(user_ids) - changed
+        msg = f"{amount} {cents_name} {action_text} {changed} accounts ({target}, key `{key}`)."
+        if skipped:
+            reasons = "no account, already covered by this key" if resuming else "no account"
+            reasons += " or not enough unreserved funds" if action == 'remove' else ""
+            msg += f"\n{skipped} users skipped ({reasons})."
+        await progress.edit(content=msg)
+
     @app_commands.command()
     @is_admin()
     async def clear(self, interaction: discord.Interaction, user: discord.User):
         """Admin command to clear a user's balance"""
-        user_balance = await self.bot.db.get_balance(user.id)
+        guild_id = economy_id(self.bot.config, interaction)
+        user_balance = await self.bot.db.get_balance(guild_id, user.id)
         if user_balance is None:
             await interaction.response.send_message(f"{user.name} doesn't have an account!")
             return
 
-        await self.bot.db.update_balance(user.id, -user_balance)
+        if await self.bot.db.update_balance(guild_id, user.id, -user_balance) is None:
+            await interaction.response.send_message(
+                f"Can't clear {user.name}'s balance while funds are held in open games or trades."
+            )
+            return
+
         await interaction.response.send_message(f"Cleared {user.name}'s balance.")
 
+    @app_commands.command()
+    @is_admin()
+    async def cache(self, interaction: discord.Interaction, action: str, user: discord.User = None):
+        """Admin command to show cache stats or flush cached balances and analytics"""
+        if action not in ['stats', 'flush']:
+            await interaction.response.send_message("Invalid action. Use 'stats' or 'flush'.")
+            return
+
+        if action == 'flush':
+            if user is not None:
+                self.bot.db.invalidate_balance(economy_id(self.bot.config, interaction), user.id)
+            else:
+                self.bot.db.invalidate_balance()
+                self.bot.analytics_cache.invalidate()
+            target = user.name if user else "all users and cached analytics"
+            await interaction.response.send_message(f"Flushed cached balances for {target}.")
+            return
+
+        stats = self.bot.db.balance_cache.stats()
+        analytics = self.bot.analytics_cache.stats()
+        await interaction.response.send_message(
+            f"Balance cache: {stats['size']}/{stats['maxsize']} entries | "
+            f"{stats['hits']} hits | {stats['misses']} misses | "
+            f"{stats['hit_rate']:.1%} hit rate\n"
+            f"Analytics cache: {analytics['size']} results | {analytics['inflight']} loading | "
+            f"{analytics['hits']} hits | {analytics['misses']} misses | "
+            f"{analytics['hit_rate']:.1%} hit rate"
+        )
+
+    @app_commands.command()
+    @is_admin()
+    async def supply(self, interaction: discord.Interaction, fix: bool = False):
+        """Admin command to reconcile the supply counters against all balances"""
+        await interaction.response.defer()
+        result = await self.bot.db.reconcile_currency_supply(fix)
+        cents_name = self.bot.config['currency']['cents_name']
+
+        msg = (
+            f"Supply counter: {result['counter']} {cents_name}\n"
+            f"Sum of balances: {result['actual']} {cents_name}\n"
+        )
+        if not result['drifted_economies']:
+            msg += "No drift detected."
+        elif fix:
+            msg += f"Drift of {result['drift']:+} {cents_name} corrected in {result['drifted_economies']} economies."
+        else:
+            msg += (
+                f"Drift: {result['drift']:+} {cents_name} across {result['drifted_economies']} economies. "
+                f"Run `/supply fix:True` to correct it."
+            )
+        await interaction.followup.send(msg)
+
+    @app_commands.command()
+    @is_admin()
+    async def reconcile(self, interaction: discord.Interaction, run: bool = False):
+        """Admin command to report accounts whose balance disagrees with the ledger"""
+        await interaction.response.defer()
+        reconciler = self.bot.reconciler
+        if run or reconciler.last_result is None:
+            result = await reconciler.run_once()
+            confirmed = result['confirmed']
+        else:
+            result = reconciler.last_result
+            confirmed = await self.bot.db.get_ledger_mismatches(reconciler.confirm_after)
+        cents_name = self.bot.config['currency']['cents_name']
+
+        age = int(time.time() - reconciler.last_run_at)
+        msg = (
+            f"Last check {age // 60}m {age % 60}s ago: {result['accounts']} accounts, "
+            f"{result['scanned']} new ledger rows, {result['mismatched']} mismatched\n"
+        )
+        if not confirmed:
+            msg += "Every balance matches the ledger."
+            if result['mismatched']:
+                msg += f" Mismatches younger than {reconciler.confirm_after}s are not reported yet."
+            await interaction.followup.send(msg)
+            return
+
+        names = await self.bot.names.resolve_many(row['user_id'] for row in confirmed)
+        msg += f"**{confirmed[0]['total']} accounts disagree with the ledger:**\n"
+        for row in confirmed:
+            economy = f" in guild {row['guild_id']}" if guild_mode(self.bot.config) else ""
+            msg += (
+                f"{names[row['user_id']]} ({row['user_id']}){economy}: balance {row['drift']:+} {cents_name} "
+                f"vs ledger since {row['drift_since']:%Y-%m-%d %H:%M}\n"
+            )
+        await interaction.followup.send(msg)
+
+    @app_commands.command()
+    @is_admin()
+    async def perf(self, interaction: discord.Interaction):
+        """Admin command to show database latency percentiles and pool usage"""
+        calls = {
+            dict(labels)['method']: hist
+            for (name, labels), hist in metrics.histograms.items()
+            if name == 'db_call_seconds'
+        }
+        uptime = int(time.time() - metrics.started_at)
+        msg = f"⏱️ **Database performance** (last {uptime // 3600}h {uptime % 3600 // 60}m)\n"
+
+        for label, pool in (('Pool', self.bot.db.pool), ('Replica pool', self.bot.db.replica_pool)):
+            if pool is not None:
+                in_use = pool.get_size() - pool.get_idle_size()
+                msg += f"{label}: {in_use} in use / {pool.get_size()} open / {pool.get_max_size()} max\n"
+
+        if not calls:
+            await interaction.response.send_message(msg + "No queries recorded yet.")
+            return
+
+        msg += "```\nmethod                    calls   p50ms   p95ms   p99ms  wait99  retry\n"
+        for method, hist in sorted(calls.items(), key=lambda item: -item[1].count)[:15]:
+            wait = metrics.histogram('db_pool_wait_seconds', method=method)
+            msg += (
+                f"{method[:24]:<24} {hist.count:>6} "
+                f"{hist.percentile(50) * 1000:>7.1f} {hist.percentile(95) * 1000:>7.1f} "
+                f"{hist.percentile(99) * 1000:>7.1f} {wait.percentile(99) * 1000:>7.1f} "
+                f"{metrics.counter('db_retries_total', method=method):>6}\n"
+            )
+        msg += "```"
+        await interaction.response.send_message(msg)
+
     @cent.error
+    @bulk.error
     @clear.error
+    @cache.error
+    @supply.error
+    @reconcile.error
+    @perf.error
     async def admin_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
-        if isinstance(error, app_commands.CheckFailure):
+        if isinstance(getattr(error, 'original', error), app_commands.NoPrivateMessage):
+            await interaction.response.send_message(
+                "Use this command in a server: each server has its own economy.", ephemeral=True
+            )
+        elif isinstance(error, app_commands.CheckFailure):
             await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
         else:
             logger.error(f"Admin command error: {error}")
-            await interaction.response.send_message("An error occurred while executing the command.", ephemeral=True)
+            if interaction.response.is_done():
+                await interaction.followup.send("An error occurred while executing the command.", ephemeral=True)
+            else:
+                await interaction.response.send_message("An error occurred while executing the command.", ephemeral=True)
 
 async def setup(bot):
     await bot.add_cog(Admin(bot))
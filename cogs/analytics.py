@@ -1,8 +1,14 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
+import csv
+import gzip
+import asyncio
 import logging
+import tempfile
 from datetime import datetime, timedelta
+from storage import GLOBAL_ECONOMY
+from utils.economies import economy_id, guild_mode
 
 logger = logging.getLogger('diddy_bot')
 
@@ -21,16 +27,123 @@ def create_bar_chart(values, labels, title, width=20):
     
     return f"```{chart}```"
 
+def format_history(rows, cents_name, page):
+    msg = f"📜 **Your Transactions** (page {page})\n```"
+    for trans in rows:
+        amount = trans['amount']
+        symbol = '+' if amount > 0 else '-'
+        msg += f"{trans['timestamp'].strftime('%Y-%m-%d %H:%M')} | "
+        msg += f"{symbol}{abs(amount)} {cents_name} | "
+        msg += f"{trans['type']}\n"
+    msg += "```"
+    return msg
+
+class HistoryView(discord.ui.View):
+    """Newer/Older buttons that page through a user's ledger by (timestamp, id) cursor"""
+
+    def __init__(self, bot, guild_id: int, user_id: int, rows, page_size: int, has_older: bool):
+        super().__init__(timeout=300)
+        self.bot = bot
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.rows = rows  # current page, newest first
+        self.page_size = page_size
+        self.page = 1
+        self.message = None
+        self._update_buttons(has_newer=False, has_older=has_older)
+
+    def _update_buttons(self, has_newer: bool, has_older: bool):
+        self.newer.disabled = not has_newer
+        self.older.disabled = not has_older
+
+    def render(self) -> str:
+        return format_history(self.rows, self.bot.config['currency']['cents_name'], self.page)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("This isn't your history!", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    @discord.ui.button(label='◀ Newer', style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        first = self.rows[0]
+        # One extra row tells us whether an even newer page exists
+        rows = await self.bot.db.get_user_transaction_history(
+            self.guild_id, self.user_id, self.page_size + 1, after=(first['timestamp'], first['id'])
+        )
+        if rows:
+            self.rows = rows[-self.page_size:]
+            self.page -= 1
+        self._update_buttons(has_newer=len(rows) > self.page_size, has_older=True)
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label='Older ▶', style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        last = self.rows[-1]
+        rows = await self.bot.db.get_user_transaction_history(
+            self.guild_id, self.user_id, self.page_size + 1, before=(last['timestamp'], last['id'])
+        )
+        if rows:
+            self.rows = rows[:self.page_size]
+            self.page += 1
+        self._update_buttons(has_newer=True, has_older=len(rows) > self.page_size)
+        await interaction.response.edit_message(content=self.render(), view=self)
+
 class Analytics(commands.Cog):
+    history = app_commands.Group(name='history', description='Browse or export your transaction history')
+
     def __init__(self, bot):
         self.bot = bot
+        history_config = bot.config.get('history', {})
+        self.page_size = history_config.get('page_size', 10)
+        self.export_batch_size = history_config.get('export_batch_size', 1000)
+
+    async def _load_stats(self, guild_id: int):
+        # Independent aggregates, each on its own pooled connection
+        return await asyncio.gather(
+            self.bot.db.get_total_currency_supply(guild_id),
+            self.bot.db.get_trading_stats(guild_id),
+            self.bot.db.get_gambling_stats(guild_id)
+        )
+
+    async def _load_richlist(self, guild_id: int):
+        rich_users = await self.bot.leaderboard.top(guild_id, 10)
+        names = await self.bot.names.resolve_many(u['user_id'] for u in rich_users)
+        return [(names[user['user_id']], user['balance']) for user in rich_users]
+
+    async def warm(self, timer):
+        """Load /stats (including the supply) and /richlist (including its
+        names) into the analytics cache concurrently. Only the shared economy
+        is warmed: in guild mode each guild fills its own entries on first use."""
+        if guild_mode(self.bot.config):
+            return
+        guild_id = GLOBAL_ECONOMY
+        results = await asyncio.gather(
+            timer.timed('stats', self.bot.analytics_cache.get(
+                ('stats', guild_id), lambda: self._load_stats(guild_id))),
+            timer.timed('richlist', self.bot.analytics_cache.get(
+                ('richlist', guild_id), lambda: self._load_richlist(guild_id))),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Analytics warmup step failed: {result}")
 
     @app_commands.command()
     async def stats(self, interaction: discord.Interaction):
         """Show overall DiddyCoin statistics"""
-        total_supply = await self.bot.db.get_total_currency_supply()
-        trading_stats = await self.bot.db.get_trading_stats()
-        gambling_stats = await self.bot.db.get_gambling_stats()
+        guild_id = economy_id(self.bot.config, interaction)
+        total_supply, trading_stats, gambling_stats = await self.bot.analytics_cache.get(
+            ('stats', guild_id), lambda: self._load_stats(guild_id)
+        )
 
         stats_msg = f"📊 **DiddyCoin Statistics**\n\n"
         stats_msg += f"Total Supply: {total_supply} {self.bot.config['currency']['cents_name']}\n\n"
@@ -54,17 +167,17 @@ class Analytics(commands.Cog):
     @app_commands.command()
     async def richlist(self, interaction: discord.Interaction):
         """Show the richest DiddyCoin holders"""
-        rich_users = await self.bot.db.get_richest_users(10)
+        guild_id = economy_id(self.bot.config, interaction)
+        rich_users = await self.bot.analytics_cache.get(
+            ('richlist', guild_id), lambda: self._load_richlist(guild_id)
+        )
         
         if not rich_users:
             await interaction.response.send_message("No accounts found!")
             return
 
-        values = [user['balance'] for user in rich_users]
-        labels = []
-        for user_data in rich_users:
-            user = await self.bot.fetch_user(user_data['user_id'])
-            labels.append(user.name)
+        labels = [name for name, _ in rich_users]
+        values = [balance for _, balance in rich_users]
 
         chart = create_bar_chart(values, labels, "🏆 Richest DiddyCoin Holders")
         await interaction.response.send_message(chart)
@@ -76,7 +189,10 @@ class Analytics(commands.Cog):
             await interaction.response.send_message("Please specify between 1 and 30 days.")
             return
 
-        volume_data = await self.bot.db.get_transaction_volume(days)
+        guild_id = economy_id(self.bot.config, interaction)
+        volume_data = await self.bot.analytics_cache.get(
+            ('volume', guild_id, days), lambda: self.bot.db.get_transaction_volume(guild_id, days)
+        )
         if not volume_data:
             await interaction.response.send_message("No transaction data available.")
             return
@@ -90,24 +206,64 @@ class Analytics(commands.Cog):
 
         await interaction.response.send_message(f"{volume_chart}\n{trans_chart}")
 
-    @app_commands.command()
-    async def history(self, interaction: discord.Interaction):
-        """Show your transaction history"""
-        history = await self.bot.db.get_user_transaction_history(interaction.user.id)
-        if not history:
+    @history.command(name='show')
+    async def history_show(self, interaction: discord.Interaction):
+        """Page through your transaction history"""
+        guild_id = economy_id(self.bot.config, interaction)
+        rows = await self.bot.db.get_user_transaction_history(guild_id, interaction.user.id, self.page_size + 1)
+        if not rows:
             await interaction.response.send_message("No transaction history found!")
             return
 
-        msg = "📜 **Your Recent Transactions**\n```"
-        for trans in history:
-            amount = trans['amount']
-            symbol = '+" if amount > 0 else "-'
-            msg += f"{trans['timestamp'].strftime('%Y-%m-%d %H:%M')} | "
-            msg += f"{symbol}{abs(amount)} {self.bot.config['currency']['cents_name']} | "
-            msg += f"{trans['type']}\n"
-        msg += "```"
+        view = HistoryView(self.bot, guild_id, interaction.user.id, rows[:self.page_size], self.page_size,
+                           has_older=len(rows) > self.page_size)
+        await interaction.response.send_message(view.render(), view=view)
+        view.message = await interaction.original_response()
+
+    @history.command(name='export')
+    async def history_export(self, interaction: discord.Interaction):
+        """Download your full transaction history as a CSV file"""
+        guild_id = economy_id(self.bot.config, interaction)
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        user_id = interaction.user.id
+        limit = interaction.guild.filesize_limit if interaction.guild else discord.utils.DEFAULT_FILE_SIZE_LIMIT_BYTES
+
+        # Rows stream from a server-side cursor into a temp file, so memory use
+        # stays flat however long the ledger is
+        with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'timestamp', 'type', 'amount'])
+            count = 0
+            async for row in self.bot.db.iter_user_transactions(guild_id, user_id, self.export_batch_size):
+                writer.writerow([row['id'], row['timestamp'].isoformat(), row['type'], row['amount']])
+                count += 1
+            f.flush()
+
+            if not count:
+                await interaction.followup.send("No transaction history found!", ephemeral=True)
+                return
 
-        await interaction.response.send_message(msg)
+            filename = f'diddycoin-history-{user_id}.csv'
+            with tempfile.TemporaryFile() as compressed:
+                attachment = f.buffer
+                if attachment.tell() > limit:
+                    # Too big to upload as-is; CSV compresses well
+                    attachment.seek(0)
+                    with gzip.GzipFile(fileobj=compressed, mode='wb') as gz:
+                        while chunk := attachment.read(1 << 20):
+                            gz.write(chunk)
+                    attachment, filename = compressed, filename + '.gz'
+                    if attachment.tell() > limit:
+                        await interaction.followup.send(
+                            f"Your history ({count} transactions) is too large to upload here.", ephemeral=True
+                        )
+                        return
+                attachment.seek(0)
+                await interaction.followup.send(
+                    f"📜 Exported {count} transactions.",
+                    file=discord.File(attachment, filename=filename),
+                    ephemeral=True
+                )
 
 async def setup(bot):
     await bot.add_cog(Analytics(bot))
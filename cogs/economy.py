@@ -1,16 +1,37 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 import logging
 import random
 from datetime import datetime, timedelta
+from utils.cooldowns import cooldown
+from utils.economies import economy_id
 
 logger = logging.getLogger('diddy_bot')
 
 class Economy(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.rob_cooldowns = {}
+
+    async def cog_load(self):
+        self.resync_leaderboard.change_interval(seconds=self.bot.config['leaderboard']['resync_interval'])
+        self.resync_leaderboard.start()
+
+    async def cog_unload(self):
+        self.resync_leaderboard.cancel()
+
+    @tasks.loop(minutes=10)
+    async def resync_leaderboard(self):
+        """Load the leaderboard on startup, then periodically correct drift"""
+        try:
+            await self.bot.leaderboard.resync()
+        except Exception as e:
+            logger.error(f"Leaderboard resync failed: {e}")
+
+    @resync_leaderboard.before_loop
+    async def before_resync_leaderboard(self):
+        # Extensions load while the pool is still being created
+        await self.bot.db_ready.wait()
 
     @app_commands.command()
     async def help(self, interaction: discord.Interaction):
@@ -27,6 +48,7 @@ class Economy(commands.Cog):
             value="`/new` - Create a new account\n"
                   "`/balance` - Check your balance\n"
                   "`/baltop [limit]` - Show top balances\n"
+                  "`/rank [user]` - Show a leaderboard position\n"
                   "`/value` - Check current coin value",
             inline=False
         )
@@ -57,6 +79,7 @@ class Economy(commands.Cog):
     @app_commands.command()
     async def baltop(self, interaction: discord.Interaction, limit: int = 5):
         """Show top DiddyCoin balances (default: top 5)"""
+        guild_id = economy_id(self.bot.config, interaction)
         # Defer the response immediately
         await interaction.response.defer()
 
@@ -64,7 +87,7 @@ class Economy(commands.Cog):
             await interaction.followup.send("Please specify a limit between 1 and 20.")
             return
 
-        rich_users = await self.bot.db.get_richest_users(limit)
+        rich_users = await self.bot.leaderboard.top(guild_id, limit)
         if not rich_users:
             await interaction.followup.send("No accounts found!")
             return
@@ -75,14 +98,14 @@ class Economy(commands.Cog):
             color=discord.Color.gold()
         )
 
+        names = await self.bot.names.resolve_many(u['user_id'] for u in rich_users)
         for i, user_data in enumerate(rich_users, 1):
-            user = await self.bot.fetch_user(user_data['user_id'])
             formatted_balance = self.bot.converter.format_amount(user_data['balance'])
             
             # Add medal emoji for top 3
             medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else "💠"
             embed.add_field(
-                name=f"{medal} #{i} - {user.name}",
+                name=f"{medal} #{i} - {names[user_data['user_id']]}",
                 value=formatted_balance,
                 inline=False
             )
@@ -90,13 +113,34 @@ class Economy(commands.Cog):
         embed.set_footer(text=f"Currency: {self.bot.config['currency']['name']}")
         await interaction.followup.send(embed=embed)
 
+    @app_commands.command()
+    async def rank(self, interaction: discord.Interaction, user: discord.User = None):
+        """Show your (or another user's) position on the leaderboard"""
+        user = user or interaction.user
+        guild_id = economy_id(self.bot.config, interaction)
+        if not self.bot.leaderboard.loaded:
+            await interaction.response.send_message("The leaderboard is still loading, try again shortly.")
+            return
+
+        position = self.bot.leaderboard.rank(guild_id, user.id)
+        if position is None:
+            await interaction.response.send_message(f"{user.name} doesn't have an account!")
+            return
+
+        rank, balance = position
+        formatted_balance = self.bot.converter.format_amount(balance)
+        await interaction.response.send_message(
+            f"🏅 {user.name} is ranked #{rank} of {self.bot.leaderboard.count(guild_id)} with {formatted_balance}"
+        )
+
     # [Previous commands remain unchanged]
     @app_commands.command()
     async def new(self, interaction: discord.Interaction):
         """Create a new DiddyCoin account"""
+        guild_id = economy_id(self.bot.config, interaction)
         try:
             initial_balance = self.bot.config['bot']['initial_balance']
-            await self.bot.db.create_account(interaction.user.id, initial_balance)
+            await self.bot.db.create_account(guild_id, interaction.user.id, initial_balance)
             formatted_balance = self.bot.converter.format_amount(initial_balance)
             await interaction.response.send_message(
                 f"Account created with {formatted_balance}!"
@@ -108,7 +152,7 @@ class Economy(commands.Cog):
     @app_commands.command()
     async def balance(self, interaction: discord.Interaction):
         """Check your DiddyCoin balance"""
-        balance = await self.bot.db.get_balance(interaction.user.id)
+        balance = await self.bot.db.get_balance(economy_id(self.bot.config, interaction), interaction.user.id)
         if balance is None:
             await interaction.response.send_message("You don't have an account! Use /new to create one.")
             return
@@ -117,51 +161,42 @@ class Economy(commands.Cog):
         await interaction.response.send_message(f"Balance: {formatted_balance}")
 
     @app_commands.command()
+    @cooldown('rob', 3600, "You must wait {minutes}m {seconds}s before attempting another robbery!")
     async def rob(self, interaction: discord.Interaction, target: discord.User):
         """Attempt to rob another user"""
+        # Returning False skips the cooldown: no robbery was attempted
         if target.id == interaction.user.id:
             await interaction.response.send_message("You can't rob yourself!")
-            return
-
-        # Check cooldown
-        cooldown = 3600  # 1 hour cooldown
-        current_time = datetime.now().timestamp()
-        last_rob = self.rob_cooldowns.get(interaction.user.id, 0)
-        
-        if current_time - last_rob < cooldown:
-            time_left = int(cooldown - (current_time - last_rob))
-            minutes = time_left // 60
-            seconds = time_left % 60
-            await interaction.response.send_message(
-                f"You must wait {minutes}m {seconds}s before attempting another robbery!"
-            )
-            return
+            return False
 
         # Check balances
-        robber_balance = await self.bot.db.get_balance(interaction.user.id)
-        target_balance = await self.bot.db.get_balance(target.id)
+        guild_id = economy_id(self.bot.config, interaction)
+        robber_balance = await self.bot.db.get_balance(guild_id, interaction.user.id)
+        target_balance = await self.bot.db.get_balance(guild_id, target.id)
 
         if robber_balance is None:
             await interaction.response.send_message("You don't have an account! Use /new to create one.")
-            return
+            return False
 
         if target_balance is None:
             await interaction.response.send_message("Target doesn't have an account!")
-            return
+            return False
 
         if target_balance < 100:  # Minimum 1 coin worth of cents to rob
             await interaction.response.send_message("Target doesn't have enough money to rob!")
-            return
+            return False
 
         # Rob mechanics
         success_rate = 0.3  # 30% success rate
         if random.random() < success_rate:
             stolen_amount = random.randint(10, min(target_balance // 4, 1000))  # Max 10 coins or 25% of balance
             
-            # Update balances
-            await self.bot.db.update_balance(target.id, -stolen_amount)
-            await self.bot.db.update_balance(interaction.user.id, stolen_amount)
-            
+            # Move the loot in one atomic transfer
+            result = await self.bot.db.transfer(guild_id, target.id, interaction.user.id, stolen_amount, 'rob')
+            if result is None:
+                await interaction.response.send_message("Target doesn't have enough money to rob!")
+                return False
+
             formatted_amount = self.bot.converter.format_amount(stolen_amount)
             await interaction.response.send_message(
                 f"🎭 Robbery successful! You stole {formatted_amount} from {target.name}!"
@@ -169,8 +204,7 @@ class Economy(commands.Cog):
         else:
             # Failed robbery penalty (lose some money)
             penalty = random.randint(50, 200)  # Lose 0.5-2 coins worth of cents
-            if robber_balance >= penalty:
-                await self.bot.db.update_balance(interaction.user.id, -penalty)
+            if robber_balance >= penalty and await self.bot.db.update_balance(guild_id, interaction.user.id, -penalty) is not None:
                 formatted_penalty = self.bot.converter.format_amount(penalty)
                 await interaction.response.send_message(
                     f"😅 Robbery failed! You got caught and lost {formatted_penalty}!"
@@ -180,9 +214,6 @@ class Economy(commands.Cog):
                     "😅 Robbery failed! You got caught but had nothing to lose!"
                 )
 
-        # Set cooldown
-        self.rob_cooldowns[interaction.user.id] = current_time
-
     @app_commands.command()
     async def value(self, interaction: discord.Interaction):
         """Check current DiddyCoin value"""
@@ -201,7 +232,12 @@ class Economy(commands.Cog):
             await interaction.response.send_message("You can't trade with yourself!")
             return
 
-        sender_balance = await self.bot.db.get_balance(interaction.user.id)
+        if amount <= 0:
+            await interaction.response.send_message("Amount must be positive.")
+            return
+
+        guild_id = economy_id(self.bot.config, interaction)
+        sender_balance = await self.bot.db.get_balance(guild_id, interaction.user.id)
         if sender_balance is None:
             await interaction.response.send_message("You don't have an account! Use /new to create one.")
             return
@@ -210,12 +246,17 @@ class Economy(commands.Cog):
             await interaction.response.send_message("Insufficient funds!")
             return
 
-        receiver_balance = await self.bot.db.get_balance(user.id)
+        receiver_balance = await self.bot.db.get_balance(guild_id, user.id)
         if receiver_balance is None:
             await interaction.response.send_message("The recipient doesn't have an account!")
             return
 
-        trade_id = await self.bot.db.create_trade(interaction.user.id, user.id, amount)
+        # Escrows the amount so it can't be spent before the trade settles
+        trade_id = await self.bot.db.create_trade(guild_id, interaction.user.id, user.id, amount)
+        if trade_id is None:
+            await interaction.response.send_message("Insufficient funds!")
+            return
+
         formatted_amount = self.bot.converter.format_amount(amount)
         await interaction.response.send_message(
             f"Trade offer sent to {user.name}!\n"
@@ -226,7 +267,7 @@ class Economy(commands.Cog):
     @app_commands.command()
     async def accept(self, interaction: discord.Interaction, trade_id: int):
         """Accept a pending trade"""
-        if await self.bot.db.execute_trade(trade_id):
+        if await self.bot.db.execute_trade(economy_id(self.bot.config, interaction), trade_id):
             await interaction.response.send_message("Trade completed successfully!")
         else:
             await interaction.response.send_message("Trade not found or already processed!")
@@ -234,7 +275,7 @@ class Economy(commands.Cog):
     @app_commands.command()
     async def decline(self, interaction: discord.Interaction, trade_id: int):
         """Decline a pending trade"""
-        if await self.bot.db.cancel_trade(trade_id):
+        if await self.bot.db.cancel_trade(economy_id(self.bot.config, interaction), trade_id):
             await interaction.response.send_message("Trade cancelled successfully!")
         else:
             await interaction.response.send_message("Trade not found or already processed!")
@@ -242,16 +283,18 @@ class Economy(commands.Cog):
     @app_commands.command()
     async def trades(self, interaction: discord.Interaction):
         """List your pending trades"""
-        pending_trades = await self.bot.db.get_pending_trades(interaction.user.id)
+        pending_trades = await self.bot.db.get_pending_trades(
+            economy_id(self.bot.config, interaction), interaction.user.id
+        )
         if not pending_trades:
             await interaction.response.send_message("No pending trades!")
             return
 
+        names = await self.bot.names.resolve_many(t['sender_id'] for t in pending_trades)
         trades_list = "Pending Trades:\n"
         for trade in pending_trades:
-            sender = await self.bot.fetch_user(trade['sender_id'])
             formatted_amount = self.bot.converter.format_amount(trade['amount'])
-            trades_list += f"ID: {trade['id']} | From: {sender.name} | Amount: {formatted_amount}\n"
+            trades_list += f"ID: {trade['id']} | From: {names[trade['sender_id']]} | Amount: {formatted_amount}\n"
 
         await interaction.response.send_message(trades_list)
 
@@ -1,8 +1,8 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import random
 import logging
+from utils.economies import economy_id
 
 logger = logging.getLogger('diddy_bot')
 
@@ -25,12 +25,13 @@ class Gambling(commands.Cog):
             )
             return
 
-        balance = await self.bot.db.get_balance(interaction.user.id)
-        if balance is None or balance < amount:
+        # Escrows the bet; fails if the player's unreserved funds don't cover it
+        guild_id = economy_id(self.bot.config, interaction)
+        game_id = await self.bot.db.create_game(guild_id, 'coinflip', interaction.user.id, amount)
+        if game_id is None:
             await interaction.response.send_message("Insufficient funds!")
             return
 
-        game_id = await self.bot.db.create_game('coinflip', interaction.user.id, amount)
         await interaction.response.send_message(
             f"Coinflip game created! Game ID: {game_id}\n"
             f"Bet amount: {amount} {self.bot.config['currency']['cents_name']}\n"
@@ -40,30 +41,22 @@ class Gambling(commands.Cog):
     @app_commands.command()
     async def cfjoin(self, interaction: discord.Interaction, game_id: int):
         """Join a coinflip game"""
-        game = await self.bot.db.get_active_games('coinflip')
-        game = next((g for g in game if g['id'] == game_id), None)
-
-        if not game:
+        guild_id = economy_id(self.bot.config, interaction)
+        outcome, game = await self.bot.db.claim_game(guild_id, game_id, interaction.user.id)
+        if outcome == 'not_found':
             await interaction.response.send_message("Game not found!")
             return
 
-        if game['creator_id'] == interaction.user.id:
+        if outcome == 'own_game':
             await interaction.response.send_message("You can't join your own game!")
             return
 
-        balance = await self.bot.db.get_balance(interaction.user.id)
-        if balance is None or balance < game['bet_amount']:
+        if outcome == 'insufficient_funds':
             await interaction.response.send_message("Insufficient funds!")
             return
 
-        # Process the game
-        winner = random.choice([game['creator_id'], interaction.user.id])
-        loser = game['creator_id'] if winner == interaction.user.id else interaction.user.id
-
-        await self.bot.db.update_balance(winner, game['bet_amount'])
-        await self.bot.db.update_balance(loser, -game['bet_amount'])
-
-        winner_name = (await self.bot.fetch_user(winner)).name
+        winner = game['winner_id']
+        winner_name = await self.bot.names.resolve(winner)
         await interaction.response.send_message(
             f"🎲 Game Results 🎲\n"
             f"Winner: {winner_name}\n"
@@ -73,15 +66,15 @@ class Gambling(commands.Cog):
     @app_commands.command()
     async def cflist(self, interaction: discord.Interaction):
         """List active coinflip games"""
-        games = await self.bot.db.get_active_games('coinflip')
+        games = await self.bot.db.get_active_games(economy_id(self.bot.config, interaction), 'coinflip')
         if not games:
             await interaction.response.send_message("No active games found!")
             return
 
+        names = await self.bot.names.resolve_many(g['creator_id'] for g in games)
         games_list = "Active Coinflip Games:\n"
         for game in games:
-            creator = await self.bot.fetch_user(game['creator_id'])
-            games_list += f"ID: {game['id']} | Creator: {creator.name} | "
+            games_list += f"ID: {game['id']} | Creator: {names[game['creator_id']]} | "
             games_list += f"Bet: {game['bet_amount']} {self.bot.config['currency']['cents_name']}\n"
 
         await interaction.response.send_message(games_list)
@@ -1,16 +1,224 @@
 import os
+import re
+import gzip
 import asyncpg
 import logging
+import time
 import asyncio
+import random
+import contextlib
+import contextvars
 from datetime import datetime, timedelta
+from utils.metrics import metrics
+from utils.ledger import LedgerWriter, LEDGER_COLUMNS
+from utils.resilience import CircuitBreaker, RetryPolicy, is_connection_error, is_transient
+from storage import StorageBackend
 
 logger = logging.getLogger('diddy_bot')
 
-class Database:
-    def __init__(self):
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE_RE = re.compile(r'^(\d+)_(\w+)\.sql$')
+MIGRATION_LOCK_ID = 0x646964647900  # pg_advisory lock key shared by all bot processes
+SUPPLY_STRIPES = 16  # currency_supply rows per economy; must match migration 0004
+POOL_REBUILD_INTERVAL = 5  # seconds; minimum gap between pool rebuilds
+LEDGER_PARTITION_RE = re.compile(r'^transactions_(\d{4})_(\d{2})$')  # monthly partitions from migration 0012
+MAINTENANCE_TIMEOUT = 3600  # seconds; archive exports and full reconciliations can outlast command_timeout
+REPLICA_RETRY_INTERVAL = 30  # seconds reads stay on the primary after the replica drops a connection
+LISTENER_APPLICATION_NAME = 'diddy-listener'  # tags InvalidationBus connections in pg_stat_activity
+# Read-only analytics methods served from the replica pool; database.replica_methods overrides
+REPLICA_METHODS = (
+    'get_transaction_volume', 'get_trading_stats', 'get_gambling_stats',
+    'get_richest_users', 'get_user_transaction_history',
+)
+
+def load_migrations(path=MIGRATIONS_DIR):
+    """Return (version, name, sql) for every migration file, ordered by version"""
+    migrations = []
+    for filename in os.listdir(path):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(path, filename), 'r') as f:
+            migrations.append((int(match.group(1)), match.group(2), f.read()))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {path}")
+    return migrations
+
+def _partition_bounds(name: str):
+    """[start, end) of the month a ledger partition covers"""
+    year, month = map(int, LEDGER_PARTITION_RE.match(name).groups())
+    start = datetime(year, month, 1)
+    return start, datetime(year + month // 12, month % 12 + 1, 1)
+
+async def _export_table(conn, table: str, path: str):
+    """COPY a table to a gzipped CSV file, replacing it atomically"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+            async def write(chunk):
+                await asyncio.to_thread(gz.write, chunk)
+            await conn.copy_from_table(table, output=write, format='csv', header=True, timeout=MAINTENANCE_TIMEOUT)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+
+# Each statement below takes a boolean parameter that gates its ledger insert:
+# true writes the ledger rows inline, false leaves them to the write-behind
+# LedgerWriter, which builds them from the returned ledger_ts.
+
+# Every statement is scoped to one economy by its leading guild_id ($1), so
+# the accounts, trades and active_games scans are pruned to one hash partition.
+
+# Debit, credit and both ledger rows in one statement. The debit only matches
+# a positive amount the sender's unreserved funds cover, if the receiver exists,
+# and the credit only runs if the debit did, so a failed guard leaves every
+# row untouched.
+TRANSFER_SQL = '''
+    WITH debit AS (
+        UPDATE accounts SET balance = balance - $4, version = version + 1
+        WHERE guild_id = $1 AND user_id = $2 AND $2 <> $3 AND $4 > 0 AND balance - reserved >= $4
+          AND EXISTS (SELECT 1 FROM accounts WHERE guild_id = $1 AND user_id = $3)
+        RETURNING balance, version
+    ), credit AS (
+        UPDATE accounts SET balance = balance + $4, version = version + 1
+        WHERE guild_id = $1 AND user_id = $3 AND EXISTS (SELECT 1 FROM debit)
+        RETURNING balance, version
+    ), ledger AS (
+        INSERT INTO transactions (guild_id, user_id, amount, type)
+        SELECT $1, $2, -$4, $5 FROM debit WHERE $7
+        UNION ALL
+        SELECT $1, $3, $4, $6 FROM credit WHERE $7
+    )
+    SELECT debit.balance AS from_balance, credit.balance AS to_balance,
+           debit.version AS from_version, credit.version AS to_version,
+           LOCALTIMESTAMP AS ledger_ts
+    FROM debit, credit
+'''
+
+# Capture a pending trade's escrow. The amount was reserved when the trade was
+# created, so settlement is a single write with no balance re-validation.
+EXECUTE_TRADE_SQL = '''
+    WITH trade AS (
+        UPDATE trades SET status = 'completed'
+        WHERE guild_id = $1 AND id = $2 AND status = 'pending'
+        RETURNING sender_id, receiver_id, amount
+    ), debit AS (
+        UPDATE accounts a SET balance = a.balance - t.amount, reserved = a.reserved - t.amount,
+                              version = a.version + 1
+        FROM trade t
+        WHERE a.guild_id = $1 AND a.user_id = t.sender_id
+        RETURNING a.balance, a.version
+    ), credit AS (
+        UPDATE accounts a SET balance = a.balance + t.amount, version = a.version + 1
+        FROM trade t
+        WHERE a.guild_id = $1 AND a.user_id = t.receiver_id
+        RETURNING a.balance, a.version
+    ), ledger AS (
+        INSERT INTO transactions (guild_id, user_id, amount, type)
+        SELECT $1, t.sender_id, -t.amount, 'trade_sent' FROM trade t WHERE $3
+        UNION ALL
+        SELECT $1, t.receiver_id, t.amount, 'trade_received' FROM trade t WHERE $3
+    )
+    SELECT t.sender_id, t.receiver_id, t.amount,
+           debit.balance AS from_balance, credit.balance AS to_balance,
+           debit.version AS from_version, credit.version AS to_version,
+           LOCALTIMESTAMP AS ledger_ts
+    FROM trade t, debit, credit
+'''
+
+# Settle a claimed game: $2 creator, $3 joiner, $4 winner, $5 bet, $6 game type.
+# The creator's stake is already reserved; the joiner's is checked against
+# their unreserved funds, and the creator's side only runs if that passed.
+SETTLE_GAME_SQL = '''
+    WITH joiner AS (
+        UPDATE accounts SET balance = balance + CASE WHEN user_id = $4 THEN $5 ELSE -$5 END,
+                            version = version + 1
+        WHERE guild_id = $1 AND user_id = $3 AND balance - reserved >= $5
+        RETURNING balance, version
+    ), creator AS (
+        UPDATE accounts SET balance = balance + CASE WHEN user_id = $4 THEN $5 ELSE -$5 END,
+                            reserved = reserved - $5, version = version + 1
+        WHERE guild_id = $1 AND user_id = $2 AND EXISTS (SELECT 1 FROM joiner)
+        RETURNING balance, version
+    ), ledger AS (
+        INSERT INTO transactions (guild_id, user_id, amount, type)
+        SELECT $1, player, CASE WHEN player = $4 THEN $5 ELSE -$5 END,
+               $6 || CASE WHEN player = $4 THEN '_won' ELSE '_lost' END
+        FROM (SELECT $2::bigint AS player FROM creator
+              UNION ALL
+              SELECT $3::bigint FROM joiner) players
+        WHERE $7
+    )
+    SELECT creator.balance AS creator_balance, joiner.balance AS joiner_balance,
+           creator.version AS creator_version, joiner.version AS joiner_version,
+           LOCALTIMESTAMP AS ledger_ts
+    FROM creator, joiner
+'''
+
+# Name of the Database method currently running, used to label pool metrics
+_current_method = contextvars.ContextVar('db_method', default='other')
+
+class _Rollback(Exception):
+    """Abort the surrounding transaction and report `outcome` to the caller"""
+
+    def __init__(self, outcome: str):
+        super().__init__(outcome)
+        self.outcome = outcome
+
+def read_your_writes(method):
+    """Mark a read that must observe the caller's own writes, so it is never routed to a replica"""
+    method.read_your_writes = True
+    return method
+
+def at_most_once(method):
+    """Mark a write that must not be retried once its statement may have reached
+    the server: a lost connection or timeout there could hide a commit"""
+    method.at_most_once = True
+    return method
+
+class Database(StorageBackend):
+    """PostgreSQL storage backend (the production default).
+
+    With a replica DSN (PGREPLICA_DSN or database.replica_dsn) the methods in
+    replica_methods run on a separate, separately sized pool, so analytics
+    aggregates never hold connections the writes need. Everything else, and
+    every read while the replica is failing, uses the primary.
+    """
+
+    supports_notify = True
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        db_config = (config or {}).get('database', {})
         self.pool = None
+        self.replica_pool = None
+        self.replica_dsn = os.environ.get('PGREPLICA_DSN') or db_config.get('replica_dsn')
+        self.replica_pool_min_size = db_config.get('replica_pool_min_size', 1)
+        self.replica_pool_max_size = db_config.get('replica_pool_max_size', 5)
+        self.replica_methods = self._replica_routes(db_config.get('replica_methods', REPLICA_METHODS))
+        self._replica_failed_at = None
         self.max_retries = 3
-        self.retry_delay = 5  # seconds
+        self.retry_delay = 5  # seconds, between startup attempts
+        self.retry_policy = RetryPolicy(
+            max_attempts=db_config.get('retry_attempts', 4),
+            base_delay=db_config.get('retry_base_delay', 0.05),
+            max_delay=db_config.get('retry_max_delay', 1.0),
+            deadline=db_config.get('retry_deadline', 2.5)
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=db_config.get('breaker_threshold', 5),
+            reset_timeout=db_config.get('breaker_reset_timeout', 10)
+        )
+        self._pool_generation = 0  # bumped on every rebuild so concurrent callers rebuild once
+        self._rebuild_task = None
+        self._rebuilt_at = 0.0
+        self.ledger = LedgerWriter(self, config)
+        metrics.register_gauge('db_pool_connections', lambda: self._pool_gauges(self.pool))
+        metrics.register_gauge('db_replica_pool_connections', lambda: self._pool_gauges(self.replica_pool))
+        metrics.register_gauge('db_circuit_open', lambda: int(self.breaker.state != CircuitBreaker.CLOSED))
 
     async def _create_pool(self):
         """Create a connection pool with proper SSL settings"""
@@ -31,54 +239,40 @@ class Database:
             logger.error(f"Failed to create connection pool: {e}")
             return False
 
+    @classmethod
+    def _replica_routes(cls, names):
+        """Validate the method names configured for the replica"""
+        for name in names:
+            method = getattr(cls, name, None)
+            if method is None:
+                raise ValueError(f"Unknown Database method in replica_methods: {name!r}")
+            if getattr(method, 'read_your_writes', False):
+                raise ValueError(f"{name} must read its own writes and cannot use the replica")
+        return frozenset(names)
+
+    async def _create_replica_pool(self):
+        """Create the replica pool; on failure reads stay on the primary"""
+        try:
+            self.replica_pool = await asyncpg.create_pool(
+                self.replica_dsn,
+                command_timeout=60,
+                min_size=self.replica_pool_min_size,
+                max_size=self.replica_pool_max_size
+            )
+        except Exception as e:
+            logger.error(f"Failed to create replica pool, reading from the primary: {e}")
+
     async def initialize(self):
         """Initialize database with retry logic"""
         for attempt in range(self.max_retries):
             try:
                 if await self._create_pool():
-                    # Create tables if they don't exist
                     async with self.pool.acquire() as conn:
-                        await conn.execute('''
-                            CREATE TABLE IF NOT EXISTS accounts (
-                                user_id BIGINT PRIMARY KEY,
-                                balance BIGINT NOT NULL DEFAULT 0,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            )
-                        ''')
-
-                        await conn.execute('''
-                            CREATE TABLE IF NOT EXISTS transactions (
-                                id SERIAL PRIMARY KEY,
-                                user_id BIGINT,
-                                amount BIGINT,
-                                type VARCHAR(50),
-                                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            )
-                        ''')
-
-                        await conn.execute('''
-                            CREATE TABLE IF NOT EXISTS active_games (
-                                id SERIAL PRIMARY KEY,
-                                game_type VARCHAR(50),
-                                creator_id BIGINT,
-                                bet_amount BIGINT,
-                                status VARCHAR(20),
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            )
-                        ''')
-
-                        await conn.execute('''
-                            CREATE TABLE IF NOT EXISTS trades (
-                                id SERIAL PRIMARY KEY,
-                                sender_id BIGINT,
-                                receiver_id BIGINT,
-                                amount BIGINT,
-                                status VARCHAR(20),
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                FOREIGN KEY (sender_id) REFERENCES accounts(user_id),
-                                FOREIGN KEY (receiver_id) REFERENCES accounts(user_id)
-                            )
-                        ''')
+                        await self._migrate(conn)
+                    if self.replica_dsn and self.replica_pool is None:
+                        await self._create_replica_pool()
+                    await self.ledger.recover()
+                    self.ledger.start()
                     return
                 
             except Exception as e:
@@ -88,182 +282,713 @@ class Database:
                 else:
                     raise
 
+    async def _migrate(self, conn):
+        """Apply pending migrations in order, each in its own transaction"""
+        async with conn.transaction():
+            # Under the lock too: concurrent CREATE TABLE IF NOT EXISTS can still
+            # collide on the catalog's unique index
+            await conn.execute('SELECT pg_advisory_xact_lock($1)', MIGRATION_LOCK_ID)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        for version, name, sql in load_migrations():
+            async with conn.transaction():
+                # Serialize runners so concurrent bot processes apply each migration once
+                await conn.execute('SELECT pg_advisory_xact_lock($1)', MIGRATION_LOCK_ID)
+                applied = await conn.fetchval(
+                    'SELECT 1 FROM schema_version WHERE version = $1', version
+                )
+                if applied:
+                    continue
+                logger.info(f"Applying migration {version:04d}_{name}")
+                await conn.execute(sql)
+                await conn.execute(
+                    'INSERT INTO schema_version (version, name) VALUES ($1, $2)',
+                    version, name
+                )
+
+    @staticmethod
+    def _pool_gauges(pool):
+        if pool is None:
+            return {}
+        size, idle = pool.get_size(), pool.get_idle_size()
+        return {
+            (('state', 'in_use'),): size - idle,
+            (('state', 'idle'),): idle,
+            (('state', 'max'),): pool.get_max_size(),
+        }
+
+    def _pool_for(self, method: str):
+        """The replica pool for replica methods while it is healthy, else the primary"""
+        if self.replica_pool is None or method not in self.replica_methods:
+            return self.pool
+        if self._replica_failed_at is not None and time.monotonic() - self._replica_failed_at < REPLICA_RETRY_INTERVAL:
+            return self.pool
+        return self.replica_pool
+
+    @contextlib.asynccontextmanager
+    async def _acquire(self, method: str = None):
+        """Acquire a pooled connection, timing the wait and how long it is held"""
+        method = method or _current_method.get()
+        pool = self._pool_for(method)
+        start = time.perf_counter()
+        acquired = None
+        try:
+            async with pool.acquire() as conn:
+                acquired = time.perf_counter()
+                metrics.observe('db_pool_wait_seconds', acquired - start, method=method)
+                try:
+                    yield conn
+                finally:
+                    metrics.observe('db_query_seconds', time.perf_counter() - acquired, method=method)
+        except Exception as e:
+            if acquired is not None:
+                # Statements may have reached the server; see _outcome_unknown
+                e.after_acquire = True
+            if pool is self.replica_pool and is_connection_error(e):
+                # Retries go to the primary; the primary pool itself is fine
+                e.from_replica = True
+                self._replica_failed_at = time.monotonic()
+                metrics.incr('db_replica_failovers_total', method=method)
+                logger.warning(f"Replica connection failed in {method}, reading from the primary: {e!r}")
+            raise
+
     async def _execute_with_retry(self, operation):
-        """Execute database operation with retry logic"""
-        for attempt in range(self.max_retries):
+        """Execute database operation with retry logic, recording per-method metrics"""
+        # 'Database.get_balance.<locals>.operation' -> 'get_balance'
+        method = operation.__qualname__.split('.<locals>')[0].rsplit('.', 1)[-1]
+        token = _current_method.set(method)
+        start = time.perf_counter()
+        try:
+            return await self._run_with_retry(operation, method)
+        except Exception:
+            metrics.incr('db_errors_total', method=method)
+            raise
+        finally:
+            metrics.observe('db_call_seconds', time.perf_counter() - start, method=method)
+            _current_method.reset(token)
+
+    async def _run_with_retry(self, operation, method):
+        """Retry transient failures with jittered backoff until the deadline.
+
+        Deterministic errors (constraint violations, bad SQL) are raised on the
+        first attempt, and so are connection losses in @at_most_once writes
+        that may already have committed. While the circuit breaker is open calls fail fast with
+        DatabaseUnavailableError instead of queueing behind a dead database.
+        """
+        policy = self.retry_policy
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            generation = self._pool_generation
             try:
-                return await operation()
-            except (asyncpg.ConnectionDoesNotExistError, asyncpg.InterfaceError) as e:
-                logger.error(f"Connection error on attempt {attempt + 1}: {e}")
-                if self.pool:
-                    await self.pool.close()
-                await self._create_pool()
-                if attempt == self.max_retries - 1:
-                    raise
-                await asyncio.sleep(self.retry_delay)
+                result = await operation()
             except Exception as e:
-                logger.error(f"Operation failed on attempt {attempt + 1}: {e}")
-                if attempt == self.max_retries - 1:
+                if not is_transient(e):
+                    # The database answered, so it is up even if the query failed
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if is_connection_error(e) and not getattr(e, 'from_replica', False):
+                    self._rebuild_pool(generation)
+                if self._outcome_unknown(e, method):
+                    metrics.incr('db_unknown_outcomes_total', method=method)
+                    logger.error(f"{method} lost its connection mid-call and may have committed; not retrying: {e!r}")
                     raise
-                await asyncio.sleep(self.retry_delay)
+                delay = policy.backoff(attempt)
+                attempt += 1
+                if attempt >= policy.max_attempts or loop.time() + delay > deadline:
+                    logger.error(f"{method} failed after {attempt} attempts: {e!r}")
+                    raise
+                logger.warning(f"{method} attempt {attempt} failed, retrying in {delay * 1000:.0f}ms: {e!r}")
+                metrics.incr('db_retries_total', method=method)
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    def _outcome_unknown(self, error: BaseException, method: str) -> bool:
+        """True if an at-most-once write failed in a way that could hide a commit.
+
+        Failures to get a connection, and errors the server reports (such as
+        serialization failures), mean nothing was committed and are retried.
+        A dropped connection or client-side timeout after the connection was
+        acquired may come after the server committed, so retrying it could
+        move the money twice.
+        """
+        if not getattr(getattr(type(self), method, None), 'at_most_once', False):
+            return False
+        if not getattr(error, 'after_acquire', False):
+            return False
+        return is_connection_error(error) or isinstance(error, asyncio.TimeoutError)
+
+    def _rebuild_pool(self, generation: int):
+        """Start one background pool rebuild, however many callers saw the pool fail.
 
-    async def create_account(self, user_id: int, initial_balance: int):
+        Callers keep retrying on the current pool meanwhile; asyncpg reconnects
+        dead connections on its own, so the rebuild only has to recover a pool
+        that is unusable as a whole.
+        """
+        if generation != self._pool_generation:
+            return  # the pool this caller used has already been replaced
+        if time.monotonic() - self._rebuilt_at < POOL_REBUILD_INTERVAL:
+            return
+        if self._rebuild_task is None or self._rebuild_task.done():
+            self._rebuild_task = asyncio.create_task(self._replace_pool(), name='db-pool-rebuild')
+
+    async def _replace_pool(self):
+        self._rebuilt_at = time.monotonic()
+        old_pool = self.pool
+        if not await self._create_pool():
+            return
+        self._pool_generation += 1
+        metrics.incr('db_pool_rebuilds_total')
+        logger.warning(f"Rebuilt database connection pool (generation {self._pool_generation})")
+        if old_pool is not None:
+            # Queries still running on the old pool finish before it closes
+            await old_pool.close()
+
+    @at_most_once
+    async def create_account(self, guild_id: int, user_id: int, initial_balance: int):
         async def operation():
-            async with self.pool.acquire() as conn:
-                await conn.execute(
-                    'INSERT INTO accounts (user_id, balance) VALUES ($1, $2)',
-                    user_id, initial_balance
-                )
-        await self._execute_with_retry(operation)
+            async with self._acquire() as conn:
+                return await conn.fetchval('''
+                    WITH account AS (
+                        INSERT INTO accounts (guild_id, user_id, balance) VALUES ($1, $2, $3)
+                        RETURNING balance
+                    ), ledger AS (
+                        INSERT INTO transactions (guild_id, user_id, amount, type)
+                        SELECT $1, $2, $3, 'opening' FROM account WHERE $5
+                    ), supply AS (
+                        INSERT INTO currency_supply (guild_id, slot, amount)
+                        SELECT $1, $4::smallint, $3 FROM account
+                        ON CONFLICT (guild_id, slot) DO UPDATE
+                        SET amount = currency_supply.amount + EXCLUDED.amount
+                    )
+                    SELECT LOCALTIMESTAMP AS ledger_ts FROM account
+                ''', guild_id, user_id, initial_balance, user_id % SUPPLY_STRIPES, not self.ledger.write_behind)
+        ledger_ts = await self._execute_with_retry(operation)
+        if self.ledger.write_behind:
+            await self.ledger.append([(guild_id, user_id, initial_balance, 'opening', ledger_ts)])
+        self._publish_balances(guild_id, {user_id: (initial_balance, 0)})
+
+    @read_your_writes
+    async def get_balance(self, guild_id: int, user_id: int):
+        balance = self.balance_cache.get((guild_id, user_id))
+        if balance is not None:
+            return balance
 
-    async def get_balance(self, user_id: int):
         async def operation():
-            async with self.pool.acquire() as conn:
-                return await conn.fetchval(
-                    'SELECT balance FROM accounts WHERE user_id = $1',
-                    user_id
+            async with self._acquire() as conn:
+                return await conn.fetchrow(
+                    'SELECT balance, version FROM accounts WHERE guild_id = $1 AND user_id = $2',
+                    guild_id, user_id
                 )
-        return await self._execute_with_retry(operation)
+        row = await self._execute_with_retry(operation)
+        if row is None:
+            return None
+        # Ignored if a write published while we were reading already cached a newer version
+        self.balance_cache.set_if_newer((guild_id, user_id), row['balance'], row['version'])
+        return row['balance']
 
-    async def update_balance(self, user_id: int, amount: int):
+    @at_most_once
+    async def update_balance(self, guild_id: int, user_id: int, amount: int):
+        """Apply a delta to a balance; returns the new balance, or None if the
+        account is missing or a debit exceeds its unreserved funds"""
         async def operation():
-            async with self.pool.acquire() as conn:
-                async with conn.transaction():
-                    await conn.execute(
-                        'UPDATE accounts SET balance = balance + $1 WHERE user_id = $2',
-                        amount, user_id
+            async with self._acquire() as conn:
+                return await conn.fetchrow('''
+                    WITH updated AS (
+                        UPDATE accounts SET balance = balance + $3, version = version + 1
+                        WHERE guild_id = $1 AND user_id = $2 AND ($3 >= 0 OR balance - reserved + $3 >= 0)
+                        RETURNING balance, version
+                    ), ledger AS (
+                        INSERT INTO transactions (guild_id, user_id, amount, type)
+                        SELECT $1, $2, $3, 'update' FROM updated WHERE $5
+                    ), supply AS (
+                        INSERT INTO currency_supply (guild_id, slot, amount)
+                        SELECT $1, $4::smallint, $3 FROM updated
+                        ON CONFLICT (guild_id, slot) DO UPDATE
+                        SET amount = currency_supply.amount + EXCLUDED.amount
                     )
-                    await conn.execute(
-                        'INSERT INTO transactions (user_id, amount, type) VALUES ($1, $2, $3)',
-                        user_id, amount, 'update'
+                    SELECT balance, version, LOCALTIMESTAMP AS ledger_ts FROM updated
+                ''', guild_id, user_id, amount, user_id % SUPPLY_STRIPES, not self.ledger.write_behind)
+        result = await self._execute_with_retry(operation)
+        if result is None:
+            return None
+        if self.ledger.write_behind:
+            await self.ledger.append([(guild_id, user_id, amount, 'update', result['ledger_ts'])])
+        self._publish_balances(guild_id, {user_id: (result['balance'], result['version'])})
+        return result['balance']
+
+    async def bulk_update_balance(self, guild_id: int, batch_key: str, user_ids, amount: int, type: str):
+        """Apply the same delta to many accounts of one economy in one statement.
+
+        Accounts already recorded under batch_key are skipped, as are missing
+        accounts and, for debits, accounts whose unreserved funds don't cover
+        the amount. Returns {user_id: new_balance} for the accounts changed.
+        """
+        async def operation():
+            async with self._acquire() as conn:
+                return await conn.fetch('''
+                    WITH updated AS (
+                        UPDATE accounts a SET balance = a.balance + $4, version = a.version + 1
+                        FROM unnest($3::bigint[]) AS u(user_id)
+                        WHERE a.guild_id = $1 AND a.user_id = u.user_id
+                          AND ($4 >= 0 OR a.balance - a.reserved + $4 >= 0)
+                          AND NOT EXISTS (
+                              SELECT 1 FROM bulk_adjustments b
+                              WHERE b.batch_key = $2 AND b.guild_id = $1 AND b.user_id = a.user_id
+                          )
+                        RETURNING a.user_id, a.balance, a.version
+                    ), applied AS (
+                        -- The primary key makes a concurrent run of the same key fail instead of double-applying
+                        INSERT INTO bulk_adjustments (batch_key, guild_id, user_id)
+                        SELECT $2, $1, user_id FROM updated
+                    ), ledger AS (
+                        INSERT INTO transactions (guild_id, user_id, amount, type)
+                        SELECT $1, user_id, $4, $5 FROM updated WHERE $6
+                    ), supply AS (
+                        INSERT INTO currency_supply (guild_id, slot, amount)
+                        SELECT $1, user_id % $7, COUNT(*) * $4
+                        FROM updated GROUP BY 2
+                        ON CONFLICT (guild_id, slot) DO UPDATE
+                        SET amount = currency_supply.amount + EXCLUDED.amount
                     )
-        await self._execute_with_retry(operation)
+                    SELECT user_id, balance, version, LOCALTIMESTAMP AS ledger_ts FROM updated
+                ''', guild_id, batch_key, list(dict.fromkeys(user_ids)), amount, type,
+                    not self.ledger.write_behind, SUPPLY_STRIPES)
+        rows = await self._execute_with_retry(operation)
+        if rows and self.ledger.write_behind:
+            await self.ledger.append([(guild_id, row['user_id'], amount, type, row['ledger_ts']) for row in rows])
+        if rows:
+            self._publish_balances(guild_id, {row['user_id']: (row['balance'], row['version']) for row in rows})
+        return {row['user_id']: row['balance'] for row in rows}
+
+    @at_most_once
+    async def transfer(self, guild_id: int, from_id: int, to_id: int, amount: int, type: str):
+        """Atomically move funds between two accounts in a single statement.
 
-    async def create_trade(self, sender_id: int, receiver_id: int, amount: int):
+        Returns a record with the new ``from_balance`` and ``to_balance``, or
+        None if the sender cannot cover the amount or either account is missing.
+        """
         async def operation():
-            async with self.pool.acquire() as conn:
-                return await conn.fetchval(
-                    '''INSERT INTO trades (sender_id, receiver_id, amount, status)
-                       VALUES ($1, $2, $3, 'pending')
-                       RETURNING id''',
-                    sender_id, receiver_id, amount
+            async with self._acquire() as conn:
+                return await conn.fetchrow(
+                    TRANSFER_SQL, guild_id, from_id, to_id, amount, f'{type}_sent', f'{type}_received',
+                    not self.ledger.write_behind
                 )
+        result = await self._execute_with_retry(operation)
+        if result is not None:
+            if self.ledger.write_behind:
+                await self.ledger.append([
+                    (guild_id, from_id, -amount, f'{type}_sent', result['ledger_ts']),
+                    (guild_id, to_id, amount, f'{type}_received', result['ledger_ts']),
+                ])
+            self._publish_balances(guild_id, {
+                from_id: (result['from_balance'], result['from_version']),
+                to_id: (result['to_balance'], result['to_version']),
+            })
+        return result
+
+    @at_most_once
+    async def create_trade(self, guild_id: int, sender_id: int, receiver_id: int, amount: int):
+        """Escrow the amount from the sender and open a trade; returns its id,
+        or None if the sender's unreserved funds don't cover it"""
+        async def operation():
+            async with self._acquire() as conn:
+                return await conn.fetchval('''
+                    WITH hold AS (
+                        UPDATE accounts SET reserved = reserved + $4
+                        WHERE guild_id = $1 AND user_id = $2 AND $2 <> $3 AND $4 > 0
+                          AND balance - reserved >= $4
+                          AND EXISTS (SELECT 1 FROM accounts WHERE guild_id = $1 AND user_id = $3)
+                        RETURNING user_id
+                    )
+                    INSERT INTO trades (guild_id, sender_id, receiver_id, amount, status)
+                    SELECT $1, $2, $3, $4, 'pending' FROM hold
+                    RETURNING id
+                ''', guild_id, sender_id, receiver_id, amount)
         return await self._execute_with_retry(operation)
 
-    async def get_pending_trades(self, user_id: int):
+    @read_your_writes
+    async def get_pending_trades(self, guild_id: int, user_id: int):
         async def operation():
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
                 return await conn.fetch(
                     '''SELECT * FROM trades 
-                       WHERE receiver_id = $1 AND status = 'pending'
+                       WHERE guild_id = $1 AND receiver_id = $2 AND status = 'pending'
                        ORDER BY created_at DESC''',
-                    user_id
+                    guild_id, user_id
                 )
         return await self._execute_with_retry(operation)
 
-    async def execute_trade(self, trade_id: int):
+    @at_most_once
+    async def execute_trade(self, guild_id: int, trade_id: int):
+        """Settle a pending trade; returns the new balances or None"""
         async def operation():
-            async with self.pool.acquire() as conn:
-                async with conn.transaction():
-                    trade = await conn.fetchrow(
-                        'SELECT * FROM trades WHERE id = $1 AND status = \'pending\'',
-                        trade_id
-                    )
-                    
-                    if not trade:
-                        return False
+            async with self._acquire() as conn:
+                return await conn.fetchrow(EXECUTE_TRADE_SQL, guild_id, trade_id, not self.ledger.write_behind)
+        result = await self._execute_with_retry(operation)
+        if result is not None:
+            if self.ledger.write_behind:
+                await self.ledger.append([
+                    (guild_id, result['sender_id'], -result['amount'], 'trade_sent', result['ledger_ts']),
+                    (guild_id, result['receiver_id'], result['amount'], 'trade_received', result['ledger_ts']),
+                ])
+            self._publish_balances(guild_id, {
+                result['sender_id']: (result['from_balance'], result['from_version']),
+                result['receiver_id']: (result['to_balance'], result['to_version']),
+            })
+        return result
 
-                    await conn.execute(
-                        'UPDATE accounts SET balance = balance - $1 WHERE user_id = $2',
-                        trade['amount'], trade['sender_id']
-                    )
-                    await conn.execute(
-                        'UPDATE accounts SET balance = balance + $1 WHERE user_id = $2',
-                        trade['amount'], trade['receiver_id']
-                    )
-                    
-                    await conn.execute(
-                        'UPDATE trades SET status = \'completed\' WHERE id = $1',
-                        trade_id
-                    )
-                    
-                    await conn.execute(
-                        'INSERT INTO transactions (user_id, amount, type) VALUES ($1, $2, $3)',
-                        trade['sender_id'], -trade['amount'], 'trade_sent'
+    @at_most_once
+    async def cancel_trade(self, guild_id: int, trade_id: int):
+        """Cancel a pending trade and release its escrow; returns True if cancelled"""
+        async def operation():
+            async with self._acquire() as conn:
+                return await conn.fetchval('''
+                    WITH trade AS (
+                        UPDATE trades SET status = 'cancelled'
+                        WHERE guild_id = $1 AND id = $2 AND status = 'pending'
+                        RETURNING sender_id, amount
+                    ), released AS (
+                        UPDATE accounts a SET reserved = a.reserved - t.amount
+                        FROM trade t
+                        WHERE a.guild_id = $1 AND a.user_id = t.sender_id
                     )
-                    await conn.execute(
-                        'INSERT INTO transactions (user_id, amount, type) VALUES ($1, $2, $3)',
-                        trade['receiver_id'], trade['amount'], 'trade_received'
+                    SELECT EXISTS (SELECT 1 FROM trade)
+                ''', guild_id, trade_id)
+        return await self._execute_with_retry(operation)
+
+    @at_most_once
+    async def create_game(self, guild_id: int, game_type: str, creator_id: int, bet_amount: int):
+        """Escrow the creator's bet and open a game; returns its id, or None if
+        the creator's unreserved funds don't cover the bet"""
+        async def operation():
+            async with self._acquire() as conn:
+                return await conn.fetchval('''
+                    WITH hold AS (
+                        UPDATE accounts SET reserved = reserved + $4
+                        WHERE guild_id = $1 AND user_id = $3 AND $4 > 0 AND balance - reserved >= $4
+                        RETURNING user_id
                     )
-                    
-                    return True
+                    INSERT INTO active_games (guild_id, game_type, creator_id, bet_amount, status)
+                    SELECT $1, $2, $3, $4, 'open' FROM hold
+                    RETURNING id
+                ''', guild_id, game_type, creator_id, bet_amount)
         return await self._execute_with_retry(operation)
 
-    async def cancel_trade(self, trade_id: int):
+    @read_your_writes
+    async def get_active_games(self, guild_id: int, game_type: str):
         async def operation():
-            async with self.pool.acquire() as conn:
-                return await conn.execute(
-                    'UPDATE trades SET status = \'cancelled\' WHERE id = $1 AND status = \'pending\'',
-                    trade_id
+            async with self._acquire() as conn:
+                return await conn.fetch(
+                    '''SELECT * FROM active_games 
+                       WHERE guild_id = $1 AND game_type = $2 AND status = 'open'
+                       ORDER BY created_at DESC''',
+                    guild_id, game_type
                 )
         return await self._execute_with_retry(operation)
 
-    async def create_game(self, game_type: str, creator_id: int, bet_amount: int):
+    @at_most_once
+    async def claim_game(self, guild_id: int, game_id: int, joiner_id: int):
+        """Claim an open game for joiner_id and settle it in one transaction.
+
+        The creator's bet is captured from escrow and the joiner's is checked
+        against their unreserved funds. Returns (outcome, game) where outcome
+        is 'settled', 'not_found', 'own_game' or 'insufficient_funds'. The game
+        row is only returned once settled; otherwise the game stays open.
+        """
+        async def operation():
+            async with self._acquire() as conn:
+                try:
+                    async with conn.transaction():
+                        # Only one joiner can move the row out of 'open'
+                        game = await conn.fetchrow('''
+                            UPDATE active_games SET status = 'settling', joiner_id = $3
+                            WHERE guild_id = $1 AND id = $2 AND status = 'open'
+                            RETURNING *
+                        ''', guild_id, game_id, joiner_id)
+                        if game is None:
+                            return 'not_found', None, None, None
+                        if game['creator_id'] == joiner_id:
+                            raise _Rollback('own_game')
+
+                        creator_id = game['creator_id']
+                        winner = random.choice([creator_id, joiner_id])
+                        result = await conn.fetchrow(
+                            SETTLE_GAME_SQL, guild_id, creator_id, joiner_id, winner,
+                            game['bet_amount'], game['game_type'], not self.ledger.write_behind
+                        )
+                        if result is None:
+                            raise _Rollback('insufficient_funds')
+
+                        settled = await conn.fetchrow('''
+                            UPDATE active_games
+                            SET status = 'finished', winner_id = $3, settled_at = CURRENT_TIMESTAMP
+                            WHERE guild_id = $1 AND id = $2
+                            RETURNING *
+                        ''', guild_id, game_id, winner)
+                        balances = {
+                            creator_id: (result['creator_balance'], result['creator_version']),
+                            joiner_id: (result['joiner_balance'], result['joiner_version']),
+                        }
+                        return 'settled', settled, balances, result['ledger_ts']
+                except _Rollback as e:
+                    return e.outcome, None, None, None
+
+        outcome, game, balances, ledger_ts = await self._execute_with_retry(operation)
+        if balances:
+            if self.ledger.write_behind:
+                await self.ledger.append([
+                    (guild_id, player, game['bet_amount'] if player == game['winner_id'] else -game['bet_amount'],
+                     f"{game['game_type']}_{'won' if player == game['winner_id'] else 'lost'}", ledger_ts)
+                    for player in (game['creator_id'], game['joiner_id'])
+                ])
+            self._publish_balances(guild_id, balances)
+            self._publish_game(guild_id, game)
+        return outcome, game
+
+    async def expire_games(self, max_age: float, limit: int):
+        """Expire up to `limit` open games older than max_age seconds, in any
+        economy, and release their escrowed bets; returns the number expired"""
+        async def operation():
+            async with self._acquire() as conn:
+                return await conn.fetchval('''
+                    WITH expired AS (
+                        UPDATE active_games SET status = 'expired'
+                        WHERE (guild_id, id) IN (
+                            SELECT guild_id, id FROM active_games
+                            WHERE status = 'open'
+                              AND created_at < CURRENT_TIMESTAMP - make_interval(secs => $1)
+                            ORDER BY created_at
+                            LIMIT $2
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING guild_id, creator_id, bet_amount
+                    ), released AS (
+                        UPDATE accounts a SET reserved = a.reserved - r.amount
+                        FROM (SELECT guild_id, creator_id, SUM(bet_amount) AS amount
+                              FROM expired GROUP BY guild_id, creator_id) r
+                        WHERE a.guild_id = r.guild_id AND a.user_id = r.creator_id
+                    )
+                    SELECT COUNT(*) FROM expired
+                ''', float(max_age), limit)
+        return await self._execute_with_retry(operation)
+
+    async def expire_trades(self, max_age: float, limit: int):
+        """Expire up to `limit` pending trades older than max_age seconds, in any
+        economy, and release their escrowed amounts; returns the number expired"""
+        async def operation():
+            async with self._acquire() as conn:
+                return await conn.fetchval('''
+                    WITH expired AS (
+                        UPDATE trades SET status = 'expired'
+                        WHERE (guild_id, id) IN (
+                            SELECT guild_id, id FROM trades
+                            WHERE status = 'pending'
+                              AND created_at < CURRENT_TIMESTAMP - make_interval(secs => $1)
+                            ORDER BY created_at
+                            LIMIT $2
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING guild_id, sender_id, amount
+                    ), released AS (
+                        UPDATE accounts a SET reserved = a.reserved - r.amount
+                        FROM (SELECT guild_id, sender_id, SUM(amount) AS amount
+                              FROM expired GROUP BY guild_id, sender_id) r
+                        WHERE a.guild_id = r.guild_id AND a.user_id = r.sender_id
+                    )
+                    SELECT COUNT(*) FROM expired
+                ''', float(max_age), limit)
+        return await self._execute_with_retry(operation)
+
+    async def get_total_currency_supply(self, guild_id: int = None):
         async def operation():
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
+                if guild_id is None:
+                    return await conn.fetchval('SELECT COALESCE(SUM(amount), 0)::bigint FROM currency_supply')
                 return await conn.fetchval(
-                    '''INSERT INTO active_games (game_type, creator_id, bet_amount, status)
-                       VALUES ($1, $2, $3, 'open')
-                       RETURNING id''',
-                    game_type, creator_id, bet_amount
+                    'SELECT COALESCE(SUM(amount), 0)::bigint FROM currency_supply WHERE guild_id = $1',
+                    guild_id
                 )
         return await self._execute_with_retry(operation)
 
-    async def get_active_games(self, game_type: str):
+    async def reconcile_currency_supply(self, fix: bool = False):
+        """Compare every economy's supply counter with a scan of its balances.
+
+        All sums come from one snapshot, so the drift is exact even while
+        writes continue. With fix=True each economy's drift is subtracted from
+        its counter as a delta, which stays correct for writes made after the
+        snapshot. Returns counter, actual and drift summed over every economy,
+        plus the number of economies that drifted.
+        """
         async def operation():
-            async with self.pool.acquire() as conn:
-                return await conn.fetch(
-                    '''SELECT * FROM active_games 
-                       WHERE game_type = $1 AND status = 'open'
-                       ORDER BY created_at DESC''',
-                    game_type
-                )
+            async with self._acquire() as conn:
+                async with conn.transaction(isolation='repeatable_read', readonly=True):
+                    rows = await conn.fetch('''
+                        SELECT guild_id, COALESCE(c.counter, 0)::bigint AS counter,
+                               COALESCE(a.actual, 0)::bigint AS actual
+                        FROM (SELECT guild_id, SUM(amount) AS counter FROM currency_supply GROUP BY guild_id) c
+                        FULL JOIN (SELECT guild_id, SUM(balance) AS actual FROM accounts GROUP BY guild_id) a
+                            USING (guild_id)
+                    ''')
+                drifted = {row['guild_id']: row['counter'] - row['actual']
+                           for row in rows if row['counter'] != row['actual']}
+                if fix and drifted:
+                    await conn.execute('''
+                        INSERT INTO currency_supply (guild_id, slot, amount)
+                        SELECT guild_id, 0, -drift FROM unnest($1::bigint[], $2::bigint[]) AS d(guild_id, drift)
+                        ON CONFLICT (guild_id, slot) DO UPDATE
+                        SET amount = currency_supply.amount + EXCLUDED.amount
+                    ''', list(drifted.keys()), list(drifted.values()))
+                counter = sum(row['counter'] for row in rows)
+                actual = sum(row['actual'] for row in rows)
+                return {'counter': counter, 'actual': actual, 'drift': counter - actual,
+                        'drifted_economies': len(drifted)}
         return await self._execute_with_retry(operation)
 
-    async def get_total_currency_supply(self):
+    async def reconcile_ledger(self, lag: float = 300):
+        """Check every balance against the ledger, reading only rows after the checkpoints.
+
+        Each account's expected balance is its checkpoint plus the ledger rows
+        after folded_id, compared in one snapshot, so sync-mode writes never
+        show up as drift. Rows up to the id sequence value seen by the
+        previous run are then folded into the checkpoints, once that run is
+        more than `lag` seconds old: a transaction still holding a lower id
+        could otherwise commit after the fold and be skipped forever.
+        Returns accounts, scanned, mismatched and folded_id.
+        """
+        if self.ledger.write_behind:
+            await self.ledger.flush()  # narrow the window where balances lead the ledger
+
         async def operation():
-            async with self.pool.acquire() as conn:
-                return await conn.fetchval('SELECT SUM(balance) FROM accounts')
+            async with self._acquire() as conn:
+                async with conn.transaction():
+                    # FOR UPDATE serializes runs from concurrent bot processes
+                    state = await conn.fetchrow('''
+                        SELECT folded_id, pending_id, pending_at,
+                               pending_at <= LOCALTIMESTAMP - make_interval(secs => $1) AS settled
+                        FROM ledger_reconcile_state FOR UPDATE
+                    ''', float(lag))
+                    fold_to = state['pending_id'] if state['settled'] else state['folded_id']
+                    result = await conn.fetchrow('''
+                        WITH delta AS (
+                            SELECT guild_id, user_id, SUM(amount) AS amount, COUNT(*) AS num_rows,
+                                   COALESCE(SUM(amount) FILTER (WHERE id <= $2), 0) AS folded
+                            FROM transactions
+                            WHERE id > $1
+                            GROUP BY guild_id, user_id
+                        ), compared AS (
+                            SELECT a.guild_id, a.user_id, c.user_id IS NULL AS missing, c.drift AS old_drift,
+                                   COALESCE(c.balance, 0) + COALESCE(s.amount, 0) + COALESCE(d.folded, 0) AS folded_balance,
+                                   a.balance - COALESCE(c.balance, 0) - COALESCE(s.amount, 0) - COALESCE(d.amount, 0) AS drift,
+                                   COALESCE(d.folded, 0) <> 0 OR s.amount IS NOT NULL AS moved
+                            FROM accounts a
+                            LEFT JOIN ledger_checkpoints c ON c.guild_id = a.guild_id AND c.user_id = a.user_id
+                            -- Archived months are far older than folded_id, so only a
+                            -- checkpoint being seeded has to add them
+                            LEFT JOIN ledger_snapshots s
+                                ON s.guild_id = a.guild_id AND s.user_id = a.user_id AND c.user_id IS NULL
+                            LEFT JOIN delta d ON d.guild_id = a.guild_id AND d.user_id = a.user_id
+                        ), saved AS (
+                            INSERT INTO ledger_checkpoints (guild_id, user_id, balance, last_id, drift, drift_since, checked_at)
+                            SELECT guild_id, user_id, folded_balance, $2, drift,
+                                   CASE WHEN drift <> 0 THEN LOCALTIMESTAMP END, LOCALTIMESTAMP
+                            FROM compared
+                            WHERE missing OR moved OR drift <> old_drift
+                            ON CONFLICT (guild_id, user_id) DO UPDATE
+                            SET balance = EXCLUDED.balance,
+                                last_id = EXCLUDED.last_id,
+                                drift = EXCLUDED.drift,
+                                drift_since = CASE WHEN EXCLUDED.drift = 0 THEN NULL
+                                                   ELSE COALESCE(ledger_checkpoints.drift_since, EXCLUDED.drift_since) END,
+                                checked_at = EXCLUDED.checked_at
+                        )
+                        SELECT COUNT(*) AS accounts,
+                               COUNT(*) FILTER (WHERE drift <> 0) AS mismatched,
+                               (SELECT COALESCE(SUM(num_rows), 0) FROM delta)::bigint AS scanned
+                        FROM compared
+                    ''', state['folded_id'], fold_to, timeout=MAINTENANCE_TIMEOUT)
+                    if state['settled'] or state['pending_at'] is None:
+                        # Start the next lag window from the id sequence as of now
+                        await conn.execute('''
+                            UPDATE ledger_reconcile_state
+                            SET folded_id = $1, last_run_at = LOCALTIMESTAMP, pending_at = LOCALTIMESTAMP,
+                                pending_id = (SELECT CASE WHEN is_called THEN last_value ELSE 0 END
+                                              FROM transactions_id_seq)
+                        ''', fold_to)
+                    else:
+                        await conn.execute(
+                            'UPDATE ledger_reconcile_state SET last_run_at = LOCALTIMESTAMP'
+                        )
+                    return {**result, 'folded_id': fold_to}
         return await self._execute_with_retry(operation)
 
-    async def get_richest_users(self, limit=10):
+    @read_your_writes
+    async def get_ledger_mismatches(self, min_age: float = 0, limit: int = 20):
+        """Accounts whose balance has disagreed with the ledger for at least
+        min_age seconds as of the last reconciliation, largest drift first.
+        Each row carries guild_id, user_id, drift, drift_since and the overall total."""
         async def operation():
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
+                return await conn.fetch('''
+                    SELECT guild_id, user_id, drift, drift_since, COUNT(*) OVER () AS total
+                    FROM ledger_checkpoints
+                    WHERE drift <> 0 AND drift_since <= LOCALTIMESTAMP - make_interval(secs => $1)
+                    ORDER BY abs(drift) DESC, guild_id, user_id
+                    LIMIT $2
+                ''', float(min_age), limit)
+        return await self._execute_with_retry(operation)
+
+    async def get_richest_users(self, guild_id: int, limit=10):
+        async def operation():
+            async with self._acquire() as conn:
                 return await conn.fetch('''
                     SELECT user_id, balance 
                     FROM accounts 
+                    WHERE guild_id = $1
                     ORDER BY balance DESC 
-                    LIMIT $1
-                ''', limit)
+                    LIMIT $2
+                ''', guild_id, limit)
         return await self._execute_with_retry(operation)
 
-    async def get_transaction_volume(self, days=7):
+    @read_your_writes
+    async def get_all_balances(self, guild_id: int = None):
         async def operation():
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
+                if guild_id is None:
+                    return await conn.fetch('SELECT guild_id, user_id, balance, version FROM accounts')
+                return await conn.fetch(
+                    'SELECT guild_id, user_id, balance, version FROM accounts WHERE guild_id = $1', guild_id
+                )
+        return await self._execute_with_retry(operation)
+
+    async def get_transaction_volume(self, guild_id: int, days=7):
+        async def operation():
+            async with self._acquire() as conn:
+                # Reads the trigger-maintained rollup: at most `days` dates
                 return await conn.fetch('''
-                    SELECT DATE(timestamp) as date,
-                           COUNT(*) as num_transactions,
-                           SUM(ABS(amount)) as volume
-                    FROM transactions
-                    WHERE timestamp > CURRENT_TIMESTAMP - INTERVAL '$1 days'
-                    GROUP BY DATE(timestamp)
+                    SELECT date,
+                           SUM(num_transactions)::bigint as num_transactions,
+                           SUM(volume)::bigint as volume
+                    FROM transactions_daily
+                    WHERE guild_id = $1 AND date > CURRENT_DATE - $2::integer
+                    GROUP BY date
                     ORDER BY date DESC
-                ''', days)
+                ''', guild_id, days)
         return await self._execute_with_retry(operation)
 
-    async def get_trading_stats(self):
+    async def get_trading_stats(self, guild_id: int):
         async def operation():
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
                 return await conn.fetchrow('''
                     SELECT 
                         COUNT(*) as total_trades,
@@ -271,30 +996,312 @@ class Database:
                         COUNT(*) FILTER (WHERE status = 'cancelled') as cancelled_trades,
                         AVG(amount) FILTER (WHERE status = 'completed') as avg_trade_amount
                     FROM trades
-                ''')
+                    WHERE guild_id = $1
+                ''', guild_id)
         return await self._execute_with_retry(operation)
 
-    async def get_gambling_stats(self):
+    async def get_gambling_stats(self, guild_id: int):
         async def operation():
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
                 return await conn.fetchrow('''
                     SELECT 
                         COUNT(*) as total_games,
                         AVG(bet_amount) as avg_bet_amount,
                         MAX(bet_amount) as highest_bet
                     FROM active_games
-                    WHERE status != 'open'
+                    WHERE guild_id = $1 AND status = 'finished'
+                ''', guild_id)
+        return await self._execute_with_retry(operation)
+
+    async def get_user_names(self, user_ids, max_age: float):
+        """Return persisted {user_id: name} entries refreshed within max_age seconds"""
+        async def operation():
+            async with self._acquire() as conn:
+                rows = await conn.fetch('''
+                    SELECT user_id, name
+                    FROM user_names
+                    WHERE user_id = ANY($1::bigint[])
+                      AND updated_at > CURRENT_TIMESTAMP - make_interval(secs => $2)
+                ''', list(user_ids), float(max_age))
+                return {row['user_id']: row['name'] for row in rows}
+        return await self._execute_with_retry(operation)
+
+    async def save_user_names(self, names: dict):
+        async def operation():
+            async with self._acquire() as conn:
+                await conn.execute('''
+                    INSERT INTO user_names (user_id, name)
+                    SELECT * FROM unnest($1::bigint[], $2::text[])
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET name = EXCLUDED.name, updated_at = CURRENT_TIMESTAMP
+                ''', list(names.keys()), list(names.values()))
+        await self._execute_with_retry(operation)
+
+    async def copy_ledger_rows(self, batches):
+        """COPY [(batch_id, rows)] write-behind batches and record their ids atomically.
+
+        Batches already recorded in ledger_batches are skipped, which makes
+        replaying a journal, or retrying a flush whose COPY committed before
+        its connection dropped, idempotent. Returns the skipped batch ids.
+        """
+        async def operation():
+            async with self._acquire() as conn:
+                async with conn.transaction():
+                    skipped = {row['batch_id'] for row in await conn.fetch(
+                        'SELECT batch_id FROM ledger_batches WHERE batch_id = ANY($1::text[])',
+                        [batch_id for batch_id, _ in batches]
+                    )}
+                    new = [(batch_id, rows) for batch_id, rows in batches if batch_id not in skipped]
+                    records = [row for _, rows in new for row in rows]
+                    if records:
+                        await conn.copy_records_to_table('transactions', records=records, columns=LEDGER_COLUMNS)
+                    if new:
+                        await conn.execute(
+                            'INSERT INTO ledger_batches (batch_id) SELECT unnest($1::text[])',
+                            [batch_id for batch_id, _ in new]
+                        )
+                    return [batch_id for batch_id, _ in batches if batch_id in skipped]
+        return await self._execute_with_retry(operation)
+
+    async def purge_ledger_batches(self, max_age: float):
+        async def operation():
+            async with self._acquire() as conn:
+                await conn.execute(
+                    'DELETE FROM ledger_batches WHERE flushed_at < CURRENT_TIMESTAMP - make_interval(secs => $1)',
+                    float(max_age)
+                )
+        await self._execute_with_retry(operation)
+
+    async def connect_listener(self):
+        """Open a connection outside the pools for LISTEN, so a long-lived
+        subscription never holds a pooled connection"""
+        return await asyncpg.connect(
+            user=os.environ['PGUSER'],
+            password=os.environ['PGPASSWORD'],
+            database=os.environ['PGDATABASE'],
+            host=os.environ['PGHOST'],
+            port=os.environ['PGPORT'],
+            ssl='prefer',
+            server_settings={'application_name': LISTENER_APPLICATION_NAME}
+        )
+
+    async def notify(self, channel: str, payloads):
+        """Send every payload on channel in one round trip"""
+        async def operation():
+            async with self._acquire() as conn:
+                await conn.execute(
+                    'SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload',
+                    channel, list(payloads)
+                )
+        await self._execute_with_retry(operation)
+
+    @read_your_writes
+    async def get_state(self, key: str):
+        async def operation():
+            async with self._acquire() as conn:
+                return await conn.fetchval('SELECT value FROM bot_state WHERE key = $1', key)
+        return await self._execute_with_retry(operation)
+
+    async def set_state(self, key: str, value: str):
+        async def operation():
+            async with self._acquire() as conn:
+                await conn.execute('''
+                    INSERT INTO bot_state (key, value) VALUES ($1, $2)
+                    ON CONFLICT (key) DO UPDATE
+                    SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP
+                ''', key, value)
+        await self._execute_with_retry(operation)
+
+    async def close(self):
+        """Flush buffered ledger rows and close the pool"""
+        await self.ledger.stop()
+        if self._rebuild_task is not None:
+            await asyncio.gather(self._rebuild_task, return_exceptions=True)
+        if self.pool:
+            await self.pool.close()
+        if self.replica_pool:
+            await self.replica_pool.close()
+
+    @read_your_writes
+    async def get_active_cooldowns(self):
+        """Return every unexpired cooldown with expires_at as a unix timestamp"""
+        async def operation():
+            async with self._acquire() as conn:
+                return await conn.fetch('''
+                    SELECT user_id, command, EXTRACT(EPOCH FROM expires_at)::float8 AS expires_at
+                    FROM cooldowns
+                    WHERE expires_at > CURRENT_TIMESTAMP
                 ''')
         return await self._execute_with_retry(operation)
 
-    async def get_user_transaction_history(self, user_id: int, limit=10):
+    async def save_cooldowns(self, entries):
+        """Upsert (user_id, command, expires_at unix timestamp) entries in one statement"""
+        user_ids, commands, expiries = zip(*entries)
         async def operation():
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
+                await conn.execute('''
+                    INSERT INTO cooldowns (user_id, command, expires_at)
+                    SELECT user_id, command, to_timestamp(expires_at)
+                    FROM unnest($1::bigint[], $2::text[], $3::float8[]) AS t(user_id, command, expires_at)
+                    ON CONFLICT (user_id, command) DO UPDATE
+                    SET expires_at = EXCLUDED.expires_at
+                ''', list(user_ids), list(commands), list(expiries))
+        await self._execute_with_retry(operation)
+
+    async def purge_expired_cooldowns(self):
+        async def operation():
+            async with self._acquire() as conn:
+                await conn.execute('DELETE FROM cooldowns WHERE expires_at <= CURRENT_TIMESTAMP')
+        await self._execute_with_retry(operation)
+
+    async def get_user_transaction_history(self, guild_id: int, user_id: int, limit=10, before=None, after=None):
+        """Return up to `limit` ledger rows for a user, newest first.
+
+        `before` and `after` are (timestamp, id) keyset cursors: `before`
+        pages to older rows and `after` to the newer rows closest to it, so
+        every page is an index range scan however deep the user goes. The
+        plain timestamp bound lets Postgres prune ledger partitions on the
+        far side of the cursor.
+        """
+        async def operation():
+            async with self._acquire() as conn:
+                if after is not None:
+                    rows = await conn.fetch('''
+                        SELECT id, type, amount, timestamp
+                        FROM transactions
+                        WHERE guild_id = $1 AND user_id = $2 AND (timestamp, id) > ($3, $4) AND timestamp >= $3
+                        ORDER BY timestamp, id
+                        LIMIT $5
+                    ''', guild_id, user_id, *after, limit)
+                    return rows[::-1]
+                if before is not None:
+                    return await conn.fetch('''
+                        SELECT id, type, amount, timestamp
+                        FROM transactions
+                        WHERE guild_id = $1 AND user_id = $2 AND (timestamp, id) < ($3, $4) AND timestamp <= $3
+                        ORDER BY timestamp DESC, id DESC
+                        LIMIT $5
+                    ''', guild_id, user_id, *before, limit)
                 return await conn.fetch('''
-                    SELECT type, amount, timestamp
+                    SELECT id, type, amount, timestamp
                     FROM transactions
-                    WHERE user_id = $1
-                    ORDER BY timestamp DESC
-                    LIMIT $2
-                ''', user_id, limit)
-        return await self._execute_with_retry(operation)
\ No newline at end of file
+                    WHERE guild_id = $1 AND user_id = $2
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT $3
+                ''', guild_id, user_id, limit)
+        return await self._execute_with_retry(operation)
+
+    async def iter_user_transactions(self, guild_id: int, user_id: int, batch_size: int = 1000):
+        """Yield every ledger row for a user, oldest first, from a server-side cursor.
+
+        Only `batch_size` rows are held in memory at a time. The stream is not
+        retried: an error part way through is raised to the caller. It still
+        reports to the circuit breaker and the per-method metrics, as
+        _execute_with_retry does for single calls.
+        """
+        method = 'iter_user_transactions'
+        self.breaker.before_call()
+        start = time.perf_counter()
+        try:
+            # Passed explicitly: a contextvar set here would leak to the caller between rows
+            async with self._acquire(method) as conn:
+                async with conn.transaction(readonly=True):
+                    async for row in conn.cursor('''
+                        SELECT id, type, amount, timestamp
+                        FROM transactions
+                        WHERE guild_id = $1 AND user_id = $2
+                        ORDER BY timestamp, id
+                    ''', guild_id, user_id, prefetch=batch_size):
+                        yield row
+        except GeneratorExit:
+            # The caller stopped reading early; the database itself was fine
+            self.breaker.record_success()
+            raise
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            metrics.incr('db_errors_total', method=method)
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            metrics.observe('db_call_seconds', time.perf_counter() - start, method=method)
+
+    async def ensure_ledger_partitions(self, months_ahead: int = 2):
+        """Create the monthly ledger partitions from this month through months_ahead"""
+        async def operation():
+            async with self._acquire() as conn:
+                await conn.execute('''
+                    SELECT ensure_transactions_partition(
+                        (date_trunc('month', CURRENT_DATE) + make_interval(months => g))::date
+                    )
+                    FROM generate_series(0, $1) g
+                ''', months_ahead)
+        await self._execute_with_retry(operation)
+
+    async def get_archivable_partitions(self, retain_months: int):
+        """Names of monthly ledger partitions that ended more than retain_months ago, oldest first"""
+        async def operation():
+            async with self._acquire() as conn:
+                rows = await conn.fetch('''
+                    SELECT c.relname
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'transactions'::regclass
+                ''')
+                cutoff = await conn.fetchval(
+                    "SELECT (date_trunc('month', CURRENT_DATE) - make_interval(months => $1))::date",
+                    retain_months
+                )
+                names = [row['relname'] for row in rows if LEDGER_PARTITION_RE.match(row['relname'])]
+                # A partition named for month M ends at M + 1, which must not be after the cutoff
+                return sorted(name for name in names if _partition_bounds(name)[1].date() <= cutoff)
+        return await self._execute_with_retry(operation)
+
+    async def archive_ledger_partition(self, name: str, export_path: str = None):
+        """Compact a monthly ledger partition into ledger_snapshots and remove it from the ledger.
+
+        With export_path the rows are first written there as gzipped CSV and
+        the partition is dropped; without it the partition is only detached
+        and kept as a standalone table. Writes to the partition are blocked
+        while it is archived. Returns the number of rows archived.
+        """
+        if not LEDGER_PARTITION_RE.match(name):
+            raise ValueError(f"Not a ledger partition: {name!r}")
+        range_start, range_end = _partition_bounds(name)
+
+        async def operation():
+            async with self._acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(f'LOCK TABLE "{name}" IN SHARE MODE')
+                    if export_path is not None:
+                        await _export_table(conn, name, export_path)
+                    num_rows = await conn.fetchval(f'''
+                        WITH totals AS (
+                            SELECT guild_id, user_id, SUM(amount) AS amount, COUNT(*) AS num_rows, MAX(id) AS last_id
+                            FROM "{name}"
+                            WHERE user_id IS NOT NULL
+                            GROUP BY guild_id, user_id
+                        ), snapshots AS (
+                            INSERT INTO ledger_snapshots (guild_id, user_id, amount, num_rows, last_id, through)
+                            SELECT guild_id, user_id, amount, num_rows, last_id, $1 FROM totals
+                            ON CONFLICT (guild_id, user_id) DO UPDATE
+                            SET amount = ledger_snapshots.amount + EXCLUDED.amount,
+                                num_rows = ledger_snapshots.num_rows + EXCLUDED.num_rows,
+                                last_id = GREATEST(ledger_snapshots.last_id, EXCLUDED.last_id),
+                                through = GREATEST(ledger_snapshots.through, EXCLUDED.through),
+                                updated_at = CURRENT_TIMESTAMP
+                        )
+                        SELECT COALESCE(SUM(num_rows), 0)::bigint FROM totals
+                    ''', range_end, timeout=MAINTENANCE_TIMEOUT)
+                    await conn.execute('''
+                        INSERT INTO ledger_archives (partition_name, range_start, range_end, num_rows, export_path)
+                        VALUES ($1, $2, $3, $4, $5)
+                    ''', name, range_start, range_end, num_rows, export_path)
+                    await conn.execute(f'ALTER TABLE transactions DETACH PARTITION "{name}"')
+                    if export_path is not None:
+                        await conn.execute(f'DROP TABLE "{name}"')
+                    return num_rows
+        return await self._execute_with_retry(operation)
@@ -0,0 +1,422 @@
+import time
+import random
+import itertools
+from datetime import datetime, timedelta
+from storage import StorageBackend
+
+class MemoryDatabase(StorageBackend):
+    """In-memory storage backend for load tests, benchmarks and CI.
+
+    Mirrors the Postgres backend's semantics (escrow, guards, ledger rows,
+    the supply counter and the daily rollup) with plain dicts. No method
+    awaits between reading and writing state, so on a single event loop each
+    call is atomic and isolated just like the corresponding transaction.
+    Everything is lost when the process exits.
+    """
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.accounts = {}  # (guild_id, user_id) -> {'balance', 'reserved', 'version', 'created_at'}
+        self.transactions = []
+        self.transactions_daily = {}  # (guild_id, date, type) -> [num_transactions, volume]
+        self.trades = {}
+        self.games = {}
+        self.user_names = {}  # user_id -> (name, updated_at)
+        self.cooldowns = {}  # (user_id, command) -> expires_at unix timestamp
+        self.state = {}  # counterpart of the bot_state table
+        self.ledger_batches = {}  # batch_id -> flushed_at
+        self.bulk_adjustments = set()  # (batch_key, guild_id, user_id)
+        self.supply = {}  # guild_id -> amount, counterpart of the currency_supply table
+        self.ledger_checkpoints = {}  # (guild_id, user_id) -> {'balance', 'last_id', 'drift', 'drift_since'}
+        self._folded_rows = 0  # prefix of self.transactions already in ledger_checkpoints
+        self._transaction_ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._game_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def _insert_ledger(self, rows):
+        """Append (guild_id, user_id, amount, type, timestamp) rows and fold them into the daily rollup"""
+        for guild_id, user_id, amount, type, timestamp in rows:
+            self.transactions.append({
+                'id': next(self._transaction_ids),
+                'guild_id': guild_id,
+                'user_id': user_id,
+                'amount': amount,
+                'type': type,
+                'timestamp': timestamp,
+            })
+            totals = self.transactions_daily.setdefault((guild_id, timestamp.date(), type or ''), [0, 0])
+            totals[0] += 1
+            totals[1] += abs(amount)
+
+    def _mint(self, guild_id: int, amount: int):
+        self.supply[guild_id] = self.supply.get(guild_id, 0) + amount
+
+    def _credit(self, guild_id: int, user_id: int, amount: int):
+        """Change a balance and bump the account version, like every balance write in SQL"""
+        account = self.accounts[(guild_id, user_id)]
+        account['balance'] += amount
+        account['version'] += 1
+
+    def _published(self, guild_id: int, user_ids) -> dict:
+        """{user_id: (balance, version)} for _publish_balances"""
+        return {user_id: (self.accounts[(guild_id, user_id)]['balance'], self.accounts[(guild_id, user_id)]['version'])
+                for user_id in user_ids}
+
+    def _unreserved(self, guild_id: int, user_id: int) -> int:
+        account = self.accounts[(guild_id, user_id)]
+        return account['balance'] - account['reserved']
+
+    async def create_account(self, guild_id: int, user_id: int, initial_balance: int):
+        if (guild_id, user_id) in self.accounts:
+            raise ValueError(f"Account {user_id} already exists in economy {guild_id}")
+        now = datetime.now()
+        self.accounts[(guild_id, user_id)] = {'balance': initial_balance, 'reserved': 0, 'version': 0, 'created_at': now}
+        self._mint(guild_id, initial_balance)
+        self._insert_ledger([(guild_id, user_id, initial_balance, 'opening', now)])
+        self._publish_balances(guild_id, self._published(guild_id, [user_id]))
+
+    async def get_balance(self, guild_id: int, user_id: int):
+        account = self.accounts.get((guild_id, user_id))
+        return account['balance'] if account else None
+
+    async def update_balance(self, guild_id: int, user_id: int, amount: int):
+        account = self.accounts.get((guild_id, user_id))
+        if account is None or (amount < 0 and self._unreserved(guild_id, user_id) + amount < 0):
+            return None
+        self._credit(guild_id, user_id, amount)
+        self._mint(guild_id, amount)
+        self._insert_ledger([(guild_id, user_id, amount, 'update', datetime.now())])
+        self._publish_balances(guild_id, self._published(guild_id, [user_id]))
+        return account['balance']
+
+    async def bulk_update_balance(self, guild_id: int, batch_key: str, user_ids, amount: int, type: str):
+        balances = {}
+        now = datetime.now()
+        for user_id in dict.fromkeys(user_ids):
+            key = (guild_id, user_id)
+            if (key not in self.accounts or (batch_key, guild_id, user_id) in self.bulk_adjustments
+                    or (amount < 0 and self._unreserved(guild_id, user_id) + amount < 0)):
+                continue
+            self._credit(guild_id, user_id, amount)
+            self.bulk_adjustments.add((batch_key, guild_id, user_id))
+            balances[user_id] = self.accounts[key]['balance']
+        self._mint(guild_id, amount * len(balances))
+        self._insert_ledger([(guild_id, user_id, amount, type, now) for user_id in balances])
+        if balances:
+            self._publish_balances(guild_id, self._published(guild_id, balances))
+        return balances
+
+    async def transfer(self, guild_id: int, from_id: int, to_id: int, amount: int, type: str):
+        sender, receiver = (guild_id, from_id), (guild_id, to_id)
+        if (from_id == to_id or amount <= 0 or sender not in self.accounts or receiver not in self.accounts
+                or self._unreserved(guild_id, from_id) < amount):
+            return None
+        self._credit(guild_id, from_id, -amount)
+        self._credit(guild_id, to_id, amount)
+        now = datetime.now()
+        self._insert_ledger([(guild_id, from_id, -amount, f'{type}_sent', now),
+                             (guild_id, to_id, amount, f'{type}_received', now)])
+        result = {'from_balance': self.accounts[sender]['balance'], 'to_balance': self.accounts[receiver]['balance']}
+        self._publish_balances(guild_id, self._published(guild_id, [from_id, to_id]))
+        return result
+
+    async def create_trade(self, guild_id: int, sender_id: int, receiver_id: int, amount: int):
+        if (sender_id == receiver_id or amount <= 0 or (guild_id, sender_id) not in self.accounts
+                or (guild_id, receiver_id) not in self.accounts or self._unreserved(guild_id, sender_id) < amount):
+            return None
+        self.accounts[(guild_id, sender_id)]['reserved'] += amount
+        trade_id = next(self._trade_ids)
+        self.trades[trade_id] = {
+            'id': trade_id,
+            'guild_id': guild_id,
+            'sender_id': sender_id,
+            'receiver_id': receiver_id,
+            'amount': amount,
+            'status': 'pending',
+            'created_at': datetime.now(),
+        }
+        return trade_id
+
+    async def get_pending_trades(self, guild_id: int, user_id: int):
+        return [dict(trade) for trade in reversed(self.trades.values())
+                if trade['guild_id'] == guild_id and trade['receiver_id'] == user_id
+                and trade['status'] == 'pending']
+
+    def _pending_trade(self, guild_id: int, trade_id: int):
+        trade = self.trades.get(trade_id)
+        if trade is None or trade['guild_id'] != guild_id or trade['status'] != 'pending':
+            return None
+        return trade
+
+    async def execute_trade(self, guild_id: int, trade_id: int):
+        trade = self._pending_trade(guild_id, trade_id)
+        if trade is None:
+            return None
+        trade['status'] = 'completed'
+        sender, receiver, amount = trade['sender_id'], trade['receiver_id'], trade['amount']
+        self._credit(guild_id, sender, -amount)
+        self.accounts[(guild_id, sender)]['reserved'] -= amount
+        self._credit(guild_id, receiver, amount)
+        now = datetime.now()
+        self._insert_ledger([(guild_id, sender, -amount, 'trade_sent', now),
+                             (guild_id, receiver, amount, 'trade_received', now)])
+        result = {
+            'sender_id': sender,
+            'receiver_id': receiver,
+            'amount': amount,
+            'from_balance': self.accounts[(guild_id, sender)]['balance'],
+            'to_balance': self.accounts[(guild_id, receiver)]['balance'],
+        }
+        self._publish_balances(guild_id, self._published(guild_id, [sender, receiver]))
+        return result
+
+    async def cancel_trade(self, guild_id: int, trade_id: int):
+        trade = self._pending_trade(guild_id, trade_id)
+        if trade is None:
+            return False
+        trade['status'] = 'cancelled'
+        self.accounts[(guild_id, trade['sender_id'])]['reserved'] -= trade['amount']
+        return True
+
+    async def expire_trades(self, max_age: float, limit: int):
+        cutoff = datetime.now() - timedelta(seconds=max_age)
+        expired = sorted((trade for trade in self.trades.values()
+                          if trade['status'] == 'pending' and trade['created_at'] < cutoff),
+                         key=lambda trade: trade['created_at'])[:limit]
+        for trade in expired:
+            trade['status'] = 'expired'
+            self.accounts[(trade['guild_id'], trade['sender_id'])]['reserved'] -= trade['amount']
+        return len(expired)
+
+    async def create_game(self, guild_id: int, game_type: str, creator_id: int, bet_amount: int):
+        if (bet_amount <= 0 or (guild_id, creator_id) not in self.accounts
+                or self._unreserved(guild_id, creator_id) < bet_amount):
+            return None
+        self.accounts[(guild_id, creator_id)]['reserved'] += bet_amount
+        game_id = next(self._game_ids)
+        self.games[game_id] = {
+            'id': game_id,
+            'guild_id': guild_id,
+            'game_type': game_type,
+            'creator_id': creator_id,
+            'bet_amount': bet_amount,
+            'status': 'open',
+            'created_at': datetime.now(),
+            'joiner_id': None,
+            'winner_id': None,
+            'settled_at': None,
+        }
+        return game_id
+
+    async def get_active_games(self, guild_id: int, game_type: str):
+        return [dict(game) for game in reversed(self.games.values())
+                if game['guild_id'] == guild_id and game['game_type'] == game_type and game['status'] == 'open']
+
+    async def claim_game(self, guild_id: int, game_id: int, joiner_id: int):
+        game = self.games.get(game_id)
+        if game is None or game['guild_id'] != guild_id or game['status'] != 'open':
+            return 'not_found', None
+        creator_id, bet = game['creator_id'], game['bet_amount']
+        if creator_id == joiner_id:
+            return 'own_game', None
+        if (guild_id, joiner_id) not in self.accounts or self._unreserved(guild_id, joiner_id) < bet:
+            return 'insufficient_funds', None
+
+        winner = random.choice([creator_id, joiner_id])
+        now = datetime.now()
+        ledger = []
+        for player in (creator_id, joiner_id):
+            delta = bet if player == winner else -bet
+            self._credit(guild_id, player, delta)
+            ledger.append((guild_id, player, delta,
+                           f"{game['game_type']}_{'won' if player == winner else 'lost'}", now))
+        self.accounts[(guild_id, creator_id)]['reserved'] -= bet
+        self._insert_ledger(ledger)
+        game.update(status='finished', joiner_id=joiner_id, winner_id=winner, settled_at=now)
+        self._publish_balances(guild_id, self._published(guild_id, [creator_id, joiner_id]))
+        self._publish_game(guild_id, dict(game))
+        return 'settled', dict(game)
+
+    async def expire_games(self, max_age: float, limit: int):
+        cutoff = datetime.now() - timedelta(seconds=max_age)
+        expired = sorted((game for game in self.games.values()
+                          if game['status'] == 'open' and game['created_at'] < cutoff),
+                         key=lambda game: game['created_at'])[:limit]
+        for game in expired:
+            game['status'] = 'expired'
+            self.accounts[(game['guild_id'], game['creator_id'])]['reserved'] -= game['bet_amount']
+        return len(expired)
+
+    async def get_total_currency_supply(self, guild_id: int = None):
+        if guild_id is None:
+            return sum(self.supply.values())
+        return self.supply.get(guild_id, 0)
+
+    async def reconcile_currency_supply(self, fix: bool = False):
+        actual = {}
+        for (guild_id, _), account in self.accounts.items():
+            actual[guild_id] = actual.get(guild_id, 0) + account['balance']
+        drifted = {guild_id: self.supply.get(guild_id, 0) - actual.get(guild_id, 0)
+                   for guild_id in self.supply.keys() | actual.keys()
+                   if self.supply.get(guild_id, 0) != actual.get(guild_id, 0)}
+        counter, total = sum(self.supply.values()), sum(actual.values())
+        result = {'counter': counter, 'actual': total, 'drift': counter - total, 'drifted_economies': len(drifted)}
+        if fix:
+            for guild_id, drift in drifted.items():
+                self._mint(guild_id, -drift)
+        return result
+
+    async def reconcile_ledger(self, lag: float = 300):
+        # Every row is committed as soon as it is appended, so there is no lag window to wait out
+        new_rows = self.transactions[self._folded_rows:]
+        for row in new_rows:
+            checkpoint = self.ledger_checkpoints.setdefault(
+                (row['guild_id'], row['user_id']), {'balance': 0, 'last_id': 0, 'drift': 0, 'drift_since': None}
+            )
+            checkpoint['balance'] += row['amount']
+            checkpoint['last_id'] = row['id']
+        self._folded_rows = len(self.transactions)
+        now = datetime.now()
+        mismatched = 0
+        for key, account in self.accounts.items():
+            checkpoint = self.ledger_checkpoints.setdefault(
+                key, {'balance': 0, 'last_id': 0, 'drift': 0, 'drift_since': None}
+            )
+            checkpoint['drift'] = account['balance'] - checkpoint['balance']
+            if checkpoint['drift']:
+                mismatched += 1
+                checkpoint['drift_since'] = checkpoint['drift_since'] or now
+            else:
+                checkpoint['drift_since'] = None
+        return {'accounts': len(self.accounts), 'mismatched': mismatched, 'scanned': len(new_rows),
+                'folded_id': self.transactions[-1]['id'] if self.transactions else 0}
+
+    async def get_ledger_mismatches(self, min_age: float = 0, limit: int = 20):
+        cutoff = datetime.now() - timedelta(seconds=min_age)
+        rows = sorted(
+            ({'guild_id': guild_id, 'user_id': user_id, 'drift': checkpoint['drift'],
+              'drift_since': checkpoint['drift_since']}
+             for (guild_id, user_id), checkpoint in self.ledger_checkpoints.items()
+             if checkpoint['drift'] and checkpoint['drift_since'] <= cutoff),
+            key=lambda row: (-abs(row['drift']), row['guild_id'], row['user_id'])
+        )
+        return [{**row, 'total': len(rows)} for row in rows[:limit]]
+
+    async def get_richest_users(self, guild_id: int, limit=10):
+        accounts = ((user_id, account) for (guild, user_id), account in self.accounts.items() if guild == guild_id)
+        return [{'user_id': user_id, 'balance': account['balance']}
+                for user_id, account in sorted(accounts, key=lambda item: (-item[1]['balance'], item[0]))[:limit]]
+
+    async def get_all_balances(self, guild_id: int = None):
+        return [{'guild_id': guild, 'user_id': user_id, 'balance': account['balance'], 'version': account['version']}
+                for (guild, user_id), account in self.accounts.items() if guild_id in (None, guild)]
+
+    async def get_transaction_volume(self, guild_id: int, days=7):
+        cutoff = datetime.now().date() - timedelta(days=days)
+        by_date = {}
+        for (guild, date, _), (num_transactions, volume) in self.transactions_daily.items():
+            if guild == guild_id and date > cutoff:
+                totals = by_date.setdefault(date, [0, 0])
+                totals[0] += num_transactions
+                totals[1] += volume
+        return [{'date': date, 'num_transactions': totals[0], 'volume': totals[1]}
+                for date, totals in sorted(by_date.items(), reverse=True)]
+
+    async def get_trading_stats(self, guild_id: int):
+        trades = [trade for trade in self.trades.values() if trade['guild_id'] == guild_id]
+        completed = [trade['amount'] for trade in trades if trade['status'] == 'completed']
+        return {
+            'total_trades': len(trades),
+            'completed_trades': len(completed),
+            'cancelled_trades': sum(1 for trade in trades if trade['status'] == 'cancelled'),
+            'avg_trade_amount': sum(completed) / len(completed) if completed else None,
+        }
+
+    async def get_gambling_stats(self, guild_id: int):
+        bets = [game['bet_amount'] for game in self.games.values()
+                if game['guild_id'] == guild_id and game['status'] == 'finished']
+        return {
+            'total_games': len(bets),
+            'avg_bet_amount': sum(bets) / len(bets) if bets else None,
+            'highest_bet': max(bets) if bets else None,
+        }
+
+    async def get_user_transaction_history(self, guild_id: int, user_id: int, limit=10, before=None, after=None):
+        rows = [row for row in self.transactions if row['guild_id'] == guild_id and row['user_id'] == user_id]
+        key = lambda row: (row['timestamp'], row['id'])
+        if after is not None:
+            rows = sorted((row for row in rows if key(row) > tuple(after)), key=key)[:limit][::-1]
+        else:
+            if before is not None:
+                rows = [row for row in rows if key(row) < tuple(before)]
+            rows = sorted(rows, key=key, reverse=True)[:limit]
+        return [{'id': row['id'], 'type': row['type'], 'amount': row['amount'], 'timestamp': row['timestamp']}
+                for row in rows]
+
+    async def iter_user_transactions(self, guild_id: int, user_id: int, batch_size: int = 1000):
+        rows = sorted((row for row in self.transactions if row['guild_id'] == guild_id and row['user_id'] == user_id),
+                      key=lambda row: (row['timestamp'], row['id']))
+        for row in rows:
+            yield {'id': row['id'], 'type': row['type'], 'amount': row['amount'], 'timestamp': row['timestamp']}
+
+    # The in-memory ledger is a single list; there are no partitions to manage
+
+    async def ensure_ledger_partitions(self, months_ahead: int = 2):
+        pass
+
+    async def get_archivable_partitions(self, retain_months: int):
+        return []
+
+    async def archive_ledger_partition(self, name: str, export_path: str = None):
+        raise ValueError(f"Not a ledger partition: {name!r}")
+
+    async def get_user_names(self, user_ids, max_age: float):
+        cutoff = datetime.now() - timedelta(seconds=max_age)
+        return {user_id: self.user_names[user_id][0] for user_id in user_ids
+                if user_id in self.user_names and self.user_names[user_id][1] > cutoff}
+
+    async def save_user_names(self, names: dict):
+        now = datetime.now()
+        for user_id, name in names.items():
+            self.user_names[user_id] = (name, now)
+
+    async def get_active_cooldowns(self):
+        now = time.time()
+        return [{'user_id': user_id, 'command': command, 'expires_at': expires_at}
+                for (user_id, command), expires_at in self.cooldowns.items() if expires_at > now]
+
+    async def save_cooldowns(self, entries):
+        for user_id, command, expires_at in entries:
+            self.cooldowns[(user_id, command)] = expires_at
+
+    async def purge_expired_cooldowns(self):
+        now = time.time()
+        self.cooldowns = {key: expires_at for key, expires_at in self.cooldowns.items() if expires_at > now}
+
+    async def copy_ledger_rows(self, batches):
+        skipped = []
+        now = datetime.now()
+        for batch_id, rows in batches:
+            if batch_id in self.ledger_batches:
+                skipped.append(batch_id)
+                continue
+            self._insert_ledger(rows)
+            self.ledger_batches[batch_id] = now
+        return skipped
+
+    async def purge_ledger_batches(self, max_age: float):
+        cutoff = datetime.now() - timedelta(seconds=max_age)
+        self.ledger_batches = {batch_id: flushed_at for batch_id, flushed_at in self.ledger_batches.items()
+                               if flushed_at >= cutoff}
+
+    async def get_state(self, key: str):
+        return self.state.get(key)
+
+    async def set_state(self, key: str, value: str):
+        self.state[key] = value
@@ -0,0 +1,42 @@
+-- Baseline schema. Uses IF NOT EXISTS so databases created before the
+-- migration runner existed are adopted without changes.
+
+CREATE TABLE IF NOT EXISTS accounts (
+    user_id BIGINT PRIMARY KEY,
+    balance BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT,
+    amount BIGINT,
+    type VARCHAR(50),
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS active_games (
+    id SERIAL PRIMARY KEY,
+    game_type VARCHAR(50),
+    creator_id BIGINT,
+    bet_amount BIGINT,
+    status VARCHAR(20),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS trades (
+    id SERIAL PRIMARY KEY,
+    sender_id BIGINT,
+    receiver_id BIGINT,
+    amount BIGINT,
+    status VARCHAR(20),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (sender_id) REFERENCES accounts(user_id),
+    FOREIGN KEY (receiver_id) REFERENCES accounts(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS user_names (
+    user_id BIGINT PRIMARY KEY,
+    name TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
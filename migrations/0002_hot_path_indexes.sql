@@ -0,0 +1,20 @@
+-- Indexes for the query shapes the bot runs on every command.
+
+-- get_user_transaction_history: WHERE user_id = $1 ORDER BY timestamp DESC
+-- Covers the selected columns so history pages are index-only scans.
+CREATE INDEX IF NOT EXISTS transactions_user_timestamp_idx
+    ON transactions (user_id, timestamp DESC) INCLUDE (type, amount);
+
+-- get_pending_trades: WHERE receiver_id = $1 AND status = 'pending'
+CREATE INDEX IF NOT EXISTS trades_pending_receiver_idx
+    ON trades (receiver_id, created_at DESC)
+    WHERE status = 'pending';
+
+-- get_active_games: WHERE game_type = $1 AND status = 'open'
+CREATE INDEX IF NOT EXISTS active_games_open_type_idx
+    ON active_games (game_type, created_at DESC)
+    WHERE status = 'open';
+
+-- get_richest_users: ORDER BY balance DESC LIMIT n
+CREATE INDEX IF NOT EXISTS accounts_balance_idx
+    ON accounts (balance DESC) INCLUDE (user_id);
@@ -0,0 +1,42 @@
+-- Daily ledger rollup so /volume reads one row per day and type instead of
+-- aggregating the whole transactions table.
+
+CREATE TABLE IF NOT EXISTS transactions_daily (
+    date DATE NOT NULL,
+    type VARCHAR(50) NOT NULL,
+    num_transactions BIGINT NOT NULL DEFAULT 0,
+    volume BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (date, type)
+);
+
+-- Statement-level trigger: each ledger INSERT (including multi-row inserts
+-- and COPY) folds its rows into the rollup with one upsert, inside the same
+-- transaction as the insert. Rows are upserted in key order so concurrent
+-- writers lock rollup rows in the same order.
+CREATE OR REPLACE FUNCTION rollup_transactions_daily() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO transactions_daily (date, type, num_transactions, volume)
+    SELECT DATE(timestamp), COALESCE(type, ''), COUNT(*), COALESCE(SUM(ABS(amount)), 0)
+    FROM new_rows
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (date, type) DO UPDATE
+    SET num_transactions = transactions_daily.num_transactions + EXCLUDED.num_transactions,
+        volume = transactions_daily.volume + EXCLUDED.volume;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS transactions_daily_rollup ON transactions;
+CREATE TRIGGER transactions_daily_rollup
+    AFTER INSERT ON transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_transactions_daily();
+
+-- Backfill from the existing ledger. Creating the trigger above locks out
+-- concurrent inserts until this migration commits, so nothing is counted twice.
+TRUNCATE transactions_daily;
+INSERT INTO transactions_daily (date, type, num_transactions, volume)
+SELECT DATE(timestamp), COALESCE(type, ''), COUNT(*), COALESCE(SUM(ABS(amount)), 0)
+FROM transactions
+GROUP BY 1, 2;
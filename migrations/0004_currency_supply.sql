@@ -0,0 +1,18 @@
+-- Total supply counter, striped across rows so concurrent mints and burns
+-- for different users rarely contend on the same row. The supply is the
+-- sum of all stripes.
+
+CREATE TABLE IF NOT EXISTS currency_supply (
+    slot SMALLINT PRIMARY KEY,
+    amount BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO currency_supply (slot, amount)
+SELECT g, 0 FROM generate_series(0, 15) g
+ON CONFLICT (slot) DO NOTHING;
+
+-- Seed from the current balances, blocking balance writes while we scan.
+LOCK TABLE accounts IN SHARE MODE;
+UPDATE currency_supply SET amount = CASE WHEN slot = 0
+    THEN (SELECT COALESCE(SUM(balance), 0) FROM accounts)
+    ELSE 0 END;
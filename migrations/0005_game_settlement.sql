@@ -0,0 +1,5 @@
+-- Record who joined and who won each game so settlement can close it.
+
+ALTER TABLE active_games ADD COLUMN IF NOT EXISTS joiner_id BIGINT;
+ALTER TABLE active_games ADD COLUMN IF NOT EXISTS winner_id BIGINT;
+ALTER TABLE active_games ADD COLUMN IF NOT EXISTS settled_at TIMESTAMP;
@@ -0,0 +1,15 @@
+-- Escrow: funds promised to an open game or pending trade are held in
+-- accounts.reserved. Spendable balance is balance - reserved.
+
+ALTER TABLE accounts ADD COLUMN IF NOT EXISTS reserved BIGINT NOT NULL DEFAULT 0;
+
+-- NOT VALID skips legacy rows (some balances went negative before escrow),
+-- but every new write is checked.
+ALTER TABLE accounts DROP CONSTRAINT IF EXISTS accounts_reserved_check;
+ALTER TABLE accounts ADD CONSTRAINT accounts_reserved_check
+    CHECK (reserved >= 0 AND (reserved = 0 OR reserved <= balance)) NOT VALID;
+
+-- Games and trades opened before escrow hold no funds, so settling them would
+-- release a hold that was never taken. Cancel them; players can reopen.
+UPDATE active_games SET status = 'cancelled' WHERE status = 'open';
+UPDATE trades SET status = 'cancelled' WHERE status = 'pending';
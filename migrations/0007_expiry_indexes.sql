@@ -0,0 +1,10 @@
+-- Let the expiry scheduler find the oldest open games and pending trades
+-- without scanning settled rows.
+
+CREATE INDEX IF NOT EXISTS active_games_open_created_idx
+    ON active_games (created_at)
+    WHERE status = 'open';
+
+CREATE INDEX IF NOT EXISTS trades_pending_created_idx
+    ON trades (created_at)
+    WHERE status = 'pending';
@@ -0,0 +1,11 @@
+-- Command cooldowns, persisted so they survive restarts and can be shared
+-- between bot processes.
+
+CREATE TABLE IF NOT EXISTS cooldowns (
+    user_id BIGINT NOT NULL,
+    command VARCHAR(50) NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, command)
+);
+
+CREATE INDEX IF NOT EXISTS cooldowns_expires_at_idx ON cooldowns (expires_at);
@@ -0,0 +1,8 @@
+-- Batches written by the write-behind ledger. A batch id is recorded in the
+-- same transaction as its COPY, so journal replay can skip batches that
+-- already made it in.
+
+CREATE TABLE IF NOT EXISTS ledger_batches (
+    batch_id TEXT PRIMARY KEY,
+    flushed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
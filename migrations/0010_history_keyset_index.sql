@@ -0,0 +1,10 @@
+-- Keyset pagination for /history: pages are read with
+--   WHERE user_id = $1 AND (timestamp, id) < ($2, $3)
+--   ORDER BY timestamp DESC, id DESC
+-- so the index needs id as a tiebreaker for rows sharing a timestamp. It
+-- also serves /history export, which walks the same index forwards.
+CREATE INDEX IF NOT EXISTS transactions_user_timestamp_id_idx
+    ON transactions (user_id, timestamp DESC, id DESC) INCLUDE (type, amount);
+
+-- Superseded: the new index has the same leading columns
+DROP INDEX IF EXISTS transactions_user_timestamp_idx;
@@ -0,0 +1,10 @@
+-- Accounts already credited or debited by a bulk admin operation. The row is
+-- written in the same statement as the balance change, so rerunning an
+-- operation with the same key skips everyone it already reached.
+
+CREATE TABLE IF NOT EXISTS bulk_adjustments (
+    batch_key TEXT NOT NULL,
+    user_id BIGINT NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (batch_key, user_id)
+);
@@ -0,0 +1,91 @@
+-- Move the ledger to monthly range partitions on timestamp. New months are
+-- created ahead of time by ensure_transactions_partition (called at startup
+-- and by the archiver); the default partition only catches stray rows, which
+-- move into their month's partition once it is created. Old months are
+-- compacted into ledger_snapshots and detached or exported by the archiver.
+
+ALTER TABLE transactions RENAME TO transactions_legacy;
+DROP TRIGGER IF EXISTS transactions_daily_rollup ON transactions_legacy;
+
+CREATE TABLE transactions (
+    id BIGINT NOT NULL DEFAULT nextval('transactions_id_seq'),
+    user_id BIGINT,
+    amount BIGINT,
+    type VARCHAR(50),
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE transactions_default PARTITION OF transactions DEFAULT;
+
+CREATE OR REPLACE FUNCTION ensure_transactions_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+    start_ts TIMESTAMP := date_trunc('month', month);
+    end_ts TIMESTAMP := date_trunc('month', month) + INTERVAL '1 month';
+    part TEXT := 'transactions_' || to_char(start_ts, 'YYYY_MM');
+BEGIN
+    -- Serialize creators across bot processes
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_transactions_partition'));
+    IF to_regclass(part) IS NOT NULL
+       OR EXISTS (SELECT 1 FROM ledger_archives a WHERE a.partition_name = part) THEN
+        RETURN part;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE transactions INCLUDING DEFAULTS)', part);
+    -- Attaching fails if the default partition holds rows for this month, so move them first
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM transactions_default WHERE timestamp >= $1 AND timestamp < $2 RETURNING *)
+         INSERT INTO %I SELECT * FROM moved', part
+    ) USING start_ts, end_ts;
+    EXECUTE format(
+        'ALTER TABLE transactions ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        part, start_ts, end_ts
+    );
+    RETURN part;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Months archived by the archiver; their partitions are never recreated
+CREATE TABLE IF NOT EXISTS ledger_archives (
+    partition_name TEXT PRIMARY KEY,
+    range_start TIMESTAMP NOT NULL,
+    range_end TIMESTAMP NOT NULL,
+    num_rows BIGINT NOT NULL,
+    export_path TEXT,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-user totals of every archived ledger row, so sum(amount) over the
+-- live ledger plus the snapshot still equals the balance
+CREATE TABLE IF NOT EXISTS ledger_snapshots (
+    user_id BIGINT PRIMARY KEY,
+    amount BIGINT NOT NULL DEFAULT 0,
+    num_rows BIGINT NOT NULL DEFAULT 0,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    through TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+SELECT ensure_transactions_partition(month::date)
+FROM generate_series(
+    date_trunc('month', LEAST((SELECT MIN(timestamp) FROM transactions_legacy), CURRENT_TIMESTAMP)),
+    date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '1 month',
+    INTERVAL '1 month'
+) month;
+
+-- Rows without a timestamp sort before everything else and land in the default partition
+INSERT INTO transactions (id, user_id, amount, type, timestamp)
+SELECT id, user_id, amount, type, COALESCE(timestamp, '-infinity')
+FROM transactions_legacy;
+
+ALTER SEQUENCE transactions_id_seq AS BIGINT OWNED BY NONE;
+DROP TABLE transactions_legacy;
+ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id;
+
+ALTER TABLE transactions ADD PRIMARY KEY (id, timestamp);
+
+CREATE INDEX IF NOT EXISTS transactions_user_timestamp_id_idx
+    ON transactions (user_id, timestamp DESC, id DESC) INCLUDE (type, amount);
+
+CREATE TRIGGER transactions_daily_rollup
+    AFTER INSERT ON transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_transactions_daily();
@@ -0,0 +1,42 @@
+-- Checkpointed reconciliation of balances against the ledger. For every
+-- account, balance must equal the sum of its ledger rows, archived ones
+-- included (ledger_snapshots). ledger_checkpoints holds that sum through
+-- last_id, so each reconciliation run only aggregates rows after it.
+
+-- Accounts used to open without a ledger row. Backfill the missing opening
+-- entry as whatever the ledger does not already explain, dated when the
+-- account was created.
+INSERT INTO transactions (user_id, amount, type, timestamp)
+SELECT a.user_id, a.balance - COALESCE(s.amount, 0) - COALESCE(t.amount, 0), 'opening',
+       COALESCE(a.created_at, '-infinity')
+FROM accounts a
+LEFT JOIN ledger_snapshots s ON s.user_id = a.user_id
+LEFT JOIN (SELECT user_id, SUM(amount) AS amount FROM transactions GROUP BY user_id) t
+       ON t.user_id = a.user_id
+WHERE a.balance - COALESCE(s.amount, 0) - COALESCE(t.amount, 0) <> 0;
+
+CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+    user_id BIGINT PRIMARY KEY,
+    balance BIGINT NOT NULL,        -- sum of the user's ledger rows with id <= last_id
+    last_id BIGINT NOT NULL,
+    drift BIGINT NOT NULL DEFAULT 0, -- accounts.balance minus the full ledger sum at the last run
+    drift_since TIMESTAMP,          -- first run that saw the current non-zero drift
+    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ledger_checkpoints_drift_idx
+    ON ledger_checkpoints (drift_since) WHERE drift <> 0;
+
+-- Single row tracking how far the checkpoints have been folded. pending_id is
+-- the ledger id sequence as of the previous run; it only becomes folded_id
+-- once it is old enough that no transaction holding a lower id can still
+-- commit. The first run has folded_id = 0 and seeds every checkpoint.
+CREATE TABLE IF NOT EXISTS ledger_reconcile_state (
+    singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+    folded_id BIGINT NOT NULL DEFAULT 0,
+    pending_id BIGINT NOT NULL DEFAULT 0,
+    pending_at TIMESTAMP,
+    last_run_at TIMESTAMP
+);
+
+INSERT INTO ledger_reconcile_state DEFAULT VALUES ON CONFLICT DO NOTHING;
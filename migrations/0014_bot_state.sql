@@ -0,0 +1,8 @@
+-- Small key/value store for process-wide bot state, such as the hash of the
+-- last synced application-command tree. Shared by every bot process.
+
+CREATE TABLE IF NOT EXISTS bot_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
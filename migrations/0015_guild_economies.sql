@@ -0,0 +1,158 @@
+-- Per-guild economies. Accounts, trades and games are keyed by
+-- (guild_id, user_id) and hash-partitioned on guild_id, so every per-guild
+-- query is pruned to one partition and its indexes. The ledger keeps its
+-- monthly range partitions and leads its indexes with guild_id instead.
+-- guild_id 0 is the shared economy used in global mode; everything that
+-- existed before this migration moves there.
+
+-- Accounts
+
+ALTER TABLE accounts RENAME TO accounts_legacy;
+
+CREATE TABLE accounts (
+    guild_id BIGINT NOT NULL DEFAULT 0,
+    user_id BIGINT NOT NULL,
+    balance BIGINT NOT NULL DEFAULT 0,
+    reserved BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY HASH (guild_id);
+
+-- Trades and games
+
+ALTER TABLE trades RENAME TO trades_legacy;
+
+CREATE TABLE trades (
+    id INTEGER NOT NULL DEFAULT nextval('trades_id_seq'),
+    guild_id BIGINT NOT NULL DEFAULT 0,
+    sender_id BIGINT,
+    receiver_id BIGINT,
+    amount BIGINT,
+    status VARCHAR(20),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY HASH (guild_id);
+
+ALTER TABLE active_games RENAME TO active_games_legacy;
+
+CREATE TABLE active_games (
+    id INTEGER NOT NULL DEFAULT nextval('active_games_id_seq'),
+    guild_id BIGINT NOT NULL DEFAULT 0,
+    game_type VARCHAR(50),
+    creator_id BIGINT,
+    bet_amount BIGINT,
+    status VARCHAR(20),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    joiner_id BIGINT,
+    winner_id BIGINT,
+    settled_at TIMESTAMP
+) PARTITION BY HASH (guild_id);
+
+-- 16 hash partitions per table; a guild's rows always land in the same one
+DO $$
+DECLARE
+    parent TEXT;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['accounts', 'trades', 'active_games'] LOOP
+        FOR i IN 0..15 LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+                parent || '_p' || i, parent, i
+            );
+        END LOOP;
+    END LOOP;
+END $$;
+
+INSERT INTO accounts (guild_id, user_id, balance, reserved, created_at)
+SELECT 0, user_id, balance, reserved, created_at FROM accounts_legacy;
+
+INSERT INTO trades (id, guild_id, sender_id, receiver_id, amount, status, created_at)
+SELECT id, 0, sender_id, receiver_id, amount, status, created_at FROM trades_legacy;
+
+INSERT INTO active_games (id, guild_id, game_type, creator_id, bet_amount, status, created_at,
+                          joiner_id, winner_id, settled_at)
+SELECT id, 0, game_type, creator_id, bet_amount, status, created_at, joiner_id, winner_id, settled_at
+FROM active_games_legacy;
+
+-- Keep the id sequences when their SERIAL columns are dropped
+ALTER SEQUENCE trades_id_seq OWNED BY NONE;
+ALTER SEQUENCE active_games_id_seq OWNED BY NONE;
+DROP TABLE trades_legacy;
+DROP TABLE active_games_legacy;
+DROP TABLE accounts_legacy;
+ALTER SEQUENCE trades_id_seq OWNED BY trades.id;
+ALTER SEQUENCE active_games_id_seq OWNED BY active_games.id;
+
+-- Keys and indexes reuse the legacy names, so they are created once the legacy tables are gone
+ALTER TABLE accounts ADD PRIMARY KEY (guild_id, user_id);
+ALTER TABLE trades ADD PRIMARY KEY (guild_id, id);
+ALTER TABLE active_games ADD PRIMARY KEY (guild_id, id);
+
+-- Every escrow write keeps reserved within balance, so legacy rows already
+-- satisfy the check that migration 0006 added as NOT VALID
+ALTER TABLE accounts ADD CONSTRAINT accounts_reserved_check
+    CHECK (reserved >= 0 AND (reserved = 0 OR reserved <= balance));
+
+ALTER TABLE trades ADD FOREIGN KEY (guild_id, sender_id) REFERENCES accounts (guild_id, user_id);
+ALTER TABLE trades ADD FOREIGN KEY (guild_id, receiver_id) REFERENCES accounts (guild_id, user_id);
+
+-- get_richest_users: WHERE guild_id = $1 ORDER BY balance DESC LIMIT n
+CREATE INDEX accounts_guild_balance_idx
+    ON accounts (guild_id, balance DESC) INCLUDE (user_id);
+
+-- get_pending_trades: WHERE guild_id = $1 AND receiver_id = $2 AND status = 'pending'
+CREATE INDEX trades_pending_receiver_idx
+    ON trades (guild_id, receiver_id, created_at DESC)
+    WHERE status = 'pending';
+
+-- get_active_games: WHERE guild_id = $1 AND game_type = $2 AND status = 'open'
+CREATE INDEX active_games_open_type_idx
+    ON active_games (guild_id, game_type, created_at DESC)
+    WHERE status = 'open';
+
+-- The expiry sweeps cover every guild
+CREATE INDEX active_games_open_created_idx ON active_games (created_at) WHERE status = 'open';
+CREATE INDEX trades_pending_created_idx ON trades (created_at) WHERE status = 'pending';
+
+-- Ledger. A constant default adds the column without rewriting any partition.
+
+ALTER TABLE transactions ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX transactions_guild_user_timestamp_id_idx
+    ON transactions (guild_id, user_id, timestamp DESC, id DESC) INCLUDE (type, amount);
+DROP INDEX IF EXISTS transactions_user_timestamp_id_idx;
+
+-- Per-guild rollups, supply stripes, snapshots, checkpoints and bulk keys
+
+ALTER TABLE transactions_daily ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE transactions_daily DROP CONSTRAINT transactions_daily_pkey;
+ALTER TABLE transactions_daily ADD PRIMARY KEY (guild_id, date, type);
+
+CREATE OR REPLACE FUNCTION rollup_transactions_daily() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO transactions_daily (guild_id, date, type, num_transactions, volume)
+    SELECT guild_id, DATE(timestamp), COALESCE(type, ''), COUNT(*), COALESCE(SUM(ABS(amount)), 0)
+    FROM new_rows
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (guild_id, date, type) DO UPDATE
+    SET num_transactions = transactions_daily.num_transactions + EXCLUDED.num_transactions,
+        volume = transactions_daily.volume + EXCLUDED.volume;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Stripes for other guilds are created by the first write that touches them
+ALTER TABLE currency_supply ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE currency_supply DROP CONSTRAINT currency_supply_pkey;
+ALTER TABLE currency_supply ADD PRIMARY KEY (guild_id, slot);
+
+ALTER TABLE ledger_snapshots ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE ledger_snapshots DROP CONSTRAINT ledger_snapshots_pkey;
+ALTER TABLE ledger_snapshots ADD PRIMARY KEY (guild_id, user_id);
+
+ALTER TABLE ledger_checkpoints ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE ledger_checkpoints DROP CONSTRAINT ledger_checkpoints_pkey;
+ALTER TABLE ledger_checkpoints ADD PRIMARY KEY (guild_id, user_id);
+
+ALTER TABLE bulk_adjustments ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE bulk_adjustments DROP CONSTRAINT bulk_adjustments_pkey;
+ALTER TABLE bulk_adjustments ADD PRIMARY KEY (batch_key, guild_id, user_id);
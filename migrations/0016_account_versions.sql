@@ -0,0 +1,5 @@
+-- Per-account write counter. Every statement that changes a balance also
+-- sets version = version + 1 and returns it; the row lock orders concurrent
+-- writers, so a higher version is always the newer balance. Caches use it to
+-- drop results that arrive after a newer one.
+ALTER TABLE accounts ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
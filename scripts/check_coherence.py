@@ -0,0 +1,223 @@
+"""Verify that the invalidation bus keeps several bot processes' caches coherent.
+
+Creates a throwaway database next to PGDATABASE and starts --processes
+worker processes on it, each with its own Database, Leaderboard,
+CooldownStore and InvalidationBus, as a sharded deployment would. Writes
+made through one worker must show up in the others' balance caches,
+leaderboards and cooldowns, including after their LISTEN connections are
+killed. Exits non-zero on the first check that does not converge.
+
+    python scripts/check_coherence.py --processes 3
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database, LISTENER_APPLICATION_NAME
+from utils.leaderboard import Leaderboard
+from utils.cooldowns import CooldownStore
+from utils.coherence import InvalidationBus
+from utils.metrics import metrics
+
+GUILD = 7
+TIMEOUT = 5  # seconds a change may take to reach every worker
+
+WORKER_CONFIG = {
+    'coherence': {'flush_interval_ms': 10, 'reconnect_delay': 0.5, 'keepalive': 2},
+    'cooldowns': {'flush_interval': 0.2},
+}
+
+def connect_args(database):
+    return dict(
+        user=os.environ['PGUSER'], password=os.environ['PGPASSWORD'],
+        host=os.environ['PGHOST'], port=os.environ['PGPORT'], database=database
+    )
+
+# Worker side: one JSON command per stdin line, one JSON reply per stdout line
+
+async def worker():
+    db = Database(WORKER_CONFIG)
+    leaderboard = Leaderboard(db)
+    cooldowns = CooldownStore(db, WORKER_CONFIG)
+    bus = InvalidationBus(db, leaderboard, cooldowns, WORKER_CONFIG)
+    games_seen = []
+    bus.game_listeners.append(lambda guild_id, game: games_seen.append(game['id']))
+
+    await db.initialize()
+    await bus.start()
+    await cooldowns.load()
+    await leaderboard.resync()
+    leaderboard.loaded = True
+    cooldowns.start()
+
+    handlers = {
+        'create': lambda g, u, balance: db.create_account(g, u, balance),
+        'update': lambda g, u, amount: db.update_balance(g, u, amount),
+        'balance': lambda g, u: db.get_balance(g, u),
+        'game': lambda g, creator, bet: db.create_game(g, 'coinflip', creator, bet),
+        'claim': lambda g, game_id, joiner: db.claim_game(g, game_id, joiner),
+    }
+    loop = asyncio.get_running_loop()
+    print(json.dumps('ready'), flush=True)
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            break
+        command, *args = json.loads(line)
+        if command == 'exit':
+            break
+        if command in handlers:
+            result = await handlers[command](*args)
+            if command == 'claim':
+                result = result[0]
+        elif command == 'cached':
+            g, u = args
+            result = {'cached': db.balance_cache.get((g, u), count=False), 'rank': leaderboard.rank(g, u)}
+        elif command == 'cooldown':
+            result = cooldowns.trigger(*args)
+        elif command == 'remaining':
+            result = cooldowns.remaining(*args)
+        elif command == 'games_seen':
+            result = games_seen
+        elif command == 'reconnects':
+            result = metrics.counter('coherence_reconnects_total')
+        print(json.dumps(result), flush=True)
+
+    await cooldowns.stop()
+    await bus.stop()
+    await db.close()
+
+# Driver side
+
+class Worker:
+    def __init__(self, index, proc):
+        self.index = index
+        self.proc = proc
+
+    async def call(self, *command):
+        self.proc.stdin.write((json.dumps(command) + '\n').encode())
+        await self.proc.stdin.drain()
+        line = await self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError(f"worker {self.index} exited")
+        return json.loads(line)
+
+async def spawn(index):
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), '--worker',
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+    )
+    worker = Worker(index, proc)
+    if json.loads(await proc.stdout.readline()) != 'ready':
+        raise RuntimeError(f"worker {index} failed to start")
+    return worker
+
+async def eventually(description, workers, check):
+    """Poll check(worker) on every worker until it holds for all of them"""
+    deadline = asyncio.get_running_loop().time() + TIMEOUT
+    while True:
+        results = [await check(worker) for worker in workers]
+        if all(results):
+            print(f"ok   {description}")
+            return True
+        if asyncio.get_running_loop().time() > deadline:
+            lagging = [worker.index for worker, ok in zip(workers, results) if not ok]
+            print(f"FAIL {description} (workers {lagging})")
+            return False
+        await asyncio.sleep(0.05)
+
+async def sees_balance(worker, user_id, balance):
+    """The worker's cache and leaderboard both agree with balance"""
+    cached = await worker.call('cached', GUILD, user_id)
+    if cached['cached'] not in (None, balance) or not cached['rank'] or cached['rank'][1] != balance:
+        return False
+    return await worker.call('balance', GUILD, user_id) == balance
+
+async def on_cooldown(worker, user_id, command):
+    return await worker.call('remaining', user_id, command) > 3000
+
+async def run_checks(workers, admin, check_db):
+    first, *others = workers
+    # sees_balance reads through each worker's cache, so later writes have entries to invalidate
+    await first.call('create', GUILD, 1, 1000)
+    await first.call('create', GUILD, 2, 1000)
+    if not await eventually('new accounts reach every worker', others,
+                            lambda w: sees_balance(w, 1, 1000)):
+        return False
+
+    balance = await first.call('update', GUILD, 1, 250)
+    if not await eventually('a balance write invalidates the other caches', others,
+                            lambda w: sees_balance(w, 1, balance)):
+        return False
+
+    await others[0].call('cooldown', 1, 'rob', 3600)
+    if not await eventually('a cooldown reaches every worker', [first] + others[1:],
+                            lambda w: on_cooldown(w, 1, 'rob')):
+        return False
+
+    claimant = workers[-1]
+    game_id = await first.call('game', GUILD, 1, 100)
+    if await claimant.call('claim', GUILD, game_id, 2) != 'settled':
+        print("FAIL coinflip could not be claimed")
+        return False
+    balances = {user_id: await claimant.call('balance', GUILD, user_id) for user_id in (1, 2)}
+    async def sees_claim(worker):
+        return (game_id in await worker.call('games_seen')
+                and all([await sees_balance(worker, u, b) for u, b in balances.items()]))
+    if not await eventually('a game claim reaches every worker', workers[:-1], sees_claim):
+        return False
+
+    killed = await admin.fetchval('''
+        SELECT count(pg_terminate_backend(pid)) FROM pg_stat_activity
+        WHERE application_name = $1 AND datname = $2
+    ''', LISTENER_APPLICATION_NAME, check_db)
+    balance = await first.call('update', GUILD, 2, -50)
+    async def resynced(worker):
+        return await worker.call('reconnects') >= 1 and await sees_balance(worker, 2, balance)
+    return await eventually(f'workers resync after {killed} listeners are killed', others, resynced)
+
+async def main(processes):
+    base_db = os.environ['PGDATABASE']
+    check_db = f"{base_db}_coherence_check"
+
+    admin = await asyncpg.connect(**connect_args(base_db))
+    await admin.execute(f'DROP DATABASE IF EXISTS "{check_db}"')
+    await admin.execute(f'CREATE DATABASE "{check_db}"')
+
+    workers = []
+    try:
+        os.environ['PGDATABASE'] = check_db
+        # Migrate once up front so the workers don't queue on the migration lock
+        db = Database()
+        await db.initialize()
+        await db.close()
+        workers = [await spawn(i) for i in range(processes)]
+        ok = await run_checks(workers, admin, check_db)
+    finally:
+        for worker in workers:
+            if worker.proc.returncode is None:
+                try:
+                    await worker.call('exit')
+                except Exception:
+                    pass
+                await worker.proc.wait()
+        os.environ['PGDATABASE'] = base_db
+        await admin.execute(f'DROP DATABASE IF EXISTS "{check_db}"')
+        await admin.close()
+
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=3, help="worker processes (at least 2)")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        asyncio.run(worker())
+    else:
+        asyncio.run(main(max(2, args.processes)))
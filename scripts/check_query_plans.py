@@ -0,0 +1,174 @@
+"""Verify that the bot's hot queries use index scans on a seeded database.
+
+Creates a throwaway database next to PGDATABASE, applies the migrations,
+seeds it with realistic volumes, and EXPLAINs every hot query. Exits non-zero
+if any of them falls back to a sequential scan on its main table, or if
+a per-guild query is not pruned to its guild's hash partition.
+
+    python scripts/check_query_plans.py
+"""
+import os
+import re
+import sys
+import json
+import asyncio
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+
+# (description, table that must not be seq-scanned, query, args)
+# Keep these in sync with the corresponding Database methods.
+HOT_QUERIES = [
+    (
+        'get_user_transaction_history', 'transactions',
+        '''SELECT id, type, amount, timestamp FROM transactions
+           WHERE guild_id = $1 AND user_id = $2 ORDER BY timestamp DESC, id DESC LIMIT $3''',
+        (7, 42, 10),
+    ),
+    (
+        'get_user_transaction_history (older page)', 'transactions',
+        '''SELECT id, type, amount, timestamp FROM transactions
+           WHERE guild_id = $1 AND user_id = $2
+             AND (timestamp, id) < (CURRENT_TIMESTAMP - INTERVAL '30 days', 0)
+             AND timestamp <= CURRENT_TIMESTAMP - INTERVAL '30 days'
+           ORDER BY timestamp DESC, id DESC LIMIT $3''',
+        (7, 42, 10),
+    ),
+    (
+        'iter_user_transactions', 'transactions',
+        '''SELECT id, type, amount, timestamp FROM transactions
+           WHERE guild_id = $1 AND user_id = $2 ORDER BY timestamp, id''',
+        (7, 42),
+    ),
+    (
+        'get_balance', 'accounts',
+        'SELECT balance FROM accounts WHERE guild_id = $1 AND user_id = $2',
+        (7, 42),
+    ),
+    (
+        'get_pending_trades', 'trades',
+        '''SELECT * FROM trades
+           WHERE guild_id = $1 AND receiver_id = $2 AND status = 'pending'
+           ORDER BY created_at DESC''',
+        (7, 42),
+    ),
+    (
+        'get_active_games', 'active_games',
+        '''SELECT * FROM active_games
+           WHERE guild_id = $1 AND game_type = $2 AND status = 'open'
+           ORDER BY created_at DESC''',
+        (7, 'coinflip'),
+    ),
+    (
+        'get_richest_users', 'accounts',
+        'SELECT user_id, balance FROM accounts WHERE guild_id = $1 ORDER BY balance DESC LIMIT $2',
+        (7, 20),
+    ),
+]
+
+GUILDS = 50
+USERS_PER_GUILD = 2000
+
+SEED_SQL = f'''
+    SELECT ensure_transactions_partition((date_trunc('month', CURRENT_DATE) - make_interval(months => g))::date)
+    FROM generate_series(1, 3) g;
+
+    INSERT INTO accounts (guild_id, user_id, balance)
+    SELECT guild, u, (random() * 100000)::bigint
+    FROM generate_series(1, {GUILDS}) guild, generate_series(1, {USERS_PER_GUILD}) u;
+
+    INSERT INTO transactions (guild_id, user_id, amount, type, timestamp)
+    SELECT 1 + (random() * {GUILDS - 1})::int, 1 + (random() * {USERS_PER_GUILD - 1})::int,
+           (random() * 2000 - 1000)::bigint, 'update',
+           CURRENT_TIMESTAMP - random() * INTERVAL '90 days'
+    FROM generate_series(1, 200000);
+
+    INSERT INTO trades (guild_id, sender_id, receiver_id, amount, status, created_at)
+    SELECT 1 + (random() * {GUILDS - 1})::int,
+           1 + (random() * {USERS_PER_GUILD - 1})::int, 1 + (random() * {USERS_PER_GUILD - 1})::int,
+           (random() * 1000)::bigint,
+           CASE WHEN random() < 0.02 THEN 'pending' ELSE 'completed' END,
+           CURRENT_TIMESTAMP - random() * INTERVAL '90 days'
+    FROM generate_series(1, 50000);
+
+    INSERT INTO active_games (guild_id, game_type, creator_id, bet_amount, status, created_at)
+    SELECT 1 + (random() * {GUILDS - 1})::int, 'coinflip', 1 + (random() * {USERS_PER_GUILD - 1})::int,
+           (random() * 1000)::bigint,
+           CASE WHEN random() < 0.02 THEN 'open' ELSE 'finished' END,
+           CURRENT_TIMESTAMP - random() * INTERVAL '90 days'
+    FROM generate_series(1, 50000);
+
+    ANALYZE;
+'''
+
+PARTITION_RE = re.compile(r'^(transactions)_(?:\d{4}_\d{2}|default)$|^(accounts|trades|active_games)_p\d+$')
+
+def parent_table(relation):
+    """Report ledger months and guild hash partitions as their parent table"""
+    match = PARTITION_RE.match(relation)
+    return (match.group(1) or match.group(2)) if match else relation
+
+def scanned_relations(plan):
+    """Yield (node type, relation name) for every scan node in a JSON plan.
+    Scans the planner costs at zero (empty future or default partitions) are skipped."""
+    if 'Relation Name' in plan and plan.get('Total Cost', 0) > 0:
+        yield plan['Node Type'], plan['Relation Name']
+    for child in plan.get('Plans', []):
+        yield from scanned_relations(child)
+
+def check_plan(plan, table):
+    """Problems with a per-guild query's plan: a seq scan on its table, or
+    hash partitions of other guilds left in the plan"""
+    scans = list(scanned_relations(plan))
+    problems = []
+    if any(node == 'Seq Scan' and parent_table(relation) == table for node, relation in scans):
+        problems.append(f'seq scan on {table}')
+    partitions = {relation for _, relation in scans if re.match(rf'^{table}_p\d+$', relation)}
+    if len(partitions) > 1:
+        problems.append(f'{len(partitions)} guild partitions scanned')
+    return problems
+
+def connect_args(database):
+    return dict(
+        user=os.environ['PGUSER'],
+        password=os.environ['PGPASSWORD'],
+        host=os.environ['PGHOST'],
+        port=os.environ['PGPORT'],
+        database=database,
+    )
+
+async def main():
+    base_db = os.environ['PGDATABASE']
+    check_db = f"{base_db}_plan_check"
+
+    admin = await asyncpg.connect(**connect_args(base_db))
+    await admin.execute(f'DROP DATABASE IF EXISTS "{check_db}"')
+    await admin.execute(f'CREATE DATABASE "{check_db}"')
+
+    failures = []
+    try:
+        os.environ['PGDATABASE'] = check_db
+        db = Database()
+        await db.initialize()
+        async with db.pool.acquire() as conn:
+            await conn.execute(SEED_SQL)
+            for name, table, query, args in HOT_QUERIES:
+                plan = json.loads(await conn.fetchval(f'EXPLAIN (FORMAT JSON) {query}', *args))
+                problems = check_plan(plan[0]['Plan'], table)
+                status = 'FAIL' if problems else 'ok'
+                print(f"{status:4} {name}: {', '.join(problems) or 'index scan'}")
+                if problems:
+                    failures.append(name)
+        await db.pool.close()
+    finally:
+        os.environ['PGDATABASE'] = base_db
+        await admin.execute(f'DROP DATABASE IF EXISTS "{check_db}"')
+        await admin.close()
+
+    if failures:
+        print(f"{len(failures)} hot queries have bad plans: {', '.join(failures)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
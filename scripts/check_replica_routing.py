@@ -0,0 +1,120 @@
+"""Verify that Database routes analytics reads to the replica and everything else to the primary.
+
+Needs two PostgreSQL instances: the primary from the PG* variables and a
+second one from PGREPLICA_DSN. They do not have to replicate: the script
+creates a throwaway database on each, migrates both, and seeds them with
+different data, so every result shows which instance served it. Exits
+non-zero if any method reads from the wrong side.
+
+    PGREPLICA_DSN=postgresql://postgres@localhost:5433/postgres python scripts/check_replica_routing.py
+"""
+import os
+import sys
+import time
+import asyncio
+import asyncpg
+from urllib.parse import urlsplit, urlunsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+
+GUILD = 7
+PRIMARY_BALANCE = 100
+REPLICA_BALANCE = 200
+
+# Rows only the replica has; the primary only gets the account via create_account
+REPLICA_SEED_SQL = f'''
+    SELECT ensure_transactions_partition(date_trunc('month', CURRENT_DATE)::date);
+    INSERT INTO accounts (guild_id, user_id, balance) VALUES ({GUILD}, 1, {REPLICA_BALANCE});
+    INSERT INTO transactions (guild_id, user_id, amount, type) VALUES ({GUILD}, 1, {REPLICA_BALANCE}, 'opening');
+    INSERT INTO trades (guild_id, sender_id, receiver_id, amount, status) VALUES ({GUILD}, 1, 1, 5, 'completed');
+    INSERT INTO active_games (guild_id, game_type, creator_id, bet_amount, status)
+    VALUES ({GUILD}, 'coinflip', 1, 10, 'finished');
+'''
+
+# (method, call, result -> 'replica' | 'primary')
+CHECKS = [
+    ('get_richest_users', lambda db: db.get_richest_users(GUILD, 1),
+     lambda rows: 'replica' if rows[0]['balance'] == REPLICA_BALANCE else 'primary'),
+    ('get_trading_stats', lambda db: db.get_trading_stats(GUILD),
+     lambda row: 'replica' if row['total_trades'] else 'primary'),
+    ('get_gambling_stats', lambda db: db.get_gambling_stats(GUILD),
+     lambda row: 'replica' if row['total_games'] else 'primary'),
+    ('get_transaction_volume', lambda db: db.get_transaction_volume(GUILD, 1),
+     lambda rows: 'replica' if rows and rows[0]['volume'] == REPLICA_BALANCE else 'primary'),
+    ('get_user_transaction_history', lambda db: db.get_user_transaction_history(GUILD, 1),
+     lambda rows: 'replica' if rows[0]['amount'] == REPLICA_BALANCE else 'primary'),
+    ('get_balance', lambda db: db.get_balance(GUILD, 1),
+     lambda balance: 'replica' if balance == REPLICA_BALANCE else 'primary'),
+    ('get_all_balances', lambda db: db.get_all_balances(GUILD),
+     lambda rows: 'replica' if rows[0]['balance'] == REPLICA_BALANCE else 'primary'),
+]
+
+def with_database(dsn, database):
+    parts = urlsplit(dsn)
+    return urlunsplit(parts._replace(path=f'/{database}'))
+
+async def run_checks(db, label, expect_replica):
+    failures = []
+    for method, call, source in CHECKS:
+        db.invalidate_balance()
+        served = source(await call(db))
+        expected = 'replica' if expect_replica and method in db.replica_methods else 'primary'
+        status = 'ok' if served == expected else 'FAIL'
+        print(f"{status:4} {label}: {method} read from the {served}")
+        if served != expected:
+            failures.append(f"{label}: {method}")
+    return failures
+
+async def main():
+    base_db = os.environ['PGDATABASE']
+    replica_dsn = os.environ['PGREPLICA_DSN']
+    check_db = f"{base_db}_replica_check"
+
+    primary_admin = await asyncpg.connect(
+        user=os.environ['PGUSER'], password=os.environ['PGPASSWORD'],
+        host=os.environ['PGHOST'], port=os.environ['PGPORT'], database=base_db
+    )
+    replica_admin = await asyncpg.connect(replica_dsn)
+    for admin in (primary_admin, replica_admin):
+        await admin.execute(f'DROP DATABASE IF EXISTS "{check_db}"')
+        await admin.execute(f'CREATE DATABASE "{check_db}"')
+
+    failures = []
+    try:
+        os.environ['PGDATABASE'] = check_db
+        os.environ['PGREPLICA_DSN'] = with_database(replica_dsn, check_db)
+
+        db = Database()
+        conn = await asyncpg.connect(os.environ['PGREPLICA_DSN'])
+        await db._migrate(conn)
+        await conn.execute(REPLICA_SEED_SQL)
+        await conn.close()
+        await db.initialize()
+        await db.create_account(GUILD, 1, PRIMARY_BALANCE)
+        if db.replica_pool is None:
+            raise SystemExit("Could not connect to the replica")
+
+        failures += await run_checks(db, 'replica up', expect_replica=True)
+        db._replica_failed_at = time.monotonic()  # as if the replica had just dropped a connection
+        failures += await run_checks(db, 'replica failing', expect_replica=False)
+        await db.close()
+
+        del os.environ['PGREPLICA_DSN']
+        db = Database()
+        await db.initialize()
+        failures += await run_checks(db, 'no replica', expect_replica=False)
+        await db.close()
+    finally:
+        os.environ['PGDATABASE'] = base_db
+        os.environ['PGREPLICA_DSN'] = replica_dsn
+        for admin in (primary_admin, replica_admin):
+            await admin.execute(f'DROP DATABASE IF EXISTS "{check_db}"')
+            await admin.close()
+
+    if failures:
+        print(f"{len(failures)} reads went to the wrong instance: {', '.join(failures)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,265 @@
+import abc
+import logging
+from utils.cache import LRUCache
+
+logger = logging.getLogger('diddy_bot')
+
+GLOBAL_ECONOMY = 0  # guild_id of the shared economy used in global mode and by pre-guild data
+
+class StorageBackend(abc.ABC):
+    """Interface every storage engine implements for the cogs and utils.
+
+    Each method is atomic: it either applies all of its writes or none of
+    them. Row-returning methods return mappings indexed by column name.
+    Accounts, trades, games and ledger rows belong to one economy, named by
+    its guild_id (GLOBAL_ECONOMY in global mode), and per-economy methods
+    take it as their first argument. Balance writes are published to
+    `balance_cache` and `balance_listeners` keyed by (guild_id, user_id),
+    tagged with the account's version, which every balance write increments.
+    """
+
+    pool = None  # connection pool, for engines that have one
+    replica_pool = None  # read-replica pool, for engines that route reads to one
+    supports_notify = False  # True if connect_listener() and notify() can link bot processes
+
+    def __init__(self, config=None):
+        db_config = (config or {}).get('database', {})
+        # Write-through cache of account balances, refreshed from every write
+        self.balance_cache = LRUCache(
+            db_config.get('balance_cache_size', 10000),
+            ttl=db_config.get('balance_cache_ttl')
+        )
+        # Callables notified with {(guild_id, user_id): (new_balance, version)} after every balance write
+        self.balance_listeners = []
+        # Callables notified with (guild_id, game) after every settled game claim
+        self.game_listeners = []
+
+    def _publish_balances(self, guild_id: int, balances: dict):
+        """Push new {user_id: (balance, version)} values returned by a write to
+        the cache and listeners. Concurrent writes can return out of commit
+        order; the cache keeps whichever has the higher account version."""
+        balances = {(guild_id, user_id): value for user_id, value in balances.items()}
+        for key, (balance, version) in balances.items():
+            self.balance_cache.set_if_newer(key, balance, version)
+        for listener in self.balance_listeners:
+            try:
+                listener(balances)
+            except Exception as e:
+                logger.error(f"Balance listener {listener!r} failed: {e}")
+
+    def _publish_game(self, guild_id: int, game):
+        """Tell game listeners about a settled claim"""
+        for listener in self.game_listeners:
+            try:
+                listener(guild_id, game)
+            except Exception as e:
+                logger.error(f"Game listener {listener!r} failed: {e}")
+
+    def invalidate_balance(self, guild_id: int = None, user_id: int = None):
+        """Drop cached balances, e.g. after editing accounts outside the bot"""
+        if guild_id is None or user_id is None:
+            self.balance_cache.invalidate()
+        else:
+            self.balance_cache.invalidate((guild_id, user_id))
+
+    @abc.abstractmethod
+    async def initialize(self):
+        """Prepare the engine (connect, migrate, recover) before first use"""
+
+    @abc.abstractmethod
+    async def close(self):
+        """Flush pending writes and release resources"""
+
+    # Accounts
+
+    @abc.abstractmethod
+    async def create_account(self, guild_id: int, user_id: int, initial_balance: int):
+        """Open an account with an 'opening' ledger row; raises if it already exists"""
+
+    @abc.abstractmethod
+    async def get_balance(self, guild_id: int, user_id: int):
+        """Return the balance, or None if the account does not exist"""
+
+    @abc.abstractmethod
+    async def update_balance(self, guild_id: int, user_id: int, amount: int):
+        """Apply a delta; returns the new balance, or None if the account is
+        missing or a debit exceeds its unreserved funds"""
+
+    @abc.abstractmethod
+    async def bulk_update_balance(self, guild_id: int, batch_key: str, user_ids, amount: int, type: str):
+        """Apply a delta to many accounts at once, skipping those already
+        recorded under batch_key; returns {user_id: new_balance} for those changed"""
+
+    @abc.abstractmethod
+    async def transfer(self, guild_id: int, from_id: int, to_id: int, amount: int, type: str):
+        """Move a positive amount; returns from_balance and to_balance, or None"""
+
+    # Trades
+
+    @abc.abstractmethod
+    async def create_trade(self, guild_id: int, sender_id: int, receiver_id: int, amount: int):
+        """Escrow the amount and open a trade; returns its id or None"""
+
+    @abc.abstractmethod
+    async def get_pending_trades(self, guild_id: int, user_id: int):
+        """Pending trades addressed to the user, newest first"""
+
+    @abc.abstractmethod
+    async def execute_trade(self, guild_id: int, trade_id: int):
+        """Settle a pending trade; returns sender_id, receiver_id, amount,
+        from_balance and to_balance, or None"""
+
+    @abc.abstractmethod
+    async def cancel_trade(self, guild_id: int, trade_id: int):
+        """Cancel a pending trade and release its escrow; returns True if cancelled"""
+
+    @abc.abstractmethod
+    async def expire_trades(self, max_age: float, limit: int):
+        """Expire up to `limit` stale pending trades in every economy; returns the number expired"""
+
+    # Games
+
+    @abc.abstractmethod
+    async def create_game(self, guild_id: int, game_type: str, creator_id: int, bet_amount: int):
+        """Escrow the bet and open a game; returns its id or None"""
+
+    @abc.abstractmethod
+    async def get_active_games(self, guild_id: int, game_type: str):
+        """Open games of a type, newest first"""
+
+    @abc.abstractmethod
+    async def claim_game(self, guild_id: int, game_id: int, joiner_id: int):
+        """Join and settle an open game; returns (outcome, game)"""
+
+    @abc.abstractmethod
+    async def expire_games(self, max_age: float, limit: int):
+        """Expire up to `limit` stale open games in every economy; returns the number expired"""
+
+    # Supply and analytics
+
+    @abc.abstractmethod
+    async def get_total_currency_supply(self, guild_id: int = None):
+        """Current value of an economy's supply counter, or of all of them"""
+
+    @abc.abstractmethod
+    async def reconcile_currency_supply(self, fix: bool = False):
+        """Compare each economy's supply counter with the sum of its balances;
+        returns counter, actual and drift totals and the number of economies drifted"""
+
+    @abc.abstractmethod
+    async def reconcile_ledger(self, lag: float = 300):
+        """Compare every balance with its ledger total, aggregating only rows
+        after the stored checkpoints; returns accounts, scanned, mismatched
+        and folded_id"""
+
+    @abc.abstractmethod
+    async def get_ledger_mismatches(self, min_age: float = 0, limit: int = 20):
+        """guild_id, user_id, drift, drift_since and total of accounts out of
+        line with the ledger for at least min_age seconds, largest drift first"""
+
+    @abc.abstractmethod
+    async def get_richest_users(self, guild_id: int, limit=10):
+        """user_id and balance of an economy's richest accounts"""
+
+    @abc.abstractmethod
+    async def get_all_balances(self, guild_id: int = None):
+        """guild_id, user_id, balance and version of every account in an economy, or in all of them"""
+
+    @abc.abstractmethod
+    async def get_transaction_volume(self, guild_id: int, days=7):
+        """date, num_transactions and volume per day, newest first"""
+
+    @abc.abstractmethod
+    async def get_trading_stats(self, guild_id: int):
+        """total_trades, completed_trades, cancelled_trades and avg_trade_amount"""
+
+    @abc.abstractmethod
+    async def get_gambling_stats(self, guild_id: int):
+        """total_games, avg_bet_amount and highest_bet over finished games"""
+
+    @abc.abstractmethod
+    async def get_user_transaction_history(self, guild_id: int, user_id: int, limit=10, before=None, after=None):
+        """id, type, amount and timestamp of up to `limit` ledger rows, newest
+        first, older than `before` or newer than `after` ((timestamp, id) cursors)"""
+
+    @abc.abstractmethod
+    def iter_user_transactions(self, guild_id: int, user_id: int, batch_size: int = 1000):
+        """Async iterator over every ledger row for a user, oldest first"""
+
+    # Ledger partitions
+
+    @abc.abstractmethod
+    async def ensure_ledger_partitions(self, months_ahead: int = 2):
+        """Create ledger partitions from the current month through months_ahead"""
+
+    @abc.abstractmethod
+    async def get_archivable_partitions(self, retain_months: int):
+        """Names of ledger partitions that ended more than retain_months ago, oldest first"""
+
+    @abc.abstractmethod
+    async def archive_ledger_partition(self, name: str, export_path: str = None):
+        """Fold a partition into ledger_snapshots, optionally export it, and
+        remove it from the ledger; returns the number of rows archived"""
+
+    # Names, cooldowns and the write-behind ledger
+
+    @abc.abstractmethod
+    async def get_user_names(self, user_ids, max_age: float):
+        """Persisted {user_id: name} entries refreshed within max_age seconds"""
+
+    @abc.abstractmethod
+    async def save_user_names(self, names: dict):
+        """Upsert {user_id: name} entries"""
+
+    @abc.abstractmethod
+    async def get_active_cooldowns(self):
+        """Unexpired cooldowns with expires_at as a unix timestamp"""
+
+    @abc.abstractmethod
+    async def save_cooldowns(self, entries):
+        """Upsert (user_id, command, expires_at) entries"""
+
+    @abc.abstractmethod
+    async def purge_expired_cooldowns(self):
+        """Delete expired cooldowns"""
+
+    @abc.abstractmethod
+    async def copy_ledger_rows(self, batches):
+        """Write [(batch_id, rows)] batches, skipping any already recorded;
+        returns the batch ids that were skipped"""
+
+    @abc.abstractmethod
+    async def purge_ledger_batches(self, max_age: float):
+        """Forget recorded batch ids older than max_age seconds"""
+
+    # Cross-process notifications, for engines with supports_notify
+
+    async def connect_listener(self):
+        """Open a dedicated connection, outside any pool, to LISTEN on"""
+        raise NotImplementedError(f"{type(self).__name__} cannot carry notifications between processes")
+
+    async def notify(self, channel: str, payloads):
+        """Send every payload as a NOTIFY on channel"""
+        raise NotImplementedError(f"{type(self).__name__} cannot carry notifications between processes")
+
+    # Bot state
+
+    @abc.abstractmethod
+    async def get_state(self, key: str):
+        """Return the stored string for key, or None"""
+
+    @abc.abstractmethod
+    async def set_state(self, key: str, value: str):
+        """Upsert a string value under key"""
+
+def create_database(config=None) -> StorageBackend:
+    """Build the storage engine selected by database.backend in config.yaml"""
+    backend = (config or {}).get('database', {}).get('backend', 'postgres')
+    if backend == 'postgres':
+        from database import Database
+        return Database(config)
+    if backend == 'memory':
+        from memory_database import MemoryDatabase
+        logger.warning("Using the in-memory storage backend; data is lost on restart")
+        return MemoryDatabase(config)
+    raise ValueError(f"Unknown database backend: {backend!r}")
@@ -0,0 +1,139 @@
+import time
+import asyncio
+import logging
+from utils.metrics import metrics
+
+logger = logging.getLogger('diddy_bot')
+
+class _Entry:
+    __slots__ = ('value', 'expires_at', 'loader', 'last_read')
+
+    def __init__(self, value, expires_at: float, loader, last_read: float):
+        self.value = value
+        self.expires_at = expires_at
+        self.loader = loader
+        self.last_read = last_read
+
+class AnalyticsCache:
+    """TTL cache for analytics results with single-flight loads and refresh-ahead.
+
+    Keys are tuples such as ('volume', guild_id, 7); the first element names
+    the result in metrics and the second is the guild it belongs to.
+    Concurrent misses for a key share one in-flight load instead of each
+    running the query. A background task reloads entries
+    that are within refresh_ahead seconds of expiring, so keys read at least
+    once every idle_timeout seconds are normally served straight from memory.
+    """
+
+    def __init__(self, config=None):
+        analytics_config = (config or {}).get('analytics', {})
+        self.ttl = analytics_config.get('cache_ttl', 60)
+        self.refresh_ahead = analytics_config.get('refresh_ahead', 10)
+        self.idle_timeout = analytics_config.get('idle_timeout', 600)
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._inflight = {}  # key -> task loading it
+        self._task = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, key: tuple, loader):
+        """Return the cached value for key, awaiting loader() on a miss"""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.last_read = now
+            if entry.expires_at > now:
+                self.hits += 1
+                metrics.incr('analytics_cache_requests_total', result='hit', key=key[0])
+                return entry.value
+        self.misses += 1
+        metrics.incr('analytics_cache_requests_total', result='miss', key=key[0])
+        return await self._load(key, loader)
+
+    def invalidate(self, key: tuple = None):
+        """Drop a single entry, or every entry when no key is given"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def invalidate_guild(self, guild_id: int, *names: str):
+        """Drop a guild's entries, only those named in names if any are given"""
+        for key in list(self._entries):
+            if key[1] == guild_id and (not names or key[0] in names):
+                del self._entries[key]
+
+    def on_game(self, guild_id: int, game):
+        """Game listener: a settled claim changes the guild's gambling stats and volume"""
+        self.invalidate_guild(guild_id, 'stats', 'volume')
+
+    async def _load(self, key, loader):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fill(key, loader), name=f'analytics-load-{key[0]}')
+            self._inflight[key] = task
+        # A waiter timing out must not cancel the load the others are sharing
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, loader):
+        start = time.perf_counter()
+        try:
+            value = await loader()
+        finally:
+            del self._inflight[key]
+            metrics.observe('analytics_load_seconds', time.perf_counter() - start, key=key[0])
+        now = time.monotonic()
+        previous = self._entries.get(key)
+        self._entries[key] = _Entry(value, now + self.ttl, loader, previous.last_read if previous else now)
+        return value
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='analytics-refresh')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(max(1.0, min(self.refresh_ahead, self.ttl) / 2))
+            try:
+                await self.refresh_due()
+            except Exception as e:
+                logger.error(f"Analytics cache refresh failed: {e}")
+
+    async def refresh_due(self):
+        """Reload entries close to expiry and drop ones nobody has read lately;
+        returns the number of entries reloaded"""
+        now = time.monotonic()
+        due = []
+        for key, entry in list(self._entries.items()):
+            if now - entry.last_read > self.idle_timeout:
+                del self._entries[key]
+            elif entry.expires_at - now <= self.refresh_ahead and key not in self._inflight:
+                due.append((key, entry.loader))
+        results = await asyncio.gather(*(self._load(key, loader) for key, loader in due), return_exceptions=True)
+        for (key, _), result in zip(due, results):
+            if isinstance(result, Exception):
+                metrics.incr('analytics_refresh_errors_total', key=key[0])
+                logger.warning(f"Refreshing analytics {key} failed: {result}")
+        return len(due)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'inflight': len(self._inflight),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,64 @@
+import os
+import time
+import asyncio
+import logging
+from utils.metrics import metrics
+
+logger = logging.getLogger('diddy_bot')
+
+class LedgerArchiver:
+    """Background task that keeps the partitioned ledger at a bounded size.
+
+    Each pass creates the monthly partitions for the coming months, then
+    compacts every partition older than retain_months into ledger_snapshots
+    and exports it to export_dir as gzipped CSV (or, with no export_dir,
+    just detaches it), oldest first.
+    """
+
+    def __init__(self, db, config):
+        archive_config = config.get('archive', {})
+        self.db = db
+        self.interval = archive_config.get('interval', 3600)
+        self.partitions_ahead = archive_config.get('partitions_ahead', 2)
+        self.retain_months = archive_config.get('retain_months', 12)
+        self.export_dir = archive_config.get('export_dir')
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='ledger-archiver')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                metrics.incr('ledger_archive_errors_total')
+                logger.error(f"Ledger archive pass failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        """Create upcoming partitions and archive old ones; returns {partition: rows archived}"""
+        await self.db.ensure_ledger_partitions(self.partitions_ahead)
+        archived = {}
+        for name in await self.db.get_archivable_partitions(self.retain_months):
+            export_path = None
+            if self.export_dir:
+                export_path = os.path.join(self.export_dir, f'{name}.csv.gz')
+            start = time.perf_counter()
+            num_rows = await self.db.archive_ledger_partition(name, export_path)
+            metrics.incr('ledger_archived_rows_total', num_rows)
+            metrics.observe('ledger_archive_seconds', time.perf_counter() - start)
+            logger.info(f"Archived ledger partition {name} ({num_rows} rows)"
+                        + (f" to {export_path}" if export_path else ", detached"))
+            archived[name] = num_rows
+        return archived
@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache:
+    """Bounded least-recently-used cache with an optional per-entry TTL.
+
+    Entries stored with set_if_newer() carry a version and only ever move
+    forward, which keeps results that complete out of order from
+    overwriting newer ones.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._tombstones = 0  # entries holding only a version
+
+    def __len__(self):
+        return len(self._data) - self._tombstones
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        """Return the cached value for key, or default if missing or expired"""
+        entry = self._data.get(key, _MISSING)
+        if entry is not _MISSING:
+            value, expires_at, version = entry
+            if value is not _MISSING and (expires_at is None or expires_at > time.monotonic()):
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            self._drop(key)
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key, value):
+        """Insert or refresh a value, evicting the least recently used entry if full"""
+        self._store(key, value, None)
+
+    def set_if_newer(self, key, value, version: int) -> bool:
+        """Store a value tagged with a per-key version that grows with every
+        write at the source; returns False, keeping the entry, if it already
+        holds a newer version. Invalidated and expired entries remember their
+        version, so a result that arrives late can't replace a newer one."""
+        entry = self._data.get(key)
+        if entry is not None and entry[2] is not None and entry[2] > version:
+            return False
+        self._store(key, value, version)
+        return True
+
+    def set_if_cached(self, key, value, version: int) -> bool:
+        """set_if_newer() for a value written by someone else. An uncached key
+        only gets a tombstone at the least recently used end, enough to refuse
+        the late result of a read already in flight without crowding out the
+        entries in use."""
+        if key in self._data:
+            return self.set_if_newer(key, value, version)
+        if len(self._data) >= self.maxsize:
+            _, (evicted, _, _) = self._data.popitem(last=False)
+            if evicted is _MISSING:
+                self._tombstones -= 1
+        self._data[key] = (_MISSING, None, version)
+        self._data.move_to_end(key, last=False)
+        self._tombstones += 1
+        return False
+
+    def _store(self, key, value, version):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        old = self._data.get(key)
+        if old is not None and old[0] is _MISSING:
+            self._tombstones -= 1
+        self._data[key] = (value, expires_at, version)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            _, (evicted, _, _) = self._data.popitem(last=False)
+            if evicted is _MISSING:
+                self._tombstones -= 1
+
+    def _drop(self, key):
+        """Remove an entry's value, leaving a tombstone if it carries a version"""
+        entry = self._data.get(key)
+        if entry is None or entry[0] is _MISSING:
+            return
+        if entry[2] is None:
+            del self._data[key]
+        else:
+            self._data[key] = (_MISSING, None, entry[2])
+            self._tombstones += 1
+
+    def invalidate(self, key=_MISSING):
+        """Drop a single entry, or every entry when no key is given"""
+        if key is not _MISSING:
+            self._drop(key)
+            return
+        for key in list(self._data):
+            self._drop(key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
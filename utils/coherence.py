@@ -0,0 +1,232 @@
+import json
+import uuid
+import asyncio
+import logging
+from utils.metrics import metrics
+
+logger = logging.getLogger('diddy_bot')
+
+MAX_PAYLOAD_BYTES = 7900  # Postgres rejects NOTIFY payloads of 8000 bytes or more
+
+class InvalidationBus:
+    """Keeps the caches of several bot processes coherent over Postgres LISTEN/NOTIFY.
+
+    Each process publishes the balance writes, settled game claims and
+    cooldown triggers it makes. Events are batched for flush_interval_ms and
+    sent as JSON NOTIFY payloads through the pool; a dedicated connection
+    outside the pool LISTENs for the other processes' events, which update
+    cached balances and the leaderboard (unless they already hold a newer
+    account version) and apply the cooldowns. NOTIFY is fire-and-forget, so events sent while the listener
+    is reconnecting are lost: after every reconnect the bus flushes the
+    balance cache, resyncs the leaderboard and reloads the cooldowns.
+    """
+
+    def __init__(self, db, leaderboard, cooldowns, config=None):
+        bus_config = (config or {}).get('coherence', {})
+        self.db = db
+        self.leaderboard = leaderboard
+        self.cooldowns = cooldowns
+        self.enabled = bus_config.get('enabled', True) and db.supports_notify
+        self.channel = bus_config.get('channel', 'diddy_invalidation')
+        self.flush_interval = bus_config.get('flush_interval_ms', 20) / 1000
+        self.reconnect_delay = bus_config.get('reconnect_delay', 5)
+        self.keepalive = bus_config.get('keepalive', 30)
+        self.max_outbox = bus_config.get('max_outbox', 10000)
+        self.origin = uuid.uuid4().hex  # skips this process's own events
+        # Callables notified with (guild_id, game) for games settled by other processes
+        self.game_listeners = []
+        self._outbox = []
+        self._wakeup = asyncio.Event()
+        self._conn = None
+        self._listen_task = None
+        self._flush_task = None
+        if self.enabled:
+            db.balance_listeners.append(self._on_balances)
+            db.game_listeners.append(self._on_game)
+            cooldowns.trigger_listeners.append(self._on_cooldown)
+
+    # Publishing
+
+    def _on_balances(self, balances: dict):
+        for (guild_id, user_id), (balance, version) in balances.items():
+            self._publish(['b', guild_id, user_id, balance, version])
+
+    def _on_game(self, guild_id: int, game):
+        self._publish(['g', guild_id, game['id'], game['creator_id'], game['joiner_id'],
+                       game['winner_id'], game['bet_amount']])
+
+    def _on_cooldown(self, user_id: int, command: str, expires_at: float):
+        self._publish(['c', user_id, command, expires_at])
+
+    def _publish(self, event):
+        if len(self._outbox) >= self.max_outbox:
+            metrics.incr('coherence_events_dropped_total')
+            return
+        self._outbox.append(event)
+        self._wakeup.set()
+
+    def _payloads(self, events):
+        """Pack events into JSON payloads that each fit in one NOTIFY"""
+        prefix = f'{{"o":"{self.origin}","e":['
+        payloads, chunk, size = [], [], len(prefix) + 2
+        for event in events:
+            encoded = json.dumps(event, separators=(',', ':'))
+            if chunk and size + len(encoded) + 1 > MAX_PAYLOAD_BYTES:
+                payloads.append(prefix + ','.join(chunk) + ']}')
+                chunk, size = [], len(prefix) + 2
+            chunk.append(encoded)
+            size += len(encoded) + 1
+        if chunk:
+            payloads.append(prefix + ','.join(chunk) + ']}')
+        return payloads
+
+    async def flush(self):
+        """Send buffered events; a failed batch is retried on the next flush"""
+        if not self._outbox:
+            return
+        batch, self._outbox = self._outbox, []
+        # Only the newest balance per account matters to the other processes
+        latest = {}
+        for event in batch:
+            key = tuple(event[:3]) if event[0] == 'b' else id(event)
+            latest.pop(key, None)
+            latest[key] = event
+        events = list(latest.values())
+        try:
+            await self.db.notify(self.channel, self._payloads(events))
+        except Exception:
+            self._outbox = (events + self._outbox)[-self.max_outbox:]
+            raise
+        metrics.incr('coherence_events_published_total', len(events))
+
+    async def _run_flush(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.flush_interval)  # let a burst of writes share payloads
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Invalidation bus publish failed: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+                self._wakeup.set()
+
+    # Receiving
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed invalidation payload: {payload[:100]!r}")
+            return
+        if message.get('o') == self.origin:
+            return
+        events = message.get('e', [])
+        for event in events:
+            try:
+                self._apply(event)
+            except Exception as e:
+                logger.error(f"Invalidation event {event!r} failed: {e}")
+        metrics.incr('coherence_events_received_total', len(events))
+
+    def _apply(self, event):
+        kind = event[0]
+        if kind == 'b':
+            _, guild_id, user_id, balance, version = event
+            # Versions keep events from replacing newer balances, whatever order they arrive in
+            self.db.balance_cache.set_if_cached((guild_id, user_id), balance, version)
+            self.leaderboard.update(guild_id, user_id, balance, version)
+        elif kind == 'c':
+            _, user_id, command, expires_at = event
+            self.cooldowns.apply(user_id, command, expires_at)
+        elif kind == 'g':
+            _, guild_id, game_id, creator_id, joiner_id, winner_id, bet_amount = event
+            game = {'id': game_id, 'creator_id': creator_id, 'joiner_id': joiner_id,
+                    'winner_id': winner_id, 'bet_amount': bet_amount}
+            for listener in self.game_listeners:
+                try:
+                    listener(guild_id, game)
+                except Exception as e:
+                    logger.error(f"Game listener {listener!r} failed: {e}")
+
+    async def _listen(self):
+        """Open the LISTEN connection; returns an Event set when it drops"""
+        conn = await self.db.connect_listener()
+        lost = asyncio.Event()
+        conn.add_termination_listener(lambda c: lost.set())
+        try:
+            await conn.add_listener(self.channel, self._on_notify)
+        except Exception:
+            await conn.close()
+            raise
+        self._conn = conn
+        return lost
+
+    async def _resync(self):
+        """Catch up on whatever was published while we were not listening"""
+        self.db.invalidate_balance()
+        await self.leaderboard.resync()
+        await self.cooldowns.load()
+        logger.info("Invalidation bus reconnected; caches resynced")
+
+    async def _run_listener(self, lost):
+        while True:
+            if lost is not None:
+                try:
+                    while not lost.is_set():
+                        try:
+                            await asyncio.wait_for(lost.wait(), self.keepalive)
+                        except asyncio.TimeoutError:
+                            # A half-open socket never reports termination; probe it
+                            await self._conn.fetchval('SELECT 1', timeout=self.keepalive)
+                except Exception as e:
+                    logger.warning(f"Invalidation bus listener lost: {e}")
+                await self._close_conn()
+                logger.warning("Invalidation bus disconnected, reconnecting")
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                lost = await self._listen()
+            except Exception as e:
+                lost = None
+                logger.error(f"Invalidation bus reconnect failed: {e}")
+                continue
+            metrics.incr('coherence_reconnects_total')
+            try:
+                await self._resync()
+            except Exception as e:
+                logger.error(f"Cache resync after reconnect failed: {e}")
+
+    async def _close_conn(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            try:
+                await conn.close(timeout=5)
+            except Exception:
+                conn.terminate()
+
+    async def start(self):
+        """Start listening before the caches load, so no event falls in between"""
+        if not self.enabled or self._listen_task is not None:
+            return
+        try:
+            lost = await self._listen()
+        except Exception as e:
+            lost = None
+            logger.error(f"Invalidation bus could not listen, retrying in the background: {e}")
+        self._listen_task = asyncio.create_task(self._run_listener(lost), name='invalidation-listener')
+        self._flush_task = asyncio.create_task(self._run_flush(), name='invalidation-flush')
+
+    async def stop(self):
+        for task in (self._flush_task, self._listen_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._flush_task = self._listen_task = None
+        await self._close_conn()
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final invalidation bus flush failed: {e}")
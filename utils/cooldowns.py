@@ -0,0 +1,157 @@
+import time
+import heapq
+import asyncio
+import logging
+import functools
+
+logger = logging.getLogger('diddy_bot')
+
+class CooldownStore:
+    """Per-user command cooldowns kept in memory and persisted to Postgres.
+
+    Active cooldowns are loaded once at startup, so checks never touch the
+    database. Expired entries are evicted through a heap ordered by expiry,
+    and new cooldowns are written to the cooldowns table in batches by a
+    background flush task.
+    """
+
+    def __init__(self, db, config=None):
+        cooldown_config = (config or {}).get('cooldowns', {})
+        self.db = db
+        self.flush_interval = cooldown_config.get('flush_interval', 5)
+        self._expires = {}  # (user_id, command) -> expiry as a unix timestamp
+        self._heap = []  # (expires_at, key), may hold superseded entries
+        self._dirty = {}  # entries written since the last flush
+        self._task = None
+        # Callables notified with (user_id, command, expires_at) after every trigger
+        self.trigger_listeners = []
+
+    def __len__(self):
+        self._evict()
+        return len(self._expires)
+
+    async def load(self):
+        """Populate the in-memory map with every cooldown still active in the database"""
+        # Keep the later expiry when a local trigger has not been flushed yet
+        for row in await self.db.get_active_cooldowns():
+            self.apply(row['user_id'], row['command'], row['expires_at'])
+
+    def remaining(self, user_id: int, command: str) -> float:
+        """Seconds until the user can run `command` again (0 if not on cooldown)"""
+        self._evict()
+        expires_at = self._expires.get((user_id, command))
+        return max(0.0, expires_at - time.time()) if expires_at else 0.0
+
+    def trigger(self, user_id: int, command: str, seconds: float):
+        """Put the user on cooldown for `command`; persisted on the next flush"""
+        key = (user_id, command)
+        expires_at = time.time() + seconds
+        self._set(key, expires_at)
+        self._dirty[key] = expires_at
+        for listener in self.trigger_listeners:
+            try:
+                listener(user_id, command, expires_at)
+            except Exception as e:
+                logger.error(f"Cooldown listener {listener!r} failed: {e}")
+
+    def reserve(self, user_id: int, command: str, seconds: float) -> float:
+        """Hold the cooldown in this process while a command runs; returns the
+        expiry to pass to release(). Not persisted or published until trigger()."""
+        expires_at = time.time() + seconds
+        self._set((user_id, command), expires_at)
+        return expires_at
+
+    def release(self, user_id: int, command: str, expires_at: float):
+        """Drop a reservation, unless a trigger replaced it since"""
+        key = (user_id, command)
+        if self._expires.get(key) == expires_at:
+            del self._expires[key]
+
+    def apply(self, user_id: int, command: str, expires_at: float):
+        """Record a cooldown another bot process triggered (and persists) unless ours ends later"""
+        key = (user_id, command)
+        if expires_at > self._expires.get(key, 0):
+            self._set(key, expires_at)
+
+    def _set(self, key, expires_at: float):
+        self._expires[key] = expires_at
+        heapq.heappush(self._heap, (expires_at, key))
+
+    def _evict(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._heap)
+            # Skip heap entries superseded by a later trigger for the same key
+            if self._expires.get(key) == expires_at:
+                del self._expires[key]
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='cooldown-flush')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                await self.db.purge_expired_cooldowns()
+            except Exception as e:
+                logger.error(f"Cooldown flush failed: {e}")
+
+    async def flush(self):
+        """Write pending cooldowns in one batch; failed batches are retried next flush"""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            await self.db.save_cooldowns([(user_id, command, expires_at)
+                                          for (user_id, command), expires_at in batch.items()])
+        except Exception:
+            # Newer triggers made while we were writing take precedence
+            self._dirty = {**batch, **self._dirty}
+            raise
+
+def cooldown(command: str, seconds: float,
+             message: str = "You must wait {minutes}m {seconds}s before using /{command} again!"):
+    """Decorator for app command callbacks that enforces a per-user cooldown.
+
+    The cooldown is reserved before the callback runs, so concurrent
+    invocations can't all pass the check, and restarts once it finishes. A
+    callback can return False to signal that nothing happened (e.g. invalid
+    input); that, or an exception, releases the reservation.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, interaction, *args, **kwargs):
+            store = interaction.client.cooldowns
+            remaining = store.remaining(interaction.user.id, command)
+            if remaining > 0:
+                minutes, secs = divmod(int(remaining), 60)
+                await interaction.response.send_message(
+                    message.format(minutes=minutes, seconds=secs, command=command)
+                )
+                return
+            # No await between the check and the reservation
+            reservation = store.reserve(interaction.user.id, command, seconds)
+            try:
+                result = await func(self, interaction, *args, **kwargs)
+            except BaseException:
+                store.release(interaction.user.id, command, reservation)
+                raise
+            if result is False:
+                store.release(interaction.user.id, command, reservation)
+            else:
+                store.trigger(interaction.user.id, command, seconds)
+            return result
+        return wrapper
+    return decorator
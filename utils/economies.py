@@ -0,0 +1,18 @@
+from discord import app_commands
+from storage import GLOBAL_ECONOMY
+
+def guild_mode(config) -> bool:
+    """True when every guild has its own economy (economy.mode: guild)"""
+    return (config or {}).get('economy', {}).get('mode', 'global') == 'guild'
+
+def economy_id(config, interaction) -> int:
+    """guild_id of the economy an interaction's command runs in.
+
+    In global mode every command shares GLOBAL_ECONOMY. In guild mode it is
+    the interaction's guild, and commands used in DMs raise NoPrivateMessage.
+    """
+    if not guild_mode(config):
+        return GLOBAL_ECONOMY
+    if interaction.guild_id is None:
+        raise app_commands.NoPrivateMessage()
+    return interaction.guild_id
@@ -0,0 +1,65 @@
+import time
+import asyncio
+import logging
+from utils.metrics import metrics
+
+logger = logging.getLogger('diddy_bot')
+
+class ExpiryScheduler:
+    """Background task that expires stale games and trades and releases their escrow.
+
+    Each sweep runs bounded batches until a batch comes back short, so one
+    large backlog never holds locks on more than batch_size rows at a time.
+    """
+
+    def __init__(self, db, config):
+        expiry_config = config.get('expiry', {})
+        self.db = db
+        self.game_timeout = config['gambling']['timeout']
+        self.trade_timeout = config['trading']['timeout']
+        self.interval = expiry_config.get('interval', 60)
+        self.batch_size = expiry_config.get('batch_size', 500)
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='expiry-scheduler')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                metrics.incr('expiry_sweep_errors_total')
+                logger.error(f"Expiry sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self):
+        """Run one sweep over games and trades; returns {kind: rows expired}"""
+        expired = {}
+        for kind, expire, timeout in (
+            ('games', self.db.expire_games, self.game_timeout),
+            ('trades', self.db.expire_trades, self.trade_timeout),
+        ):
+            start = time.perf_counter()
+            total = 0
+            while True:
+                count = await expire(timeout, self.batch_size)
+                total += count
+                if count < self.batch_size:
+                    break
+            metrics.incr('expiry_expired_total', total, kind=kind)
+            metrics.observe('expiry_sweep_seconds', time.perf_counter() - start, kind=kind)
+            if total:
+                logger.info(f"Expired {total} stale {kind}")
+            expired[kind] = total
+        return expired
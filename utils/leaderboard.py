@@ -0,0 +1,100 @@
+import bisect
+import logging
+
+logger = logging.getLogger('diddy_bot')
+
+class Leaderboard:
+    """In-memory balance ranking kept in sync with every balance write.
+
+    Each economy (guild_id) has its own list sorted by (-balance, user_id),
+    so the top N is a slice and a user's rank is a binary search. The board
+    subscribes to the database's balance updates and is periodically
+    resynced to fix drift. Updates carry the account version, and one older
+    than the version already applied (a write result that arrived late) is
+    ignored.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.loaded = False
+        self._keys = {}  # guild_id -> sorted (-balance, user_id)
+        self._balances = {}  # (guild_id, user_id) -> balance
+        self._versions = {}  # (guild_id, user_id) -> account version of that balance
+        self._pending = None  # updates seen while a resync query is in flight
+        db.balance_listeners.append(self.update_many)
+
+    def __len__(self):
+        return len(self._balances)
+
+    def count(self, guild_id: int) -> int:
+        """Number of ranked accounts in an economy"""
+        return len(self._keys.get(guild_id, ()))
+
+    def update(self, guild_id: int, user_id: int, balance: int, version: int):
+        if self._pending is not None:
+            self._pending.append((guild_id, user_id, balance, version))
+        key = (guild_id, user_id)
+        if self._versions.get(key, -1) > version:
+            return
+        self._versions[key] = version
+        old = self._balances.get(key)
+        if old == balance:
+            return
+        keys = self._keys.setdefault(guild_id, [])
+        if old is not None:
+            del keys[bisect.bisect_left(keys, (-old, user_id))]
+        bisect.insort(keys, (-balance, user_id))
+        self._balances[key] = balance
+
+    def update_many(self, balances: dict):
+        """Apply {(guild_id, user_id): (balance, version)} updates"""
+        for (guild_id, user_id), (balance, version) in balances.items():
+            self.update(guild_id, user_id, balance, version)
+
+    def rank(self, guild_id: int, user_id: int):
+        """Return (rank, balance) for a user, or None if they have no account"""
+        balance = self._balances.get((guild_id, user_id))
+        if balance is None:
+            return None
+        return bisect.bisect_left(self._keys[guild_id], (-balance, user_id)) + 1, balance
+
+    async def top(self, guild_id: int, limit: int):
+        """Return an economy's richest accounts as dicts with user_id and balance"""
+        if not self.loaded:
+            return await self.db.get_richest_users(guild_id, limit)
+        return [{'user_id': user_id, 'balance': -neg_balance}
+                for neg_balance, user_id in self._keys.get(guild_id, [])[:limit]]
+
+    async def resync(self):
+        """Reload every balance from the database, keeping writes made meanwhile"""
+        self._pending = []
+        try:
+            rows = await self.db.get_all_balances()
+        except Exception:
+            self._pending = None
+            raise
+        pending, self._pending = self._pending, None
+
+        balances, versions, drift = {}, {}, 0
+        for row in rows:
+            key = (row['guild_id'], row['user_id'])
+            if self._versions.get(key, -1) > row['version']:
+                # Published after the snapshot was taken; keep the newer balance
+                balances[key], versions[key] = self._balances[key], self._versions[key]
+                continue
+            if self._balances.get(key) != row['balance']:
+                drift += 1
+            balances[key], versions[key] = row['balance'], row['version']
+        keys = {}
+        for guild_id, user_id in balances:
+            keys.setdefault(guild_id, []).append((-balances[(guild_id, user_id)], user_id))
+        for guild_keys in keys.values():
+            guild_keys.sort()
+        self._balances, self._versions, self._keys = balances, versions, keys
+        # Replay writes published while the snapshot loaded; those it already includes are skipped by version
+        for guild_id, user_id, balance, version in pending:
+            self.update(guild_id, user_id, balance, version)
+
+        if self.loaded and drift:
+            logger.warning(f"Leaderboard resync corrected {drift} drifted balances")
+        self.loaded = True
@@ -0,0 +1,175 @@
+import os
+import glob
+import json
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from utils.metrics import metrics
+from storage import GLOBAL_ECONOMY
+
+logger = logging.getLogger('diddy_bot')
+
+LEDGER_COLUMNS = ['guild_id', 'user_id', 'amount', 'type', 'timestamp']
+
+class LedgerWriter:
+    """Optional write-behind buffer for ledger rows.
+
+    In 'sync' mode (the default) ledger rows are inserted by the same
+    statement that changes the balance and this class does nothing. In
+    'write_behind' mode balance writes skip the insert and hand their rows
+    here; they are flushed with COPY every flush_interval_ms or flush_rows
+    rows, whichever comes first.
+
+    Durability is configurable:
+      - 'memory': rows only live in the buffer and are lost if the process dies.
+      - 'journal': rows are appended to a local journal before the write
+        returns, so a crashed process replays them on the next start.
+      - 'fsync': like 'journal', but fsyncs every append to survive an OS crash.
+
+    Every flushed batch is recorded in ledger_batches in the same transaction
+    as its COPY, so replaying a journal after a crash never double-inserts.
+    """
+
+    def __init__(self, db, config=None):
+        ledger_config = (config or {}).get('ledger', {})
+        self.db = db
+        self.write_behind = ledger_config.get('mode', 'sync') == 'write_behind'
+        self.flush_interval = ledger_config.get('flush_interval_ms', 200) / 1000
+        self.flush_rows = ledger_config.get('flush_rows', 1000)
+        self.max_buffer = ledger_config.get('max_buffer', 50000)
+        self.durability = ledger_config.get('durability', 'journal')
+        self.journal_dir = ledger_config.get('journal_dir', 'ledger_journal')
+        self.batch_retention = ledger_config.get('batch_retention', 7 * 24 * 3600)
+        self._buffer = []
+        self._journal = None
+        self._journal_path = None
+        self._batches = []  # (batch_id, journal path or None, row count) covering the buffer
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def journaled(self) -> bool:
+        return self.durability in ('journal', 'fsync')
+
+    async def append(self, rows):
+        """Queue (guild_id, user_id, amount, type, timestamp) rows for the next flush"""
+        if self.journaled:
+            self._write_journal(rows)
+        self._buffer.extend(rows)
+        metrics.incr('ledger_rows_queued_total', len(rows))
+        if len(self._buffer) >= self.flush_rows:
+            self._wakeup.set()
+        if len(self._buffer) >= self.max_buffer:
+            # Backpressure: the database is falling behind, so wait for it
+            await self.flush()
+
+    def _write_journal(self, rows):
+        if self._journal is None:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            self._journal_path = os.path.join(self.journal_dir, f'{uuid.uuid4().hex}.jsonl')
+            self._journal = open(self._journal_path, 'a')
+        for guild_id, user_id, amount, type, timestamp in rows:
+            self._journal.write(json.dumps([guild_id, user_id, amount, type, timestamp.isoformat()]) + '\n')
+        self._journal.flush()
+        if self.durability == 'fsync':
+            os.fsync(self._journal.fileno())
+
+    def _seal_batch(self):
+        """Close the active journal so the batches cover exactly the buffered rows"""
+        count = len(self._buffer) - sum(count for _, _, count in self._batches)
+        if self._journal is not None:
+            self._journal.close()
+            batch_id = os.path.basename(self._journal_path)[:-len('.jsonl')]
+            self._batches.append((batch_id, self._journal_path, count))
+            self._journal = None
+            self._journal_path = None
+        elif count:
+            self._batches.append((uuid.uuid4().hex, None, count))
+
+    async def flush(self):
+        """Write every buffered row with a single COPY, skipping batches
+        already recorded by an earlier attempt that committed but failed"""
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            self._seal_batch()
+            rows, batches = self._buffer, self._batches
+            self._buffer, self._batches = [], []
+            start = time.perf_counter()
+            chunks, offset = [], 0
+            for batch_id, _, count in batches:
+                chunks.append((batch_id, rows[offset:offset + count]))
+                offset += count
+            try:
+                skipped = set(await self.db.copy_ledger_rows(chunks))
+            except Exception:
+                # Keep the rows and their journals for the next attempt
+                self._buffer[:0] = rows
+                self._batches[:0] = batches
+                metrics.incr('ledger_flush_errors_total')
+                raise
+            if skipped:
+                metrics.incr('ledger_batches_skipped_total', len(skipped))
+                logger.warning(f"Ledger batches {sorted(skipped)} were already recorded; skipped them")
+            flushed = sum(len(chunk) for batch_id, chunk in chunks if batch_id not in skipped)
+            metrics.incr('ledger_rows_flushed_total', flushed)
+            metrics.observe('ledger_flush_seconds', time.perf_counter() - start)
+            # Every batch is now either written or confirmed recorded
+            for _, path, _ in batches:
+                if path is not None:
+                    os.remove(path)
+
+    async def recover(self):
+        """Replay journals left behind by a crashed process"""
+        await self.db.purge_ledger_batches(self.batch_retention)
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, '*.jsonl'))):
+            batch_id = os.path.basename(path)[:-len('.jsonl')]
+            rows = []
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        fields = json.loads(line)
+                    except ValueError:
+                        break  # torn final write from the crash
+                    if len(fields) == 4:
+                        fields.insert(0, GLOBAL_ECONOMY)  # journaled before rows carried a guild
+                    guild_id, user_id, amount, type, timestamp = fields
+                    rows.append((guild_id, user_id, amount, type, datetime.fromisoformat(timestamp)))
+            if rows:
+                skipped = await self.db.copy_ledger_rows([(batch_id, rows)])
+                if skipped:
+                    metrics.incr('ledger_batches_skipped_total')
+                logger.warning(
+                    f"Recovered ledger journal {batch_id}: "
+                    f"{0 if skipped else len(rows)} rows replayed"
+                )
+            os.remove(path)
+
+    def start(self):
+        if self.write_behind and self._task is None:
+            self._task = asyncio.create_task(self._run(), name='ledger-flush')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ledger flush failed, will retry: {e}")
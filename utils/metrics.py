@@ -0,0 +1,206 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger('diddy_bot')
+
+class Histogram:
+    """HDR-style histogram with log-linear buckets.
+
+    Values are counted in buckets whose width grows geometrically, so any
+    percentile is reported within `precision` relative error using fixed
+    memory, no matter how many values are recorded.
+    """
+
+    def __init__(self, precision: float = 0.01, lowest: float = 1e-6):
+        self.lowest = lowest
+        self._log_base = math.log1p(2 * precision)
+        self._buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, value: float):
+        index = 0 if value <= self.lowest else int(math.log(value / self.lowest) / self._log_base) + 1
+        self._buckets[index] += 1
+        self.count += 1
+        self.total += value
+        self.last = value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Value at or below which p percent of observations fall"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                if index == 0:
+                    return self.lowest
+                # Midpoint of the bucket, capped by the largest value seen
+                upper = self.lowest * math.exp(index * self._log_base)
+                lower = self.lowest * math.exp((index - 1) * self._log_base)
+                return min((lower + upper) / 2, self.max)
+        return self.max
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+class MetricsRegistry:
+    """Process-wide counters, histograms and gauges keyed by name and labels"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.counters = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+        self._gauges = {}  # name -> callable returning {label_key: value}
+
+    def incr(self, name: str, value: int = 1, **labels):
+        self.counters[(name, _label_key(labels))] += value
+
+    def observe(self, name: str, value: float, **labels):
+        self.histograms[(name, _label_key(labels))].observe(value)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self.histograms[(name, _label_key(labels))]
+
+    def counter(self, name: str, **labels) -> int:
+        return self.counters.get((name, _label_key(labels)), 0)
+
+    def register_gauge(self, name: str, read):
+        """Register a callable sampled at export time; returns a number or a {labels: value} dict"""
+        self._gauges[name] = read
+
+    def gauges(self) -> dict:
+        values = {}
+        for name, read in self._gauges.items():
+            try:
+                value = read()
+            except Exception as e:
+                logger.error(f"Gauge {name} failed: {e}")
+                continue
+            if isinstance(value, dict):
+                for labels, sample in value.items():
+                    values[(name, labels)] = sample
+            else:
+                values[(name, ())] = value
+        return values
+
+    def render_prometheus(self, prefix: str = 'diddy_') -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+
+        def fmt_labels(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ''
+            escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+            return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+        def grouped(items):
+            by_name = defaultdict(list)
+            for (name, labels), value in items:
+                by_name[name].append((labels, value))
+            return sorted(by_name.items())
+
+        for name, samples in grouped(self.counters.items()):
+            lines.append(f'# TYPE {prefix}{name} counter')
+            lines.extend(f'{prefix}{name}{fmt_labels(labels)} {value}' for labels, value in samples)
+
+        for name, samples in grouped(self.gauges().items()):
+            lines.append(f'# TYPE {prefix}{name} gauge')
+            lines.extend(f'{prefix}{name}{fmt_labels(labels)} {value}' for labels, value in samples)
+
+        for name, samples in grouped(self.histograms.items()):
+            lines.append(f'# TYPE {prefix}{name} summary')
+            for labels, hist in samples:
+                for quantile in (0.5, 0.95, 0.99):
+                    lines.append(
+                        f'{prefix}{name}{fmt_labels(labels, [("quantile", quantile)])} '
+                        f'{hist.percentile(quantile * 100):.6g}'
+                    )
+                lines.append(f'{prefix}{name}_sum{fmt_labels(labels)} {hist.total:.6g}')
+                lines.append(f'{prefix}{name}_count{fmt_labels(labels)} {hist.count}')
+
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+class PrometheusExporter:
+    """Expose the registry over a local HTTP endpoint and/or a textfile.
+
+    The textfile is rewritten atomically every `interval` seconds, in the
+    format expected by node_exporter's textfile collector.
+    """
+
+    def __init__(self, config=None):
+        metrics_config = (config or {}).get('metrics', {})
+        self.host = metrics_config.get('prometheus_host', '127.0.0.1')
+        self.port = metrics_config.get('prometheus_port')
+        self.path = metrics_config.get('prometheus_file')
+        self.interval = metrics_config.get('export_interval', 15)
+        self._server = None
+        self._task = None
+
+    async def start(self):
+        if self.port:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            logger.info(f"Serving Prometheus metrics on http://{self.host}:{self.port}/metrics")
+        if self.path and self._task is None:
+            self._task = asyncio.create_task(self._write_loop(), name='metrics-textfile')
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] in ('/', '/metrics'):
+                status, body = '200 OK', metrics.render_prometheus().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\n'
+                f'Content-Type: text/plain; version=0.0.4\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+    async def _write_loop(self):
+        while True:
+            try:
+                tmp_path = f'{self.path}.tmp'
+                with open(tmp_path, 'w') as f:
+                    f.write(metrics.render_prometheus())
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.error(f"Failed to write metrics file {self.path}: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,78 @@
+import time
+import asyncio
+import logging
+import discord
+from utils.cache import LRUCache
+from utils.metrics import metrics
+
+logger = logging.getLogger('diddy_bot')
+
+class NameResolver:
+    """Resolve Discord user ids to names with as few REST calls as possible.
+
+    Lookups go through the gateway user cache, then an in-memory LRU, then the
+    persisted user_names table, and only the remaining misses are fetched from
+    the API, concurrently and capped by a semaphore.
+    """
+
+    def __init__(self, bot, config=None):
+        names_config = (config or {}).get('names', {})
+        self.bot = bot
+        self.cache = LRUCache(
+            names_config.get('cache_size', 5000),
+            ttl=names_config.get('cache_ttl', 3600)
+        )
+        self.persist_ttl = names_config.get('persist_ttl', 7 * 24 * 3600)
+        self.semaphore = asyncio.Semaphore(names_config.get('max_concurrency', 20))
+
+    async def resolve(self, user_id: int) -> str:
+        return (await self.resolve_many([user_id]))[user_id]
+
+    async def resolve_many(self, user_ids) -> dict:
+        """Return a {user_id: name} mapping for every id in user_ids"""
+        names = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            user = self.bot.get_user(user_id)
+            if user is not None:
+                names[user_id] = user.name
+                self.cache.set(user_id, user.name)
+                continue
+            name = self.cache.get(user_id)
+            if name is not None:
+                names[user_id] = name
+            else:
+                missing.append(user_id)
+
+        if missing:
+            stored = await self.bot.db.get_user_names(missing, self.persist_ttl)
+            for user_id, name in stored.items():
+                names[user_id] = name
+                self.cache.set(user_id, name)
+            missing = [user_id for user_id in missing if user_id not in stored]
+
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            found = {}
+            for user_id, name in zip(missing, fetched):
+                if name is None:
+                    names[user_id] = f"Unknown ({user_id})"
+                    continue
+                names[user_id] = found[user_id] = name
+                self.cache.set(user_id, name)
+            if found:
+                await self.bot.db.save_user_names(found)
+
+        return names
+
+    async def _fetch(self, user_id: int):
+        async with self.semaphore:
+            start = time.perf_counter()
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.HTTPException as e:
+                logger.warning(f"Failed to fetch user {user_id}: {e}")
+                return None
+            finally:
+                metrics.observe('discord_api_seconds', time.perf_counter() - start, call='fetch_user')
+        return user.name
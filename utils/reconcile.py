@@ -0,0 +1,68 @@
+import time
+import asyncio
+import logging
+from utils.metrics import metrics
+
+logger = logging.getLogger('diddy_bot')
+
+class LedgerReconciler:
+    """Background task that checks every balance against the ledger.
+
+    Runs are incremental (see reconcile_ledger), so they cost one pass over
+    accounts plus the ledger rows written since the previous run. An account
+    only counts as mismatched once its drift has outlived confirm_after
+    seconds, which filters out write-behind rows still on their way to the
+    database.
+    """
+
+    def __init__(self, db, config):
+        reconcile_config = config.get('reconcile', {})
+        self.db = db
+        self.interval = reconcile_config.get('interval', 600)
+        self.lag = reconcile_config.get('lag', 300)
+        self.confirm_after = reconcile_config.get('confirm_after', 900)
+        self.last_result = None
+        self.last_run_at = None
+        self._task = None
+        metrics.register_gauge(
+            'ledger_mismatched_accounts', lambda: self.last_result['mismatched'] if self.last_result else 0
+        )
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='ledger-reconciler')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                metrics.incr('ledger_reconcile_errors_total')
+                logger.error(f"Ledger reconciliation failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        """Run one reconciliation; returns its result plus the confirmed mismatches"""
+        start = time.perf_counter()
+        result = dict(await self.db.reconcile_ledger(self.lag))
+        metrics.observe('ledger_reconcile_seconds', time.perf_counter() - start)
+        metrics.incr('ledger_reconcile_rows_total', result['scanned'])
+        self.last_result, self.last_run_at = result, time.time()
+
+        confirmed = await self.db.get_ledger_mismatches(self.confirm_after)
+        if confirmed:
+            logger.error(
+                f"{confirmed[0]['total']} accounts disagree with the ledger, e.g. "
+                + ", ".join(f"{row['user_id']} ({row['drift']:+})" for row in confirmed[:5])
+            )
+        result['confirmed'] = confirmed
+        return result
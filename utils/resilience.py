@@ -0,0 +1,91 @@
+import time
+import random
+import asyncio
+import asyncpg
+
+# SQLSTATE classes worth retrying: connection exceptions, transaction rollbacks
+# (serialization failures, deadlocks), insufficient resources (too many
+# connections) and operator intervention (admin shutdown, cannot connect now)
+TRANSIENT_SQLSTATE_PREFIXES = ('08', '40', '53', '57P')
+
+class DatabaseUnavailableError(Exception):
+    """Raised without touching the database while the circuit breaker is open"""
+
+def is_connection_error(error: BaseException) -> bool:
+    """True if the error means the connection (or the whole pool) is unusable"""
+    return isinstance(error, (
+        asyncpg.InterfaceError,
+        asyncpg.PostgresConnectionError,
+        ConnectionError,
+        OSError,
+    ))
+
+def is_transient(error: BaseException) -> bool:
+    """True if retrying the same operation might succeed.
+
+    Constraint violations, bad SQL and other deterministic errors are not
+    transient and should surface immediately.
+    """
+    if is_connection_error(error) or isinstance(error, asyncio.TimeoutError):
+        return True
+    sqlstate = getattr(error, 'sqlstate', None) or ''
+    return sqlstate.startswith(TRANSIENT_SQLSTATE_PREFIXES)
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by attempts and a deadline"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.05,
+                 max_delay: float = 1.0, deadline: float = 2.5):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline  # seconds; keep under Discord's 3s interaction budget
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (0-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+class CircuitBreaker:
+    """Fail fast while the database is down.
+
+    After `failure_threshold` consecutive transient failures the breaker
+    opens and rejects calls for `reset_timeout` seconds. It then lets one
+    probe through (half-open): success closes it, failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_started_at = None  # set while the half-open probe is running
+
+    def before_call(self):
+        """Raise DatabaseUnavailableError if the call should not be attempted"""
+        if self.state == self.CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        # A probe that never reported back (e.g. cancelled) is replaced after reset_timeout
+        if self.state == self.HALF_OPEN and (self._probe_started_at is None
+                                             or now - self._probe_started_at >= self.reset_timeout):
+            self._probe_started_at = now
+            return
+        retry_in = max(0.0, self.reset_timeout - (now - self.opened_at))
+        raise DatabaseUnavailableError(f"Database circuit open, retrying in {retry_in:.1f}s")
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_started_at = None
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
@@ -0,0 +1,64 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from utils.metrics import metrics
+
+logger = logging.getLogger('diddy_bot')
+
+def command_tree_hash(tree) -> str:
+    """SHA-256 of the global application commands as they would be synced.
+
+    Commands are serialized with the same payload tree.sync() uploads, sorted
+    by name, so the hash only changes when something Discord sees changes.
+    """
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda c: c['name'])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+class StartupTimer:
+    """Record how long each startup phase takes, including phases that overlap"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}  # name -> seconds, in completion order
+
+    async def timed(self, name: str, awaitable):
+        """Await `awaitable` as the phase `name` and return its result"""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = elapsed
+            metrics.observe('startup_phase_seconds', elapsed, phase=name)
+
+    def summary(self) -> str:
+        total = time.perf_counter() - self.started
+        breakdown = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        return f"{total:.2f}s ({breakdown})"
+
+def shard_options(config, environ=None) -> dict:
+    """shard_count and shard_ids keyword arguments for AutoShardedBot.
+
+    SHARD_COUNT and SHARD_IDS (comma-separated, e.g. "0,1") override the
+    sharding section of config.yaml. Empty values let discord.py pick the
+    shard count and run every shard in this process.
+    """
+    sharding = (config or {}).get('sharding') or {}
+    environ = os.environ if environ is None else environ
+    shard_count = environ.get('SHARD_COUNT') or sharding.get('shard_count')
+    shard_ids = environ.get('SHARD_IDS') or sharding.get('shard_ids')
+    if isinstance(shard_ids, str):
+        shard_ids = [int(shard_id) for shard_id in shard_ids.split(',') if shard_id.strip()]
+    options = {}
+    if shard_count is not None:
+        options['shard_count'] = int(shard_count)
+    if shard_ids:
+        if shard_count is None:
+            raise ValueError("sharding.shard_ids needs sharding.shard_count")
+        invalid = [shard_id for shard_id in shard_ids if not 0 <= shard_id < int(shard_count)]
+        if invalid:
+            raise ValueError(f"Shard ids {invalid} are outside shard_count {shard_count}")
+        options['shard_ids'] = sorted(set(int(shard_id) for shard_id in shard_ids))
+    return options